@@ -7,6 +7,7 @@ from pydantic import BaseModel, Field
 import structlog
 
 from app.services.ai_service import ai_service
+from app.services.semantic_cache import semantic_cache
 
 logger = structlog.get_logger()
 router = APIRouter()
@@ -161,4 +162,30 @@ async def get_ai_config():
                 "error": "CONFIG_QUERY_FAILED",
                 "message": "获取AI配置失败"
             }
-        ) 
\ No newline at end of file
+        ) 
+
+
+@router.get("/cache/stats")
+async def get_ai_cache_stats():
+    """
+    获取AI缓存统计
+    
+    返回提示词精确缓存和语义缓存的命中次数与命中率（所有worker汇总）。
+    """
+    try:
+        stats = await semantic_cache.get_stats()
+        
+        return {
+            "success": True,
+            "stats": stats
+        }
+        
+    except Exception as e:
+        logger.error("获取AI缓存统计失败", error=str(e))
+        raise HTTPException(
+            status_code=500,
+            detail={
+                "error": "CACHE_STATS_QUERY_FAILED",
+                "message": "获取AI缓存统计失败"
+            }
+        )
@@ -3,11 +3,13 @@
 """
 from datetime import datetime
 from typing import Optional, Dict, Any, List
-from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks, Query
+from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks, Query, Header
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 import structlog
 
 from app.services.itinerary_service import itinerary_service
+from app.services.generation_stream import GenerationStream, format_sse
 from app.core.config import settings
 
 logger = structlog.get_logger()
@@ -60,6 +62,45 @@ class ProgressResponse(BaseModel):
     current_step: Optional[str] = None
 
 
+async def _validate_generation_request(request: ItineraryGenerationRequest, user_id: int):
+    """校验生成请求，不合法时抛出HTTP 400"""
+    validation_result = await itinerary_service.validate_generation_request(
+        destination=request.destination,
+        days=request.days,
+        user_id=user_id
+    )
+    
+    if not validation_result["valid"]:
+        raise HTTPException(
+            status_code=400,
+            detail={
+                "error": "VALIDATION_FAILED",
+                "message": "请求参数验证失败",
+                "errors": validation_result["errors"]
+            }
+        )
+    
+    # 检查预算范围
+    if request.budget_min and request.budget_max and request.budget_min > request.budget_max:
+        raise HTTPException(
+            status_code=400,
+            detail={
+                "error": "INVALID_BUDGET_RANGE",
+                "message": "预算下限不能大于上限"
+            }
+        )
+    
+    # 验证AI服务提供商
+    if request.ai_provider and request.ai_provider not in ["ollama", "deepseek", "qwen"]:
+        raise HTTPException(
+            status_code=400,
+            detail={
+                "error": "INVALID_AI_PROVIDER",
+                "message": f"不支持的AI服务提供商: {request.ai_provider}"
+            }
+        )
+
+
 # API端点
 @router.post("/generate", response_model=ItineraryResponse)
 async def generate_itinerary(
@@ -70,50 +111,98 @@ async def generate_itinerary(
     """
     生成旅游攻略
     
-    根据用户输入的目的地、天数等信息，调用AI服务生成详细的旅游攻略。
+    根据用户输入的目的地、天数等信息提交生成任务，立即返回攻略ID，
+    生成进度可通过 /progress/{itinerary_id} 查询。
     """
     try:
         logger.info("收到攻略生成请求", destination=request.destination, days=request.days)
         
-        # 验证请求
-        validation_result = await itinerary_service.validate_generation_request(
+        await _validate_generation_request(request, user_id)
+        
+        # 提交生成任务，由worker异步执行
+        result = await itinerary_service.enqueue_generation(
             destination=request.destination,
             days=request.days,
-            user_id=user_id
+            user_id=user_id,
+            travel_style=request.travel_style,
+            budget_min=request.budget_min,
+            budget_max=request.budget_max,
+            group_size=request.group_size,
+            start_date=request.start_date,
+            ai_provider=request.ai_provider,
+            special_requirements=request.special_requirements
         )
         
-        if not validation_result["valid"]:
+        if not result["success"]:
             raise HTTPException(
-                status_code=400,
+                status_code=429,
                 detail={
-                    "error": "VALIDATION_FAILED",
-                    "message": "请求参数验证失败",
-                    "errors": validation_result["errors"]
+                    "error": result.get("error", "TOO_MANY_GENERATIONS"),
+                    "message": result.get("message", "攻略生成任务过多，请稍后重试")
                 }
             )
         
-        # 检查预算范围
-        if request.budget_min and request.budget_max and request.budget_min > request.budget_max:
-            raise HTTPException(
-                status_code=400,
-                detail={
-                    "error": "INVALID_BUDGET_RANGE",
-                    "message": "预算下限不能大于上限"
-                }
-            )
+        logger.info("攻略生成任务已提交", destination=request.destination, itinerary_id=result["itinerary_id"])
         
-        # 验证AI服务提供商
-        if request.ai_provider and request.ai_provider not in ["ollama", "deepseek", "qwen"]:
-            raise HTTPException(
-                status_code=400,
-                detail={
-                    "error": "INVALID_AI_PROVIDER",
-                    "message": f"不支持的AI服务提供商: {request.ai_provider}"
-                }
-            )
+        return ItineraryResponse(
+            success=True,
+            data={
+                "itinerary_id": result["itinerary_id"],
+                "status": result["status"]
+            },
+            message="攻略生成任务已提交，请通过进度接口查询"
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("攻略生成API异常", error=str(e), destination=request.destination)
+        raise HTTPException(
+            status_code=500,
+            detail={
+                "error": "INTERNAL_SERVER_ERROR",
+                "message": "服务器内部错误，请稍后重试"
+            }
+        )
+
+
+def _stream_response(itinerary_id: int, offset: int) -> StreamingResponse:
+    """构造SSE响应，从offset开始回放并跟随生成事件"""
+    stream = GenerationStream(itinerary_id)
+    
+    async def event_source():
+        async for event_offset, event in stream.follow(offset):
+            yield format_sse(event_offset, event)
+    
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",  # 关闭nginx缓冲，保证首字节尽快到达
+            "X-Itinerary-ID": str(itinerary_id),
+        }
+    )
+
+
+@router.post("/generate/stream")
+async def generate_itinerary_stream(
+    request: ItineraryGenerationRequest,
+    user_id: int = 1  # 临时固定用户ID，实际应该从认证中获取
+):
+    """
+    流式生成旅游攻略
+    
+    以SSE返回生成过程：stage事件标记阶段（prompt、overview、day N），
+    token事件携带文本片段，done事件表示结束。每个事件的id为偏移量，
+    断线后可通过 /{itinerary_id}/stream 续传。
+    """
+    try:
+        logger.info("收到流式攻略生成请求", destination=request.destination, days=request.days)
+        
+        await _validate_generation_request(request, user_id)
         
-        # 开始生成攻略
-        result = await itinerary_service.generate_itinerary(
+        result = await itinerary_service.start_stream_generation(
             destination=request.destination,
             days=request.days,
             user_id=user_id,
@@ -128,26 +217,19 @@ async def generate_itinerary(
         
         if not result["success"]:
             raise HTTPException(
-                status_code=500,
+                status_code=429,
                 detail={
-                    "error": "GENERATION_FAILED",
-                    "message": result.get("message", "攻略生成失败"),
-                    "details": result.get("error")
+                    "error": result.get("error", "TOO_MANY_GENERATIONS"),
+                    "message": result.get("message", "攻略生成任务过多，请稍后重试")
                 }
             )
         
-        logger.info("攻略生成完成", destination=request.destination)
-        
-        return ItineraryResponse(
-            success=True,
-            data=result,
-            message="攻略生成完成"
-        )
+        return _stream_response(result["itinerary_id"], 0)
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error("攻略生成API异常", error=str(e), destination=request.destination)
+        logger.error("流式攻略生成API异常", error=str(e), destination=request.destination)
         raise HTTPException(
             status_code=500,
             detail={
@@ -167,6 +249,15 @@ async def get_generation_progress(itinerary_id: int):
     try:
         progress = await itinerary_service.get_generation_progress(itinerary_id)
         
+        if progress is None:
+            raise HTTPException(
+                status_code=404,
+                detail={
+                    "error": "ITINERARY_NOT_FOUND",
+                    "message": "攻略不存在"
+                }
+            )
+        
         return ProgressResponse(
             itinerary_id=itinerary_id,
             progress=progress.get("progress", 0),
@@ -175,6 +266,8 @@ async def get_generation_progress(itinerary_id: int):
             current_step=progress.get("current_step")
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error("获取生成进度失败", itinerary_id=itinerary_id, error=str(e))
         raise HTTPException(
@@ -334,6 +427,7 @@ async def get_generation_stats():
             "success_rate": 0.96,
             "avg_generation_time": 45.2  # 秒
         }
+        stats["reuse"] = await itinerary_service.get_reuse_stats()
         
         return {
             "success": True,
@@ -349,4 +443,70 @@ async def get_generation_stats():
                 "error": "STATS_QUERY_FAILED",
                 "message": "获取统计数据失败"
             }
-        ) 
\ No newline at end of file
+        ) 
+
+
+@router.get("/{itinerary_id}", response_model=ItineraryResponse)
+async def get_itinerary(itinerary_id: int):
+    """
+    获取攻略详情
+    
+    返回攻略概览及每日行程，生成未完成时内容可能为空。
+    """
+    try:
+        result = await itinerary_service.get_itinerary(itinerary_id)
+        
+        if result is None:
+            raise HTTPException(
+                status_code=404,
+                detail={
+                    "error": "ITINERARY_NOT_FOUND",
+                    "message": "攻略不存在"
+                }
+            )
+        
+        return ItineraryResponse(
+            success=True,
+            data=result,
+            message="获取攻略成功"
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("获取攻略失败", itinerary_id=itinerary_id, error=str(e))
+        raise HTTPException(
+            status_code=500,
+            detail={
+                "error": "ITINERARY_QUERY_FAILED",
+                "message": "获取攻略失败"
+            }
+        )
+
+
+@router.get("/{itinerary_id}/stream")
+async def resume_itinerary_stream(
+    itinerary_id: int,
+    offset: int = Query(0, description="事件偏移量，从该位置开始回放", ge=0),
+    last_event_id: Optional[int] = Header(None, alias="Last-Event-ID")
+):
+    """
+    续传攻略生成事件流
+    
+    从指定偏移量回放已生成的事件并继续跟随；
+    浏览器EventSource自动重连时携带的Last-Event-ID优先。
+    """
+    if last_event_id is not None:
+        offset = last_event_id + 1
+    
+    stream = GenerationStream(itinerary_id)
+    if not await stream.exists():
+        raise HTTPException(
+            status_code=404,
+            detail={
+                "error": "STREAM_NOT_FOUND",
+                "message": "生成事件流不存在或已过期"
+            }
+        )
+    
+    return _stream_response(itinerary_id, offset)
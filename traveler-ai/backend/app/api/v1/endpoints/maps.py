@@ -7,6 +7,8 @@ from pydantic import BaseModel, Field
 import structlog
 
 from app.services.baidu_map_service import baidu_map_service
+from app.services.location_service import location_service
+from app.core.redis import cache, destination_tag
 
 logger = structlog.get_logger()
 router = APIRouter()
@@ -344,6 +346,47 @@ async def get_ip_location(ip: Optional[str] = Query(None, description="IP地址
         )
 
 
+@router.get("/nearby")
+async def get_nearby_places(
+    latitude: float = Query(..., description="纬度", ge=-90.0, le=90.0),
+    longitude: float = Query(..., description="经度", ge=-180.0, le=180.0),
+    radius: int = Query(5000, description="搜索半径(米)", ge=1, le=50000),
+    type: Optional[str] = Query(None, description="地点类型: attraction/hotel/restaurant/transport"),
+    limit: int = Query(20, description="返回数量", ge=1, le=100)
+):
+    """
+    附近地点
+    
+    优先从本地地点库检索，本地数据不足时回源百度周边检索。
+    """
+    try:
+        logger.info("收到附近地点请求", latitude=latitude, longitude=longitude, radius=radius, type=type)
+        
+        result = await location_service.nearby(
+            latitude,
+            longitude,
+            radius=radius,
+            location_type=type,
+            limit=limit
+        )
+        
+        return {
+            "success": True,
+            "data": result,
+            "message": "附近地点检索成功"
+        }
+            
+    except Exception as e:
+        logger.error("附近地点检索失败", latitude=latitude, longitude=longitude, error=str(e))
+        raise HTTPException(
+            status_code=500,
+            detail={
+                "error": "NEARBY_SEARCH_FAILED",
+                "message": f"附近地点检索失败: {str(e)}"
+            }
+        )
+
+
 @router.get("/config")
 async def get_map_config():
     """
@@ -377,4 +420,33 @@ async def get_map_config():
                 "error": "CONFIG_QUERY_FAILED",
                 "message": "获取地图配置失败"
             }
-        ) 
\ No newline at end of file
+        )
+
+
+@router.delete("/cache/{destination}")
+async def invalidate_destination_cache(destination: str):
+    """
+    清除目的地缓存
+    
+    删除该目的地派生的地理编码、地点检索和攻略概览缓存。
+    """
+    try:
+        deleted = await cache.invalidate_tags(destination_tag(destination))
+        
+        logger.info("目的地缓存已清除", destination=destination, deleted=deleted)
+        
+        return {
+            "success": True,
+            "deleted": deleted,
+            "message": "目的地缓存已清除"
+        }
+        
+    except Exception as e:
+        logger.error("清除目的地缓存失败", destination=destination, error=str(e))
+        raise HTTPException(
+            status_code=500,
+            detail={
+                "error": "CACHE_INVALIDATION_FAILED",
+                "message": "清除目的地缓存失败"
+            }
+        )
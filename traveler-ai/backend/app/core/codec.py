@@ -0,0 +1,173 @@
+"""
+缓存值编解码 - 序列化 + 可选压缩，首字节标明编码方式
+"""
+import json
+import zlib
+from typing import Any, Callable, Dict, Optional, Tuple
+import structlog
+
+logger = structlog.get_logger()
+
+# 可选依赖，缺失时退回标准库实现
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+# 首字节格式：0b1110CCSS，高4位固定为1110（第4位为保留位，恒为0），
+# CC为压缩算法，SS为序列化方式。
+# JSON文本不会以0xE0~0xEF开头，据此区分旧版无首字节的JSON缓存。
+HEADER_BASE = 0xE0
+HEADER_MASK = 0xF0
+
+SERIALIZER_IDS = {"json": 0, "orjson": 1, "msgpack": 2}
+COMPRESSOR_IDS = {"none": 0, "zlib": 1, "zstd": 2, "lz4": 3}
+
+
+class CodecError(ValueError):
+    """无法解码的缓存值"""
+
+
+def _json_dumps(value: Any) -> bytes:
+    return json.dumps(value, ensure_ascii=False, default=str).encode("utf-8")
+
+
+def _json_loads(data: bytes) -> Any:
+    return json.loads(data)
+
+
+def _serializers() -> Dict[int, Tuple[Callable[[Any], bytes], Callable[[bytes], Any]]]:
+    """当前环境可用的序列化实现"""
+    available = {SERIALIZER_IDS["json"]: (_json_dumps, _json_loads)}
+    if orjson is not None:
+        available[SERIALIZER_IDS["orjson"]] = (
+            lambda value: orjson.dumps(value, default=str, option=orjson.OPT_NON_STR_KEYS),
+            orjson.loads,
+        )
+    if msgpack is not None:
+        available[SERIALIZER_IDS["msgpack"]] = (
+            lambda value: msgpack.packb(value, default=str, use_bin_type=True),
+            lambda data: msgpack.unpackb(data, raw=False, strict_map_key=False),
+        )
+    return available
+
+
+def _compressors(level: Optional[int]) -> Dict[int, Tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]]:
+    """当前环境可用的压缩实现"""
+    available = {
+        COMPRESSOR_IDS["none"]: (lambda data: data, lambda data: data),
+        COMPRESSOR_IDS["zlib"]: (
+            lambda data: zlib.compress(data, 6 if level is None else level),
+            zlib.decompress,
+        ),
+    }
+    if zstandard is not None:
+        compressor = zstandard.ZstdCompressor(level=3 if level is None else level)
+        decompressor = zstandard.ZstdDecompressor()
+        available[COMPRESSOR_IDS["zstd"]] = (compressor.compress, decompressor.decompress)
+    if lz4_frame is not None:
+        available[COMPRESSOR_IDS["lz4"]] = (
+            lambda data: lz4_frame.compress(data, compression_level=0 if level is None else level),
+            lz4_frame.decompress,
+        )
+    return available
+
+
+class CacheCodec:
+    """缓存值编解码器
+
+    编码：序列化 → 超过阈值时压缩 → 加1字节首部。
+    解码只看首部，不再依次尝试JSON和pickle；旧版无首部的值按JSON解析。
+    配置的库未安装时退回标准库json/zlib。
+    """
+
+    def __init__(
+        self,
+        serializer: str = "orjson",
+        compressor: str = "zstd",
+        threshold: int = 1024,
+        level: Optional[int] = None
+    ):
+        self._serializers = _serializers()
+        self._compressors = _compressors(level)
+        self.threshold = threshold
+
+        self.serializer_id = SERIALIZER_IDS.get(serializer, 0)
+        if self.serializer_id not in self._serializers:
+            logger.warning("缓存序列化方式不可用，改用json", serializer=serializer)
+            self.serializer_id = SERIALIZER_IDS["json"]
+
+        self.compressor_id = COMPRESSOR_IDS.get(compressor, 0)
+        if self.compressor_id not in self._compressors:
+            logger.warning("缓存压缩算法不可用，改用zlib", compressor=compressor)
+            self.compressor_id = COMPRESSOR_IDS["zlib"]
+
+    @property
+    def name(self) -> str:
+        """当前编码方式，如 orjson+zstd"""
+        serializer = next(k for k, v in SERIALIZER_IDS.items() if v == self.serializer_id)
+        compressor = next(k for k, v in COMPRESSOR_IDS.items() if v == self.compressor_id)
+        return f"{serializer}+{compressor}"
+
+    def encode(self, value: Any) -> bytes:
+        """编码缓存值"""
+        return self.encode_with_copy(value)[0]
+
+    def encode_with_copy(self, value: Any) -> Tuple[bytes, Any]:
+        """编码缓存值，同时返回反序列化后的副本
+
+        副本与从Redis读回解码的值类型一致（如tuple变为list），供一级缓存保存，
+        两级缓存返回的值不会因来源不同而不同。只多一次反序列化，不解压。
+        """
+        dumps, loads = self._serializers[self.serializer_id]
+        payload = dumps(value)
+        copy = loads(payload)
+
+        compressor_id = COMPRESSOR_IDS["none"]
+        if self.compressor_id and len(payload) >= self.threshold:
+            compress, _ = self._compressors[self.compressor_id]
+            compressed = compress(payload)
+            # 压缩收益不明显时保留原文，省去读取时的解压
+            if len(compressed) < len(payload) * 0.9:
+                payload = compressed
+                compressor_id = self.compressor_id
+
+        header = HEADER_BASE | (compressor_id << 2) | self.serializer_id
+        return bytes([header]) + payload, copy
+
+    def decode(self, data: bytes) -> Any:
+        """解码缓存值"""
+        if not data:
+            raise CodecError("缓存值为空")
+
+        header = data[0]
+        if header & HEADER_MASK != HEADER_BASE:
+            # 旧版本写入的JSON文本
+            try:
+                return json.loads(data)
+            except (json.JSONDecodeError, UnicodeDecodeError) as e:
+                raise CodecError(f"无法识别的缓存值: {e}") from e
+
+        serializer_id = header & 0x03
+        compressor_id = (header >> 2) & 0x03
+        if serializer_id not in self._serializers or compressor_id not in self._compressors:
+            raise CodecError(f"缓存编码不可用: header={header:#x}")
+
+        _, decompress = self._compressors[compressor_id]
+        _, loads = self._serializers[serializer_id]
+        return loads(decompress(data[1:]))
@@ -1,7 +1,7 @@
 """
 应用核心配置
 """
-from typing import List, Optional, Union
+from typing import Dict, List, Optional, Union
 from pydantic import BaseSettings, validator, AnyHttpUrl
 import secrets
 
@@ -32,42 +32,120 @@ class Settings(BaseSettings):
     # Redis配置
     REDIS_URL: str = "redis://localhost:6379/0"
     REDIS_CACHE_TTL: int = 3600  # 1小时
+    CACHE_L1_ENABLED: bool = True  # 启用进程内一级缓存
+    CACHE_L1_MAX_SIZE: int = 2048  # 一级缓存最大条目数
+    CACHE_L1_TTL: int = 60  # 一级缓存最长保留时间(秒)
+    CACHE_NEGATIVE_TTL: int = 600  # 负缓存（查询无结果）保留时间(秒)
+    CACHE_SCAN_BATCH_SIZE: int = 500  # 批量删除时每批SCAN/UNLINK的键数
+    CACHE_SERIALIZER: str = "orjson"  # json, orjson, msgpack
+    CACHE_COMPRESSION: str = "zstd"  # none, zlib, zstd, lz4
+    CACHE_COMPRESS_THRESHOLD: int = 1024  # 序列化后超过该字节数才压缩
+    MAP_CACHE_STALE_TTL: int = 3600  # 地图缓存过期后仍可返回旧值并后台刷新的时长(秒)
+    ROUTE_MATRIX_CACHE_TTL: int = 3600 * 24 * 7  # 批量算路逐格缓存时长(秒)
+    SINGLE_FLIGHT_DISTRIBUTED: bool = True  # 跨进程合并相同的上游请求
+    SINGLE_FLIGHT_LOCK_TTL: int = 30  # 合并锁默认过期时间(秒)
+    SINGLE_FLIGHT_POLL_INTERVAL: float = 5.0  # 等待期间检查锁是否仍被持有的间隔(秒)
     
     # AI服务配置
     # Ollama配置
     OLLAMA_BASE_URL: str = "http://localhost:11434"
     OLLAMA_MODEL: str = "qwen2.5:14b"
     OLLAMA_TIMEOUT: int = 300  # 5分钟
+    OLLAMA_MAX_CONCURRENCY: int = 2  # 本地GPU并发上限
+    OLLAMA_RATE_PER_MINUTE: int = 0  # 每分钟请求上限(所有worker共享)，0为不限
     
     # DeepSeek配置
     DEEPSEEK_API_KEY: Optional[str] = None
     DEEPSEEK_BASE_URL: str = "https://api.deepseek.com"
     DEEPSEEK_MODEL: str = "deepseek-chat"
+    DEEPSEEK_MAX_CONCURRENCY: int = 8
+    DEEPSEEK_RATE_PER_MINUTE: int = 60
     
     # 阿里云百炼配置
     BAILIAN_API_KEY: Optional[str] = None
     BAILIAN_BASE_URL: str = "https://dashscope.aliyuncs.com/compatible-mode/v1"
     BAILIAN_MODEL: str = "qwen-max"
+    BAILIAN_MAX_CONCURRENCY: int = 8
+    BAILIAN_RATE_PER_MINUTE: int = 60
     
     # 默认AI服务提供商
     DEFAULT_AI_PROVIDER: str = "ollama"  # ollama, deepseek, bailian
+    AI_RATE_QUEUE_TIMEOUT: float = 30.0  # 超出请求频率时最长排队时间(秒)
+    
+    # AI服务提供商路由配置
+    AI_ROUTING_ENABLED: bool = True  # 关闭时只使用请求的提供商
+    AI_ROUTING_SWITCH_RATIO: float = 2.0  # 首选提供商负载评分超过最优者该倍数时改用最优者
+    AI_ROUTING_DEFAULT_LATENCY: float = 10.0  # 尚无调用记录时假定的耗时(秒)
+    AI_ROUTING_WINDOW: int = 20  # 统计错误率的最近调用次数
+    AI_CIRCUIT_ERROR_RATE: float = 0.5  # 错误率达到该值时熔断
+    AI_CIRCUIT_MIN_REQUESTS: int = 5  # 熔断前至少需要的调用次数
+    AI_CIRCUIT_OPEN_SECONDS: float = 30.0  # 熔断后多久放行探测请求
+    AI_HEDGE_DELAY: float = 60.0  # 概览调用超过该秒数未返回时向下一个提供商发起对冲请求，0为关闭
     
     # 百度地图API配置
     BAIDU_MAP_AK: Optional[str] = None
     BAIDU_MAP_BASE_URL: str = "https://api.map.baidu.com"
     BAIDU_MAP_TIMEOUT: int = 30
+    BAIDU_MAP_QPS: int = 30  # 每个接口的QPS配额
+    BAIDU_MAP_DAILY_QUOTA: int = 5000  # 每个接口的日配额
+    BAIDU_MAP_QUEUE_TIMEOUT: float = 10.0  # 超出QPS时最长排队时间(秒)
+    POI_ENRICHMENT_ENABLED: bool = True  # 生成后提取地点并补全坐标、里程
+    POI_ENRICHMENT_CONCURRENCY: int = 8  # 地点解析并发数
+    POI_MAX_PER_DAY: int = 8  # 每天参与解析的地点上限
+    ROUTE_OPTIMIZATION_ENABLED: bool = True  # 按路程和营业时间重排每天的游览顺序
+    ROUTE_DAY_START_HOUR: int = 9  # 每天出发时间(时)
+    ROUTE_STAY_MINUTES: int = 90  # 每个景点的默认停留时长(分钟)
+    DAY_CLUSTERING_ENABLED: bool = True  # 生成每日行程前按地理位置把景点分到各天
+    DAY_CLUSTERING_MAX_POIS: int = 20  # 参与分组的景点上限
+    DAY_CLUSTERING_SLACK: float = 0.25  # 每天游览时长可超出平均值的比例
+    SPATIAL_INDEX_MAX_REGIONS: int = 64  # 内存中保留的地点索引区域数
+    SPATIAL_INDEX_TTL: int = 600  # 索引区域重新加载间隔(秒)，用于同步其他进程写入的地点
+    NEARBY_MIN_RESULTS: int = 5  # 附近检索本地结果少于该数量时回源百度
+    POI_WAREHOUSE_ENABLED: bool = True  # 百度返回的地点写回Location表
+    POI_WAREHOUSE_BATCH_SIZE: int = 200  # 每批写入的地点数
+    POI_WAREHOUSE_FLUSH_INTERVAL: float = 5.0  # 缓冲写入间隔(秒)
+    POI_WAREHOUSE_MAX_PENDING: int = 5000  # 缓冲地点上限，超出时丢弃
+    POI_WAREHOUSE_DETAILS_MAX_AGE: int = 3600 * 24 * 30  # 本地地点详情有效期(秒)
+    
+    # 上游HTTP连接池配置
+    HTTP_MAX_CONNECTIONS: int = 100  # 每个上游的最大连接数
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20  # 每个上游保持的空闲长连接数
+    HTTP_KEEPALIVE_EXPIRY: float = 30.0  # 空闲长连接过期时间(秒)
+    HTTP2_ENABLED: bool = True  # HTTPS上游启用HTTP/2（需安装h2）
     
     # 文件存储配置
     UPLOAD_MAX_SIZE: int = 10 * 1024 * 1024  # 10MB
     ALLOWED_EXTENSIONS: List[str] = [".jpg", ".jpeg", ".png", ".gif", ".webp"]
     STATIC_FILES_PATH: str = "/app/static"
     TEMPLATES_PATH: str = "/app/templates"
+    TEMPLATE_CHECK_INTERVAL: int = 60  # 模板版本/文件修改时间的检查间隔(秒)
+    TEMPLATE_USAGE_FLUSH_INTERVAL: float = 30.0  # 模板使用次数写回间隔(秒)
     
     # 攻略生成配置
     MAX_DAYS: int = 30  # 最大行程天数
-    MAX_CONCURRENT_GENERATIONS: int = 3  # 最大并发生成数
+    MAX_CONCURRENT_GENERATIONS: int = 3  # 每个worker最大并发生成数
+    MAX_CONCURRENT_GENERATIONS_PER_USER: int = 2  # 每个用户最大并发生成数
+    GENERATION_WORKER_ENABLED: bool = True  # 是否在API进程内运行生成worker
+    GENERATION_STREAM_TTL: int = 3600 * 24  # 流式生成事件保留时间(秒)
+    QUEUE_HEARTBEAT_INTERVAL: float = 10.0  # 队列消费者心跳及中断任务检查间隔(秒)
+    QUEUE_HEARTBEAT_TTL: int = 30  # 心跳过期后其处理中的任务移回队列(秒)
+    QUEUE_MAX_ATTEMPTS: int = 3  # 任务被中断超过该次数后标记失败
+    PROMPT_COMPACTION_ENABLED: bool = True  # 每日提示词使用概览摘要而非完整概览
+    
+    # AI语义缓存配置
+    SEMANTIC_CACHE_ENABLED: bool = True  # 概览按归一化请求参数缓存
+    SEMANTIC_CACHE_EMBEDDING_ENABLED: bool = False  # 启用向量近似匹配（需Ollama嵌入模型）
+    SEMANTIC_CACHE_EMBEDDING_MODEL: str = "nomic-embed-text"
+    SEMANTIC_CACHE_SIMILARITY: float = 0.95  # 近似命中的最低余弦相似度
+    SEMANTIC_CACHE_MAX_VECTORS: int = 5000  # 向量索引最多保留的条目数，超出时淘汰最早登记的
+    SEMANTIC_CACHE_INDEX_REFRESH: float = 60.0  # 进程内向量索引从Redis重新加载的间隔(秒)
     GENERATION_TIMEOUT: int = 600  # 10分钟
     
+    # 攻略复用配置
+    ITINERARY_REUSE_ENABLED: bool = True  # 相同归一化请求复用已完成的攻略
+    ITINERARY_REUSE_MAX_AGE: int = 3600 * 24 * 7  # 该时间内完成的攻略直接复制(秒)
+    ITINERARY_WARM_START_MAX_AGE: int = 3600 * 24 * 30  # 该时间内完成的攻略复用概览、重新生成每日行程(秒)
+    
     # Celery配置（异步任务）
     CELERY_BROKER_URL: str = "redis://localhost:6379/1"
     CELERY_RESULT_BACKEND: str = "redis://localhost:6379/2"
@@ -85,10 +163,24 @@ class Settings(BaseSettings):
     RATE_LIMIT_PER_MINUTE: int = 60
     RATE_LIMIT_PER_HOUR: int = 1000
     RATE_LIMIT_PER_DAY: int = 10000
+    RATE_LIMIT_QUEUE_TIMEOUT: float = 2.0  # 超限请求最长排队时间(秒)，之后返回429
     
     # 日志配置
     LOG_LEVEL: str = "INFO"
     LOG_FORMAT: str = "json"  # json or text
+    LOG_SAMPLE_RATES: Dict[str, float] = {"请求开始": 0.01}  # 按事件名的info日志采样率
+    LOG_QUEUE_SIZE: int = 10000  # 待输出日志队列上限，满时丢弃
+    
+    # 监控指标配置
+    METRICS_ENABLED: bool = True  # 开放/metrics端点
+    PROMETHEUS_MULTIPROC_DIR: Optional[str] = None  # 多worker部署时各进程指标文件目录，启动前需清空
+    
+    # 链路追踪配置（需安装opentelemetry-sdk）
+    TRACING_ENABLED: bool = False
+    TRACING_EXPORTER: str = "jsonl"  # jsonl or otlp
+    TRACING_OTLP_ENDPOINT: str = "http://localhost:4318/v1/traces"
+    TRACING_JSONL_PATH: str = "logs/traces.jsonl"
+    TRACING_SAMPLE_RATIO: float = 1.0  # 追踪的请求比例
     
     @validator("ALLOWED_HOSTS", pre=True)
     def assemble_allowed_hosts(cls, v: Union[str, List[str]]) -> Union[List[str], str]:
@@ -131,18 +223,24 @@ AI_PROVIDERS = {
         "base_url": settings.OLLAMA_BASE_URL,
         "model": settings.OLLAMA_MODEL,
         "timeout": settings.OLLAMA_TIMEOUT,
+        "max_concurrency": settings.OLLAMA_MAX_CONCURRENCY,
+        "rate_per_minute": settings.OLLAMA_RATE_PER_MINUTE,
         "api_key": None
     },
     "deepseek": {
         "base_url": settings.DEEPSEEK_BASE_URL,
         "model": settings.DEEPSEEK_MODEL,
         "timeout": 60,
+        "max_concurrency": settings.DEEPSEEK_MAX_CONCURRENCY,
+        "rate_per_minute": settings.DEEPSEEK_RATE_PER_MINUTE,
         "api_key": settings.DEEPSEEK_API_KEY
     },
     "bailian": {
         "base_url": settings.BAILIAN_BASE_URL,
         "model": settings.BAILIAN_MODEL,
         "timeout": 60,
+        "max_concurrency": settings.BAILIAN_MAX_CONCURRENCY,
+        "rate_per_minute": settings.BAILIAN_RATE_PER_MINUTE,
         "api_key": settings.BAILIAN_API_KEY
     }
 }
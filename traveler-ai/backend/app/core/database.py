@@ -5,8 +5,10 @@ from sqlalchemy import create_engine
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+import time
 import structlog
 
+from app.core import metrics
 from app.core.config import settings
 
 logger = structlog.get_logger()
@@ -96,6 +98,10 @@ class DatabaseManager:
         async with self.session_factory() as session:
             try:
                 async with session.begin():
+                    # 先取连接，记录连接池排队耗时
+                    started = time.perf_counter()
+                    await session.connection()
+                    metrics.db_pool_checkout_seconds.observe(time.perf_counter() - started)
                     result = await func(session, *args, **kwargs)
                     return result
             except Exception as e:
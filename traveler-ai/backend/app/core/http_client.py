@@ -0,0 +1,127 @@
+"""
+HTTP客户端连接池管理
+"""
+from typing import Any, Dict, Optional
+import httpx
+import structlog
+
+from app.core.config import settings
+
+logger = structlog.get_logger()
+
+# HTTP/2需要额外安装h2依赖，缺失时退回HTTP/1.1
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class HTTPClientManager:
+    """长连接HTTP客户端注册表
+
+    每个上游服务（AI提供商、百度地图）共享一个AsyncClient，
+    复用TCP/TLS连接，避免每次请求重新握手。
+    """
+
+    def __init__(self):
+        self._configs: Dict[str, Dict[str, Any]] = {}
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+
+    def register(
+        self,
+        name: str,
+        base_url: str,
+        timeout: float,
+        max_connections: Optional[int] = None,
+        max_keepalive_connections: Optional[int] = None
+    ):
+        """注册客户端配置，实际连接在首次使用或应用启动时创建"""
+        self._configs[name] = {
+            "base_url": base_url,
+            "timeout": timeout,
+            "max_connections": max_connections or settings.HTTP_MAX_CONNECTIONS,
+            "max_keepalive_connections": (
+                max_keepalive_connections or settings.HTTP_MAX_KEEPALIVE_CONNECTIONS
+            ),
+        }
+
+    def _create_client(self, name: str) -> httpx.AsyncClient:
+        """根据注册配置创建客户端"""
+        config = self._configs.get(name)
+        if config is None:
+            raise ValueError(f"HTTP客户端 '{name}' 未注册")
+
+        # 仅HTTPS上游启用HTTP/2（明文HTTP/2需要prior knowledge，Ollama不支持）
+        http2 = (
+            settings.HTTP2_ENABLED
+            and HTTP2_AVAILABLE
+            and config["base_url"].startswith("https://")
+        )
+
+        client = httpx.AsyncClient(
+            timeout=config["timeout"],
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=config["max_connections"],
+                max_keepalive_connections=config["max_keepalive_connections"],
+                keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+            ),
+        )
+        self._clients[name] = client
+        logger.info("HTTP客户端已创建", name=name, http2=http2)
+        return client
+
+    def get_client(self, name: str) -> httpx.AsyncClient:
+        """获取共享客户端，不存在或已关闭时重新创建"""
+        client = self._clients.get(name)
+        if client is None or client.is_closed:
+            client = self._create_client(name)
+        return client
+
+    async def init_clients(self):
+        """创建所有已注册的客户端"""
+        for name in self._configs:
+            self.get_client(name)
+
+    async def close_clients(self):
+        """关闭所有客户端并释放连接"""
+        for name, client in list(self._clients.items()):
+            try:
+                await client.aclose()
+            except Exception as e:
+                logger.error("HTTP客户端关闭失败", name=name, error=str(e))
+        self._clients.clear()
+
+    def get_pool_stats(self) -> Dict[str, Dict[str, Any]]:
+        """获取各连接池占用情况"""
+        stats = {}
+        for name, client in self._clients.items():
+            config = self._configs[name]
+            # httpx未公开连接池统计，从底层httpcore连接池读取
+            pool = getattr(getattr(client, "_transport", None), "_pool", None)
+            connections = list(getattr(pool, "connections", []) or [])
+            idle = sum(1 for conn in connections if conn.is_idle())
+            stats[name] = {
+                "closed": client.is_closed,
+                "max_connections": config["max_connections"],
+                "max_keepalive_connections": config["max_keepalive_connections"],
+                "connections": len(connections),
+                "active": len(connections) - idle,
+                "idle": idle,
+            }
+        return stats
+
+
+# 全局HTTP客户端管理器实例
+http_clients = HTTPClientManager()
+
+
+async def init_http_clients():
+    """初始化HTTP客户端连接池"""
+    await http_clients.init_clients()
+
+
+async def close_http_clients():
+    """关闭HTTP客户端连接池"""
+    await http_clients.close_clients()
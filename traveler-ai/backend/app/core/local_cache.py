@@ -0,0 +1,118 @@
+"""
+进程内LRU缓存（Redis前的一级缓存）
+"""
+import fnmatch
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from app.core.metrics import record_cache
+
+
+class _NegativeResult:
+    """负缓存标记：表示上游确认“无结果”
+
+    布尔值为False，原有 `if cached:` 判断会自然跳过；
+    需要区分“未缓存”和“确认无结果”时用 `is NEGATIVE_RESULT` 判断。
+    """
+
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __bool__(self) -> bool:
+        return False
+
+    def __repr__(self) -> str:
+        return "NEGATIVE_RESULT"
+
+
+NEGATIVE_RESULT = _NegativeResult()
+
+_MISSING = object()
+
+
+class LocalCache:
+    """容量受限、带过期时间的LRU缓存
+
+    值以反序列化后的对象保存，调用方应视为只读。
+    """
+
+    def __init__(self, max_size: int, default_ttl: float):
+        self.max_size = max_size
+        self.default_ttl = default_ttl
+        self._data: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: str) -> Any:
+        """获取值，不存在或已过期返回_MISSING"""
+        entry = self._data.get(key)
+        if entry is None:
+            return _MISSING
+
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return _MISSING
+
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, ttl: float = None):
+        """设置值，超出容量时淘汰最久未使用的条目"""
+        ttl = self.default_ttl if ttl is None else min(ttl, self.default_ttl)
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def delete(self, key: str):
+        """删除单个键"""
+        self._data.pop(key, None)
+
+    def delete_pattern(self, pattern: str) -> int:
+        """按glob模式删除"""
+        keys = [key for key in self._data if fnmatch.fnmatchcase(key, pattern)]
+        for key in keys:
+            del self._data[key]
+        return len(keys)
+
+    def clear(self):
+        """清空缓存"""
+        self._data.clear()
+
+
+def is_missing(value: Any) -> bool:
+    """LocalCache.get 未命中判断"""
+    return value is _MISSING
+
+
+class TierStats:
+    """分层缓存命中统计（进程内）"""
+
+    def __init__(self):
+        self.counts: Dict[str, int] = {
+            "l1_hits": 0,
+            "l1_misses": 0,
+            "l2_hits": 0,
+            "l2_misses": 0,
+            "negative_hits": 0,
+        }
+
+    def incr(self, name: str, key: Optional[str] = None):
+        self.counts[name] += 1
+        if key is not None:
+            record_cache(name, key)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """带命中率的统计快照"""
+        stats: Dict[str, Any] = dict(self.counts)
+        for tier in ("l1", "l2"):
+            total = self.counts[f"{tier}_hits"] + self.counts[f"{tier}_misses"]
+            stats[f"{tier}_hit_ratio"] = round(self.counts[f"{tier}_hits"] / total, 4) if total else 0.0
+        return stats
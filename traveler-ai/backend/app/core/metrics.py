@@ -0,0 +1,106 @@
+"""
+Prometheus指标 - 大模型、百度地图、缓存、数据库连接池和攻略生成各阶段的耗时统计
+"""
+import os
+import time
+from typing import Optional, Tuple
+
+from app.core.config import settings, Constants
+
+# 多进程模式：各进程把指标写入同一目录下的mmap文件，采集时汇总。
+# 必须在导入prometheus_client之前设置环境变量
+if settings.PROMETHEUS_MULTIPROC_DIR:
+    os.makedirs(settings.PROMETHEUS_MULTIPROC_DIR, exist_ok=True)
+    os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", settings.PROMETHEUS_MULTIPROC_DIR)
+
+from prometheus_client import (  # noqa: E402
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+# 毫秒到秒级的请求
+FAST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# 连接池取连接，正常在1毫秒内
+POOL_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+# 大模型调用和生成阶段，秒到分钟级
+SLOW_BUCKETS = (0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 180.0, 300.0, 600.0)
+TOKEN_RATE_BUCKETS = (1, 2, 5, 10, 15, 20, 30, 40, 60, 80, 120, 200)
+
+http_request_seconds = Histogram(
+    "http_request_seconds", "API请求耗时", ["method", "route", "status"], buckets=FAST_BUCKETS
+)
+llm_request_seconds = Histogram(
+    "llm_request_seconds", "大模型调用耗时（不含本地排队）", ["provider", "model", "mode"], buckets=SLOW_BUCKETS
+)
+llm_first_token_seconds = Histogram(
+    "llm_time_to_first_token_seconds", "流式调用的首个片段耗时", ["provider", "model"], buckets=SLOW_BUCKETS
+)
+llm_tokens_per_second = Histogram(
+    "llm_tokens_per_second", "大模型输出速度", ["provider", "model"], buckets=TOKEN_RATE_BUCKETS
+)
+baidu_api_seconds = Histogram(
+    "baidu_api_seconds", "百度地图API耗时", ["endpoint", "status"], buckets=FAST_BUCKETS
+)
+cache_requests_total = Counter(
+    "cache_requests_total", "缓存读取次数", ["prefix", "tier", "result"]
+)
+db_pool_checkout_seconds = Histogram(
+    "db_pool_checkout_seconds", "数据库连接池取连接耗时", buckets=POOL_BUCKETS
+)
+generation_stage_seconds = Histogram(
+    "itinerary_generation_stage_seconds", "攻略生成各阶段耗时", ["stage"], buckets=SLOW_BUCKETS
+)
+
+# 缓存键前缀，按前缀统计命中率
+CACHE_PREFIXES = tuple(
+    value for name, value in vars(Constants).items() if name.startswith("CACHE_PREFIX_")
+)
+
+
+def cache_prefix(key: str) -> str:
+    """缓存键所属的前缀（去掉末尾冒号），未知前缀记为other"""
+    for prefix in CACHE_PREFIXES:
+        if key.startswith(prefix):
+            return prefix.rstrip(":")
+    return "other"
+
+
+def record_cache(name: str, key: str):
+    """记录一次缓存读取，name为l1_hits、l2_misses等分层统计名"""
+    tier, _, result = name.partition("_")
+    if tier in ("l1", "l2"):
+        cache_requests_total.labels(cache_prefix(key), tier, "hit" if result == "hits" else "miss").inc()
+
+
+def observe_llm_tokens(provider: str, model: str, tokens: Optional[int], seconds: float):
+    """记录大模型输出速度，缺少token数或耗时时跳过"""
+    if tokens and seconds > 0:
+        llm_tokens_per_second.labels(provider, model).observe(tokens / seconds)
+
+
+def observe_stage(stage: str, started: float) -> float:
+    """记录生成阶段耗时，返回当前时间作为下一阶段的起点"""
+    now = time.perf_counter()
+    generation_stage_seconds.labels(stage).observe(now - started)
+    return now
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """导出指标，多进程模式下汇总所有进程"""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead():
+    """进程退出时清理多进程模式下本进程的实时指标文件"""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        multiprocess.mark_process_dead(os.getpid())
@@ -0,0 +1,172 @@
+"""
+分布式令牌桶限流 - 基于Redis Lua脚本的原子扣减
+"""
+import asyncio
+import time
+from typing import Any, Dict, List, Optional, Tuple
+import structlog
+
+from app.core.redis import get_redis
+
+logger = structlog.get_logger()
+
+# 多个桶同时检查、要么全部扣减要么都不扣减，使用Redis服务端时钟
+# KEYS: 各桶的键；ARGV: 请求令牌数, 然后每个桶依次为 容量, 每秒补充数
+# 返回: {是否放行, 各桶剩余令牌(字符串), 需等待秒数(字符串)}
+TOKEN_BUCKET_SCRIPT = """
+local requested = tonumber(ARGV[1])
+local clock = redis.call("TIME")
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+
+local levels = {}
+local wait = 0
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[i * 2])
+    local rate = tonumber(ARGV[i * 2 + 1])
+    local bucket = redis.call("HMGET", key, "tokens", "ts")
+    local tokens = tonumber(bucket[1])
+    local ts = tonumber(bucket[2])
+    if tokens == nil then
+        tokens = capacity
+        ts = now
+    end
+    tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+    levels[i] = tokens
+    if tokens < requested then
+        wait = math.max(wait, (requested - tokens) / rate)
+    end
+end
+
+local allowed = 0
+if wait == 0 then
+    allowed = 1
+end
+
+local result = {allowed}
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[i * 2])
+    local rate = tonumber(ARGV[i * 2 + 1])
+    if allowed == 1 then
+        levels[i] = levels[i] - requested
+    end
+    redis.call("HSET", key, "tokens", levels[i], "ts", now)
+    redis.call("EXPIRE", key, math.ceil(capacity / rate) + 1)
+    result[#result + 1] = tostring(levels[i])
+end
+result[#result + 1] = tostring(wait)
+return result
+"""
+
+
+class RateLimitExceeded(Exception):
+    """在等待期限内未能获得令牌"""
+
+    def __init__(self, name: str, key: str, retry_after: float):
+        self.name = name
+        self.key = key
+        self.retry_after = retry_after
+        super().__init__(f"请求过于频繁({name}:{key})，请{retry_after:.1f}秒后重试")
+
+
+class RateLimiter:
+    """令牌桶限流器
+
+    每个限流策略由若干档位组成，每档为 (period秒内最多limit次)，
+    对应一个容量为limit、每秒补充limit/period的令牌桶，各档同时满足才放行。
+    同一策略下按key（接口、用户、提供商等）分别计数，跨进程共享。
+    """
+
+    def __init__(self):
+        self._policies: Dict[str, List[Tuple[int, float]]] = {}
+        self._keys: Dict[str, set] = {}
+
+    def register(self, name: str, bands: List[Tuple[int, float]], track_keys: bool = True):
+        """注册限流策略，limit<=0的档位视为不限制
+
+        track_keys为True时记录用到的key供get_stats汇总，
+        按用户/IP等数量不受控的key限流时应关闭。
+        """
+        self._policies[name] = [(limit, period) for limit, period in bands if limit > 0]
+        if track_keys:
+            self._keys.setdefault(name, set())
+
+    def _bucket_key(self, name: str, key: str, period: float) -> str:
+        return f"ratelimit:{name}:{key}:{int(period)}"
+
+    async def _eval(self, name: str, key: str, tokens: int) -> Tuple[bool, List[float], float]:
+        """执行令牌桶脚本"""
+        bands = self._policies[name]
+        keys = [self._bucket_key(name, key, period) for _, period in bands]
+        args: List[Any] = [tokens]
+        for limit, period in bands:
+            args.extend([limit, limit / period])
+
+        client = await get_redis()
+        result = await client.eval(TOKEN_BUCKET_SCRIPT, len(keys), *keys, *args)
+        levels = [float(level) for level in result[1:-1]]
+        return bool(int(result[0])), levels, float(result[-1])
+
+    async def try_acquire(self, name: str, key: str, tokens: int = 1) -> Tuple[bool, float]:
+        """尝试获取令牌，返回(是否放行, 需等待秒数)
+
+        策略未注册、无限制或Redis不可用时直接放行。
+        """
+        if not self._policies.get(name):
+            return True, 0.0
+
+        if name in self._keys:
+            self._keys[name].add(key)
+        try:
+            allowed, _, wait = await self._eval(name, key, tokens)
+            return allowed, wait
+        except Exception as e:
+            logger.error("限流检查失败", name=name, key=key, error=str(e))
+            return True, 0.0
+
+    async def acquire(
+        self,
+        name: str,
+        key: str,
+        tokens: int = 1,
+        timeout: Optional[float] = None
+    ):
+        """获取令牌，超限时排队等待，到期仍无法获得则抛出RateLimitExceeded"""
+        deadline = time.monotonic() + (timeout or 0)
+        while True:
+            allowed, wait = await self.try_acquire(name, key, tokens)
+            if allowed:
+                return
+
+            remaining = deadline - time.monotonic()
+            if wait > remaining:
+                # 等到期限也补不够令牌（如日配额耗尽），不必空等
+                raise RateLimitExceeded(name, key, wait)
+            await asyncio.sleep(wait)
+
+    async def get_levels(self, name: str, key: str) -> Dict[str, Any]:
+        """查看桶的当前令牌数（不扣减）"""
+        bands = self._policies.get(name)
+        if not bands:
+            return {}
+
+        _, levels, _ = await self._eval(name, key, 0)
+        return {
+            f"{limit}/{int(period)}s": {"limit": limit, "remaining": int(level)}
+            for (limit, period), level in zip(bands, levels)
+        }
+
+    async def get_stats(self) -> Dict[str, Any]:
+        """本进程用到过的所有桶的当前水位"""
+        stats: Dict[str, Any] = {}
+        for name, keys in self._keys.items():
+            stats[name] = {}
+            for key in sorted(keys):
+                try:
+                    stats[name][key] = await self.get_levels(name, key)
+                except Exception as e:
+                    logger.error("获取限流水位失败", name=name, key=key, error=str(e))
+        return stats
+
+
+# 全局限流器实例
+rate_limiter = RateLimiter()
@@ -1,29 +1,58 @@
 """
 Redis连接和缓存管理
 """
+import asyncio
 import json
-import pickle
-from typing import Any, Optional, Union
+import uuid
+from typing import Any, Dict, Iterable, List, Optional, Union
 import redis.asyncio as redis
 import structlog
 
+from app.core import tracing
 from app.core.config import settings, Constants
+from app.core.local_cache import LocalCache, TierStats, NEGATIVE_RESULT, is_missing
+from app.core.metrics import cache_prefix
+from app.core.codec import CacheCodec
 
 logger = structlog.get_logger()
 
 # Redis连接池
 redis_pool = None
 
+# 负缓存在Redis中的存储值
+NEGATIVE_MARKER = b"\x00__negative__"
+
+# 一级缓存失效通知频道
+INVALIDATION_CHANNEL = "cache:invalidate"
+
+# 标签集合键前缀，集合成员为打了该标签的缓存键
+TAG_PREFIX = "tag:"
+
+
+def destination_tag(destination: str) -> str:
+    """目的地标签，同一目的地派生的缓存键归入同一标签"""
+    return f"dest:{''.join(destination.split())}"
+
 
 async def init_redis():
     """初始化Redis连接"""
     global redis_pool
     try:
-        redis_pool = redis.ConnectionPool.from_url(
-            settings.REDIS_URL,
-            max_connections=20,
-            decode_responses=False  # 保持二进制数据
-        )
+        if settings.REDIS_URL.startswith("fakeredis://"):
+            # 测试环境使用进程内的fakeredis，无需真实Redis服务
+            import fakeredis.aioredis
+            redis_pool = redis.ConnectionPool(
+                connection_class=fakeredis.aioredis.FakeConnection,
+                server=fakeredis.FakeServer(),
+                max_connections=20,
+                decode_responses=False
+            )
+        else:
+            redis_pool = redis.ConnectionPool.from_url(
+                settings.REDIS_URL,
+                max_connections=20,
+                decode_responses=False  # 保持二进制数据
+            )
         # 测试连接
         redis_client = redis.Redis(connection_pool=redis_pool)
         await redis_client.ping()
@@ -31,6 +60,15 @@ async def init_redis():
     except Exception as e:
         logger.error("Redis连接失败", error=str(e))
         raise
+    
+    await cache.start_invalidation_listener()
+
+
+async def close_redis():
+    """关闭Redis连接"""
+    await cache.stop_invalidation_listener()
+    if redis_pool is not None:
+        await redis_pool.disconnect()
 
 
 async def get_redis() -> redis.Redis:
@@ -39,28 +77,65 @@ async def get_redis() -> redis.Redis:
 
 
 class CacheManager:
-    """缓存管理器"""
+    """缓存管理器
+    
+    两级缓存：进程内LRU（L1）在前，Redis（L2）在后。
+    写入和删除通过Redis pub/sub通知其他进程失效各自的L1。
+    """
     
     def __init__(self):
         self.default_ttl = settings.REDIS_CACHE_TTL
+        self.local = (
+            LocalCache(settings.CACHE_L1_MAX_SIZE, settings.CACHE_L1_TTL)
+            if settings.CACHE_L1_ENABLED else None
+        )
+        self.stats = TierStats()
+        self.codec = CacheCodec(
+            serializer=settings.CACHE_SERIALIZER,
+            compressor=settings.CACHE_COMPRESSION,
+            threshold=settings.CACHE_COMPRESS_THRESHOLD
+        )
+        self.instance_id = uuid.uuid4().hex
+        self._listener_task: Optional[asyncio.Task] = None
     
     async def get_client(self) -> redis.Redis:
         """获取Redis客户端"""
         return await get_redis()
     
     async def get(self, key: str, default: Any = None) -> Any:
-        """获取缓存值"""
+        """获取缓存值
+        
+        命中负缓存时返回NEGATIVE_RESULT（布尔值为False）。
+        """
+        if self.local is not None:
+            value = self.local.get(key)
+            if not is_missing(value):
+                self.stats.incr("l1_hits", key)
+                if value is NEGATIVE_RESULT:
+                    self.stats.incr("negative_hits")
+                return value
+            self.stats.incr("l1_misses", key)
+        
         try:
-            client = await self.get_client()
-            value = await client.get(key)
+            # 一级缓存命中只是内存读取，不单独记录span
+            with tracing.span("cache.get", **{"cache.prefix": cache_prefix(key)}) as cache_span:
+                client = await self.get_client()
+                value = await client.get(key)
+                cache_span.set_attribute("cache.hit", value is not None)
             if value is None:
+                self.stats.incr("l2_misses", key)
                 return default
+            self.stats.incr("l2_hits", key)
             
-            # 尝试解析JSON，失败则使用pickle
-            try:
-                return json.loads(value)
-            except (json.JSONDecodeError, TypeError):
-                return pickle.loads(value)
+            if value == NEGATIVE_MARKER:
+                self.stats.incr("negative_hits")
+                result = NEGATIVE_RESULT
+            else:
+                result = self.codec.decode(value)
+            
+            if self.local is not None:
+                self.local.set(key, result)
+            return result
         except Exception as e:
             logger.error("缓存获取失败", key=key, error=str(e))
             return default
@@ -70,35 +145,163 @@ class CacheManager:
         key: str, 
         value: Any, 
         ttl: Optional[int] = None,
-        serialize_method: str = "json"
+        tags: Optional[Iterable[str]] = None
     ) -> bool:
-        """设置缓存值"""
+        """设置缓存值，tags用于按标签批量失效"""
         try:
             client = await self.get_client()
             ttl = ttl or self.default_ttl
+            # 一级缓存保存编解码后的副本，与从Redis读回的值一致
+            serialized_value, local_value = self.codec.encode_with_copy(value)
             
-            # 序列化数据
-            if serialize_method == "json":
-                try:
-                    serialized_value = json.dumps(value, ensure_ascii=False)
-                except (TypeError, ValueError):
-                    # JSON序列化失败，使用pickle
-                    serialized_value = pickle.dumps(value)
-            else:
-                serialized_value = pickle.dumps(value)
+            async with client.pipeline(transaction=False) as pipe:
+                pipe.setex(key, ttl, serialized_value)
+                self._queue_tags(pipe, key, ttl, tags)
+                self._queue_invalidation(pipe, "key", key)
+                await pipe.execute()
             
-            await client.setex(key, ttl, serialized_value)
+            if self.local is not None:
+                self.local.set(key, local_value, ttl)
             return True
         except Exception as e:
             logger.error("缓存设置失败", key=key, error=str(e))
             return False
     
+    async def get_many(self, keys: List[str]) -> Dict[str, Any]:
+        """批量获取缓存值，L1未命中的键通过一次MGET读取
+        
+        只返回命中的键；负缓存命中的值为NEGATIVE_RESULT。
+        """
+        found: Dict[str, Any] = {}
+        missing: List[str] = []
+        for key in dict.fromkeys(keys):
+            if self.local is not None:
+                value = self.local.get(key)
+                if not is_missing(value):
+                    self.stats.incr("l1_hits", key)
+                    if value is NEGATIVE_RESULT:
+                        self.stats.incr("negative_hits")
+                    found[key] = value
+                    continue
+                self.stats.incr("l1_misses", key)
+            missing.append(key)
+        
+        if not missing:
+            return found
+        
+        try:
+            with tracing.span("cache.get_many", **{"cache.keys": len(missing), "cache.l1_hits": len(found)}) as cache_span:
+                client = await self.get_client()
+                values = await client.mget(missing)
+                cache_span.set_attribute("cache.l2_hits", sum(value is not None for value in values))
+        except Exception as e:
+            logger.error("批量缓存获取失败", keys=len(missing), error=str(e))
+            return found
+        
+        for key, value in zip(missing, values):
+            if value is None:
+                self.stats.incr("l2_misses", key)
+                continue
+            self.stats.incr("l2_hits", key)
+            
+            if value == NEGATIVE_MARKER:
+                self.stats.incr("negative_hits")
+                result = NEGATIVE_RESULT
+            else:
+                try:
+                    result = self.codec.decode(value)
+                except Exception as e:
+                    logger.error("缓存解码失败", key=key, error=str(e))
+                    continue
+            
+            found[key] = result
+            if self.local is not None:
+                self.local.set(key, result)
+        return found
+    
+    async def set_many(
+        self,
+        mapping: Dict[str, Any],
+        ttl: Optional[int] = None,
+        tags: Optional[Iterable[str]] = None
+    ) -> bool:
+        """批量设置缓存值，一次pipeline往返"""
+        if not mapping:
+            return True
+        try:
+            client = await self.get_client()
+            ttl = ttl or self.default_ttl
+            
+            local_values = {}
+            async with client.pipeline(transaction=False) as pipe:
+                for key, value in mapping.items():
+                    serialized_value, local_values[key] = self.codec.encode_with_copy(value)
+                    pipe.setex(key, ttl, serialized_value)
+                    self._queue_tags(pipe, key, ttl, tags)
+                self._queue_invalidation(pipe, "keys", list(mapping))
+                await pipe.execute()
+            
+            if self.local is not None:
+                for key, value in local_values.items():
+                    self.local.set(key, value, ttl)
+            return True
+        except Exception as e:
+            logger.error("批量缓存设置失败", keys=len(mapping), error=str(e))
+            return False
+    
+    async def delete_many(self, keys: List[str]) -> int:
+        """批量删除缓存，返回删除的键数"""
+        if not keys:
+            return 0
+        try:
+            if self.local is not None:
+                for key in keys:
+                    self.local.delete(key)
+            client = await self.get_client()
+            async with client.pipeline(transaction=False) as pipe:
+                pipe.unlink(*keys)
+                self._queue_invalidation(pipe, "keys", list(keys))
+                results = await pipe.execute()
+            return results[0]
+        except Exception as e:
+            logger.error("批量缓存删除失败", keys=len(keys), error=str(e))
+            return 0
+    
+    async def set_negative(
+        self,
+        key: str,
+        ttl: Optional[int] = None,
+        tags: Optional[Iterable[str]] = None
+    ) -> bool:
+        """写入负缓存，标记上游确认无结果，避免短时间内重复查询"""
+        try:
+            client = await self.get_client()
+            ttl = ttl or settings.CACHE_NEGATIVE_TTL
+            
+            async with client.pipeline(transaction=False) as pipe:
+                pipe.setex(key, ttl, NEGATIVE_MARKER)
+                self._queue_tags(pipe, key, ttl, tags)
+                self._queue_invalidation(pipe, "key", key)
+                await pipe.execute()
+            
+            if self.local is not None:
+                self.local.set(key, NEGATIVE_RESULT, ttl)
+            return True
+        except Exception as e:
+            logger.error("负缓存设置失败", key=key, error=str(e))
+            return False
+    
     async def delete(self, key: str) -> bool:
         """删除缓存"""
         try:
+            if self.local is not None:
+                self.local.delete(key)
             client = await self.get_client()
-            result = await client.delete(key)
-            return result > 0
+            async with client.pipeline(transaction=False) as pipe:
+                pipe.delete(key)
+                self._queue_invalidation(pipe, "key", key)
+                results = await pipe.execute()
+            return results[0] > 0
         except Exception as e:
             logger.error("缓存删除失败", key=key, error=str(e))
             return False
@@ -115,24 +318,97 @@ class CacheManager:
     async def expire(self, key: str, ttl: int) -> bool:
         """设置缓存过期时间"""
         try:
+            if self.local is not None:
+                self.local.delete(key)
             client = await self.get_client()
-            return bool(await client.expire(key, ttl))
+            async with client.pipeline(transaction=False) as pipe:
+                pipe.expire(key, ttl)
+                self._queue_invalidation(pipe, "key", key)
+                results = await pipe.execute()
+            return bool(results[0])
         except Exception as e:
             logger.error("缓存过期时间设置失败", key=key, error=str(e))
             return False
     
-    async def clear_pattern(self, pattern: str) -> int:
-        """批量删除匹配模式的缓存"""
+    async def clear_pattern(self, pattern: str, batch_size: Optional[int] = None) -> int:
+        """批量删除匹配模式的缓存
+        
+        用SCAN游标分批遍历并UNLINK（后台释放内存），不会长时间阻塞Redis。
+        """
+        batch_size = batch_size or settings.CACHE_SCAN_BATCH_SIZE
         try:
+            if self.local is not None:
+                self.local.delete_pattern(pattern)
             client = await self.get_client()
-            keys = await client.keys(pattern)
-            if keys:
-                return await client.delete(*keys)
-            return 0
+            await self._publish_invalidation("pattern", pattern)
+            
+            deleted = 0
+            batch: List[bytes] = []
+            async for key in client.scan_iter(match=pattern, count=batch_size):
+                batch.append(key)
+                if len(batch) >= batch_size:
+                    deleted += await client.unlink(*batch)
+                    batch = []
+            if batch:
+                deleted += await client.unlink(*batch)
+            return deleted
         except Exception as e:
             logger.error("批量删除缓存失败", pattern=pattern, error=str(e))
             return 0
     
+    def _queue_tags(self, pipe, key: str, ttl: int, tags: Optional[Iterable[str]]):
+        """在pipeline中登记键的标签
+        
+        标签集合的过期时间取其成员中最长的TTL（EXPIRE NX/GT，需Redis 7），
+        集合过期时成员键也都已过期。
+        """
+        for tag in tags or ():
+            tag_key = f"{TAG_PREFIX}{tag}"
+            pipe.sadd(tag_key, key)
+            pipe.expire(tag_key, ttl, nx=True)
+            pipe.expire(tag_key, ttl, gt=True)
+    
+    async def invalidate_tags(self, *tags: str, batch_size: Optional[int] = None) -> int:
+        """删除打了指定标签的所有缓存键，耗时与标签下的键数成正比"""
+        batch_size = batch_size or settings.CACHE_SCAN_BATCH_SIZE
+        deleted = 0
+        try:
+            client = await self.get_client()
+            for tag in tags:
+                tag_key = f"{TAG_PREFIX}{tag}"
+                # 先改名再遍历，遍历期间新写入的键登记到新集合，不会被误删
+                pending_key = f"{tag_key}:deleting:{uuid.uuid4().hex}"
+                try:
+                    await client.rename(tag_key, pending_key)
+                except redis.ResponseError:
+                    # 标签集合不存在
+                    continue
+                
+                async for batch in self._sscan_batches(client, pending_key, batch_size):
+                    if self.local is not None:
+                        for key in batch:
+                            self.local.delete(key.decode())
+                    async with client.pipeline(transaction=False) as pipe:
+                        pipe.unlink(*batch)
+                        self._queue_invalidation(pipe, "keys", [key.decode() for key in batch])
+                        results = await pipe.execute()
+                    deleted += results[0]
+                await client.unlink(pending_key)
+            return deleted
+        except Exception as e:
+            logger.error("按标签删除缓存失败", tags=tags, error=str(e))
+            return deleted
+    
+    async def _sscan_batches(self, client: redis.Redis, key: str, batch_size: int):
+        """分批遍历集合成员"""
+        cursor = 0
+        while True:
+            cursor, members = await client.sscan(key, cursor=cursor, count=batch_size)
+            if members:
+                yield members
+            if cursor == 0:
+                break
+    
     async def get_hash(self, key: str, field: str, default: Any = None) -> Any:
         """获取哈希字段值"""
         try:
@@ -140,11 +416,7 @@ class CacheManager:
             value = await client.hget(key, field)
             if value is None:
                 return default
-            
-            try:
-                return json.loads(value)
-            except (json.JSONDecodeError, TypeError):
-                return pickle.loads(value)
+            return self.codec.decode(value)
         except Exception as e:
             logger.error("哈希缓存获取失败", key=key, field=field, error=str(e))
             return default
@@ -160,16 +432,14 @@ class CacheManager:
         try:
             client = await self.get_client()
             
-            # 序列化数据
-            try:
-                serialized_value = json.dumps(value, ensure_ascii=False)
-            except (TypeError, ValueError):
-                serialized_value = pickle.dumps(value)
-            
-            await client.hset(key, field, serialized_value)
+            serialized_value = self.codec.encode(value)
             
-            if ttl:
-                await client.expire(key, ttl)
+            # HSET和EXPIRE在同一事务中发出，不会留下没有过期时间的哈希
+            async with client.pipeline(transaction=True) as pipe:
+                pipe.hset(key, field, serialized_value)
+                if ttl:
+                    pipe.expire(key, ttl)
+                await pipe.execute()
             
             return True
         except Exception as e:
@@ -186,6 +456,87 @@ class CacheManager:
             logger.error("哈希缓存删除失败", key=key, field=field, error=str(e))
             return False
     
+    # 一级缓存失效通知
+    def _invalidation_message(self, op: str, target: Union[str, List[str]]) -> str:
+        """构造失效消息，带上本进程ID以忽略自己发出的通知"""
+        return json.dumps({"origin": self.instance_id, "op": op, "target": target}, ensure_ascii=False)
+    
+    def _queue_invalidation(self, pipe, op: str, target: Union[str, List[str]]):
+        """在pipeline中追加失效通知，与写操作同一次往返发出"""
+        if self.local is not None:
+            pipe.publish(INVALIDATION_CHANNEL, self._invalidation_message(op, target))
+    
+    async def _publish_invalidation(self, op: str, target: str):
+        """单独发送失效通知"""
+        if self.local is None:
+            return
+        client = await self.get_client()
+        await client.publish(INVALIDATION_CHANNEL, self._invalidation_message(op, target))
+    
+    def _apply_invalidation(self, data: Union[bytes, str]):
+        """处理其他进程发来的失效通知"""
+        try:
+            message = json.loads(data)
+        except (json.JSONDecodeError, TypeError):
+            return
+        if message.get("origin") == self.instance_id:
+            return
+        
+        if message.get("op") == "pattern":
+            self.local.delete_pattern(message["target"])
+        elif message.get("op") == "keys":
+            for key in message["target"]:
+                self.local.delete(key)
+        else:
+            self.local.delete(message["target"])
+    
+    async def start_invalidation_listener(self):
+        """启动失效通知订阅"""
+        if self.local is None or self._listener_task is not None:
+            return
+        self._listener_task = asyncio.create_task(self._listen_invalidations())
+    
+    async def stop_invalidation_listener(self):
+        """停止失效通知订阅"""
+        if self._listener_task is None:
+            return
+        self._listener_task.cancel()
+        try:
+            await self._listener_task
+        except asyncio.CancelledError:
+            pass
+        self._listener_task = None
+    
+    async def _listen_invalidations(self):
+        """订阅失效频道，断线后清空L1并重连"""
+        while True:
+            pubsub = None
+            try:
+                client = await self.get_client()
+                pubsub = client.pubsub()
+                await pubsub.subscribe(INVALIDATION_CHANNEL)
+                async for message in pubsub.listen():
+                    if message.get("type") == "message":
+                        self._apply_invalidation(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("缓存失效订阅中断", error=str(e))
+                # 断线期间可能漏掉失效通知，清空L1保证一致
+                self.local.clear()
+                await asyncio.sleep(1)
+            finally:
+                if pubsub is not None:
+                    await pubsub.reset()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取分层缓存命中统计（当前进程）"""
+        stats = self.stats.snapshot()
+        stats["l1_enabled"] = self.local is not None
+        stats["l1_size"] = len(self.local) if self.local is not None else 0
+        stats["codec"] = self.codec.name
+        return stats
+    
     # 业务相关的缓存方法
     def get_user_cache_key(self, user_id: int) -> str:
         """获取用户缓存键"""
@@ -217,11 +568,12 @@ class CacheManager:
         self, 
         prompt_hash: str, 
         response: str, 
-        ttl: int = 3600 * 24  # 24小时
+        ttl: int = 3600 * 24,  # 24小时
+        tags: Optional[Iterable[str]] = None
     ):
         """缓存AI响应"""
         key = self.get_ai_response_cache_key(prompt_hash)
-        return await self.set(key, response, ttl)
+        return await self.set(key, response, ttl, tags=tags)
     
     async def get_ai_response(self, prompt_hash: str) -> Optional[str]:
         """获取AI响应缓存"""
@@ -232,16 +584,33 @@ class CacheManager:
         self, 
         location: str, 
         map_data: dict, 
-        ttl: int = 3600 * 24 * 7  # 7天
+        ttl: int = 3600 * 24 * 7,  # 7天
+        tags: Optional[Iterable[str]] = None
     ):
         """缓存地图数据"""
         key = self.get_map_data_cache_key(location)
-        return await self.set(key, map_data, ttl)
+        return await self.set(key, map_data, ttl, tags=tags)
     
     async def get_map_data(self, location: str) -> Optional[dict]:
         """获取地图数据缓存"""
         key = self.get_map_data_cache_key(location)
         return await self.get(key)
+    
+    async def get_map_data_many(self, locations: List[str]) -> Dict[str, Any]:
+        """批量获取地图数据缓存，返回 location -> 缓存值（仅命中项）"""
+        keys = {self.get_map_data_cache_key(location): location for location in locations}
+        found = await self.get_many(list(keys))
+        return {keys[key]: value for key, value in found.items()}
+    
+    async def cache_map_miss(
+        self,
+        location: str,
+        ttl: Optional[int] = None,
+        tags: Optional[Iterable[str]] = None
+    ):
+        """缓存地图查询无结果"""
+        key = self.get_map_data_cache_key(location)
+        return await self.set_negative(key, ttl, tags=tags)
 
 
 # 全局缓存管理器实例
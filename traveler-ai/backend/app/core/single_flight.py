@@ -0,0 +1,254 @@
+"""
+请求合并（single-flight）- 相同键的并发调用只执行一次
+"""
+import asyncio
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+import structlog
+
+from app.core.config import settings
+from app.core.redis import get_redis
+
+logger = structlog.get_logger()
+
+# 仅持有者可释放锁，避免误删他人在锁过期后获得的锁
+RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+# 执行者完成时发布通知的频道，所有SingleFlight共用一个模式订阅
+RELEASE_CHANNEL_PATTERN = "singleflight:*:released:*"
+
+
+class _LeaderCancelled(Exception):
+    """执行者被取消，等待者重新竞争执行，不把取消传给并未被取消的等待者"""
+
+
+def _retrieve_exception(future: asyncio.Future):
+    """没有等待者时取走异常，避免“exception was never retrieved”告警"""
+    if not future.cancelled():
+        future.exception()
+
+
+class _ReleaseNotifier:
+    """进程内共享的锁释放通知
+
+    只占用一个Redis连接做模式订阅，收到某个频道的消息时唤醒该频道的所有
+    等待者。等待者阻塞在本地Future上，不占用连接池中的连接。
+    订阅中断时唤醒全部等待者，由其自行检查锁状态。
+    """
+
+    def __init__(self):
+        self._waiters: Dict[str, Set[asyncio.Future]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._ready: Optional[asyncio.Event] = None
+
+    async def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._waiters = {}
+            self._ready = asyncio.Event()
+            self._task = loop.create_task(self._listen())
+        await self._ready.wait()
+
+    async def register(self, channel: str) -> asyncio.Future:
+        """登记等待者，返回在频道收到通知时完成的Future"""
+        await self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(channel, set()).add(future)
+        return future
+
+    async def stop(self):
+        """停止订阅"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self._wake()
+
+    def unregister(self, channel: str, future: asyncio.Future):
+        waiters = self._waiters.get(channel)
+        if waiters is not None:
+            waiters.discard(future)
+            if not waiters:
+                self._waiters.pop(channel, None)
+
+    def _wake(self, channel: Optional[str] = None):
+        channels = [channel] if channel is not None else list(self._waiters)
+        for name in channels:
+            for future in self._waiters.get(name, ()):
+                if not future.done():
+                    future.set_result(None)
+
+    async def _listen(self):
+        """订阅释放频道，断线后唤醒所有等待者并重连"""
+        while True:
+            pubsub = None
+            try:
+                client = await get_redis()
+                pubsub = client.pubsub()
+                await pubsub.psubscribe(RELEASE_CHANNEL_PATTERN)
+                self._ready.set()
+                async for message in pubsub.listen():
+                    if message.get("type") == "pmessage":
+                        channel = message["channel"]
+                        self._wake(channel.decode() if isinstance(channel, bytes) else channel)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("single-flight通知订阅中断", error=str(e))
+                # 订阅建立前失败也放行等待者，改为按间隔检查锁
+                self._ready.set()
+                self._wake()
+                await asyncio.sleep(1)
+            finally:
+                if pubsub is not None:
+                    await pubsub.reset()
+
+
+_notifier = _ReleaseNotifier()
+
+
+async def stop_release_notifier():
+    """关闭锁释放通知的订阅，在关闭Redis连接前调用"""
+    await _notifier.stop()
+
+class SingleFlight:
+    """请求合并器
+
+    进程内：相同键的并发调用共享同一个asyncio Future；执行者被取消时
+    等待者不受影响，由其中一个接替执行。
+    跨进程：通过Redis锁选出一个执行者，其余进程等待锁释放的通知后
+    从缓存读取结果（reader）；读不到（执行者失败或锁过期）时重新抢锁，
+    只有抢到锁的一个等待者重新执行，其余继续等待。
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    def _lock_key(self, key: str) -> str:
+        return f"singleflight:{self.name}:lock:{key}"
+
+    def _release_channel(self, key: str) -> str:
+        return f"singleflight:{self.name}:released:{key}"
+
+    async def do(
+        self,
+        key: str,
+        func: Callable[[], Awaitable[Any]],
+        reader: Optional[Callable[[], Awaitable[Any]]] = None,
+        lock_ttl: Optional[int] = None
+    ) -> Any:
+        """执行或等待相同键的调用
+
+        reader为空时只做进程内合并；否则同时做跨进程合并，
+        此时func需要把结果写入缓存，reader负责从缓存读取。
+        """
+        while True:
+            future = self._inflight.get(key)
+            if future is None:
+                break
+            try:
+                return await asyncio.shield(future)
+            except _LeaderCancelled:
+                # 执行者被取消，第一个重试的等待者成为新的执行者
+                continue
+
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(_retrieve_exception)
+        self._inflight[key] = future
+        try:
+            if reader is None or not settings.SINGLE_FLIGHT_DISTRIBUTED:
+                result = await func()
+            else:
+                result = await self._do_distributed(key, func, reader, lock_ttl)
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.set_exception(_LeaderCancelled())
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            if self._inflight.get(key) is future:
+                self._inflight.pop(key)
+
+    async def _do_distributed(
+        self,
+        key: str,
+        func: Callable[[], Awaitable[Any]],
+        reader: Callable[[], Awaitable[Any]],
+        lock_ttl: Optional[int]
+    ) -> Any:
+        """跨进程合并：抢锁者执行，其余等待锁释放后读取结果，读不到时重新抢锁"""
+        lock_ttl = lock_ttl or settings.SINGLE_FLIGHT_LOCK_TTL
+        lock_key = self._lock_key(key)
+        channel = self._release_channel(key)
+
+        while True:
+            token = uuid.uuid4().hex
+            try:
+                client = await get_redis()
+                acquired = await client.set(lock_key, token, nx=True, ex=lock_ttl)
+            except Exception as e:
+                # Redis不可用时退化为直接执行
+                logger.error("single-flight加锁失败", key=key, error=str(e))
+                return await func()
+
+            if acquired:
+                try:
+                    return await func()
+                finally:
+                    await self._release(client, lock_key, channel, token)
+
+            try:
+                await self._wait_released(client, lock_key, channel, lock_ttl)
+            except Exception as e:
+                logger.error("single-flight等待通知失败", key=key, error=str(e))
+                return await func()
+
+            result = await reader()
+            if result is not None:
+                return result
+            # 执行者失败或锁过期，重新抢锁，只有一个等待者会重新执行
+
+    async def _wait_released(self, client, lock_key: str, channel: str, lock_ttl: int):
+        """等待锁被释放：收到通知、发现锁已不存在或超过锁的有效期"""
+        future = await _notifier.register(channel)
+        deadline = time.monotonic() + lock_ttl
+        try:
+            # 登记后再检查锁，避免在登记前完成的执行者的通知被漏掉
+            while await client.exists(lock_key):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                try:
+                    await asyncio.wait_for(
+                        asyncio.shield(future),
+                        timeout=min(settings.SINGLE_FLIGHT_POLL_INTERVAL, remaining)
+                    )
+                    return
+                except asyncio.TimeoutError:
+                    continue
+        finally:
+            _notifier.unregister(channel, future)
+
+    async def _release(self, client, lock_key: str, channel: str, token: str):
+        """释放锁并通知等待者"""
+        try:
+            async with client.pipeline(transaction=True) as pipe:
+                pipe.eval(RELEASE_LOCK_SCRIPT, 1, lock_key, token)
+                pipe.publish(channel, b"1")
+                await pipe.execute()
+        except Exception as e:
+            logger.error("single-flight释放锁失败", lock_key=lock_key, error=str(e))
@@ -0,0 +1,144 @@
+"""
+基于Redis的异步任务队列
+"""
+import hashlib
+import json
+import os
+import socket
+import uuid
+from typing import Any, Dict, List, Optional, Tuple, Union
+import structlog
+
+from app.core.config import settings
+from app.core.redis import get_redis
+
+logger = structlog.get_logger()
+
+
+class TaskQueue:
+    """Redis列表实现的可靠FIFO任务队列
+
+    生产者LPUSH入队；消费者用BLMOVE把任务原子地移入本消费者的处理中列表，
+    执行结束后ack删除，多个worker进程可以同时消费同一队列。
+    每个消费者定期刷新心跳，心跳过期（进程崩溃或被重新部署）的处理中列表
+    由其他消费者移回队列；同一任务被中断超过QUEUE_MAX_ATTEMPTS次后不再重试，
+    交给调用方处理。
+    """
+
+    def __init__(self, name: str, consumer_id: Optional[str] = None):
+        self.name = name
+        self.queue_key = f"queue:{name}"
+        self.consumers_key = f"queue:{name}:consumers"
+        self.attempts_key = f"queue:{name}:attempts"
+        self.consumer_id = consumer_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.processing_key = self._processing_key(self.consumer_id)
+
+    def _processing_key(self, consumer_id: str) -> str:
+        return f"queue:{self.name}:processing:{consumer_id}"
+
+    def _heartbeat_key(self, consumer_id: str) -> str:
+        return f"queue:{self.name}:heartbeat:{consumer_id}"
+
+    @staticmethod
+    def _message_id(message: bytes) -> str:
+        return hashlib.md5(message).hexdigest()
+
+    async def enqueue(self, payload: Dict[str, Any]) -> int:
+        """任务入队，返回当前队列长度"""
+        client = await get_redis()
+        message = json.dumps(payload, ensure_ascii=False, default=str)
+        length = await client.lpush(self.queue_key, message)
+        logger.info("任务已入队", queue=self.name, queue_length=length)
+        return length
+
+    async def dequeue(self, timeout: int = 1) -> Optional[Tuple[Dict[str, Any], bytes]]:
+        """阻塞出队，返回(任务内容, 原始消息)，超时返回None
+
+        任务同时移入本消费者的处理中列表，执行结束后需用原始消息调用ack。
+        """
+        client = await get_redis()
+        message = await client.blmove(self.queue_key, self.processing_key, timeout, "RIGHT", "LEFT")
+        if message is None:
+            return None
+
+        try:
+            return json.loads(message), message
+        except (json.JSONDecodeError, TypeError) as e:
+            logger.error("任务消息解析失败", queue=self.name, error=str(e))
+            await self.ack(message)
+            return None
+
+    async def ack(self, message: Union[bytes, str]):
+        """任务执行结束，从处理中列表删除"""
+        if isinstance(message, str):
+            message = message.encode()
+        client = await get_redis()
+        async with client.pipeline(transaction=True) as pipe:
+            pipe.lrem(self.processing_key, 1, message)
+            pipe.hdel(self.attempts_key, self._message_id(message))
+            await pipe.execute()
+
+    async def heartbeat(self):
+        """刷新本消费者的心跳"""
+        client = await get_redis()
+        async with client.pipeline(transaction=False) as pipe:
+            pipe.sadd(self.consumers_key, self.consumer_id)
+            pipe.setex(self._heartbeat_key(self.consumer_id), settings.QUEUE_HEARTBEAT_TTL, 1)
+            await pipe.execute()
+
+    async def recover_stale(self) -> List[Dict[str, Any]]:
+        """把心跳过期的消费者的处理中任务移回队列，返回超过重试次数而放弃的任务
+
+        任务先原子地移入本消费者的处理中列表，再在一个事务内放回队列头部，
+        恢复过程中崩溃也不会丢任务。
+        """
+        client = await get_redis()
+        abandoned: List[Dict[str, Any]] = []
+        for member in await client.smembers(self.consumers_key):
+            consumer_id = member.decode() if isinstance(member, bytes) else member
+            if consumer_id == self.consumer_id or await client.exists(self._heartbeat_key(consumer_id)):
+                continue
+
+            stale_key = self._processing_key(consumer_id)
+            while True:
+                message = await client.lmove(stale_key, self.processing_key, "RIGHT", "LEFT")
+                if message is None:
+                    break
+
+                attempts = await client.hincrby(self.attempts_key, self._message_id(message), 1)
+                if attempts < settings.QUEUE_MAX_ATTEMPTS:
+                    async with client.pipeline(transaction=True) as pipe:
+                        # 放回出队的一端，优先重新执行
+                        pipe.rpush(self.queue_key, message)
+                        pipe.lrem(self.processing_key, 1, message)
+                        await pipe.execute()
+                    logger.warning("中断的任务已重新入队", queue=self.name, consumer=consumer_id, attempts=attempts)
+                    continue
+
+                await self.ack(message)
+                try:
+                    abandoned.append(json.loads(message))
+                except (json.JSONDecodeError, TypeError):
+                    pass
+                logger.error("任务多次中断，不再重试", queue=self.name, consumer=consumer_id, attempts=attempts)
+
+            await client.srem(self.consumers_key, consumer_id)
+        return abandoned
+
+    async def release(self):
+        """停止消费：未完成的任务放回队列由其他消费者执行，并注销心跳"""
+        client = await get_redis()
+        requeued = 0
+        while await client.lmove(self.processing_key, self.queue_key, "LEFT", "RIGHT") is not None:
+            requeued += 1
+        async with client.pipeline(transaction=False) as pipe:
+            pipe.srem(self.consumers_key, self.consumer_id)
+            pipe.delete(self._heartbeat_key(self.consumer_id))
+            await pipe.execute()
+        if requeued:
+            logger.info("未完成的任务已放回队列", queue=self.name, count=requeued)
+
+    async def size(self) -> int:
+        """获取队列中等待的任务数"""
+        client = await get_redis()
+        return await client.llen(self.queue_key)
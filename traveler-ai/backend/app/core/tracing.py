@@ -0,0 +1,231 @@
+"""
+链路追踪 - 基于OpenTelemetry的span记录，导出到OTLP采集器或本地JSONL文件
+"""
+import functools
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional, Sequence
+import structlog
+
+from app.core.config import settings
+
+logger = structlog.get_logger()
+
+# OpenTelemetry为可选依赖，缺失时所有span为空操作
+try:
+    from opentelemetry import context as otel_context
+    from opentelemetry import trace
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import ReadableSpan, TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, SpanExporter, SpanExportResult
+    from opentelemetry.sdk.trace.sampling import ParentBasedTraceIdRatio
+    from opentelemetry.trace import Status, StatusCode
+except ImportError:
+    trace = None
+
+# SQL语句写入span时的最大长度
+MAX_STATEMENT_LENGTH = 500
+
+
+class _NoopSpan:
+    """未启用追踪时使用的空span"""
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def set_attributes(self, attributes: Dict[str, Any]):
+        pass
+
+    def record_exception(self, exception: BaseException):
+        pass
+
+    def end(self):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+_provider = None
+
+
+def enabled() -> bool:
+    """追踪是否已启用"""
+    return _provider is not None
+
+
+if trace is not None:
+    class JsonlSpanExporter(SpanExporter):
+        """把span逐行写入本地JSONL文件，离线时也可查看火焰图"""
+
+        def __init__(self, path: str):
+            self.path = path
+            self._lock = threading.Lock()
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+        def export(self, spans: Sequence[ReadableSpan]) -> "SpanExportResult":
+            lines = "".join(span.to_json(indent=None) + "\n" for span in spans)
+            try:
+                with self._lock, open(self.path, "a", encoding="utf-8") as f:
+                    f.write(lines)
+            except OSError:
+                return SpanExportResult.FAILURE
+            return SpanExportResult.SUCCESS
+
+        def shutdown(self):
+            pass
+
+
+def setup_tracing(service_name: str):
+    """初始化追踪并挂载SQLAlchemy钩子，未启用或缺少依赖时跳过"""
+    global _provider
+    if not settings.TRACING_ENABLED or _provider is not None:
+        return
+    if trace is None:
+        logger.warning("未安装opentelemetry-sdk，链路追踪未启用")
+        return
+
+    if settings.TRACING_EXPORTER == "otlp":
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        exporter = OTLPSpanExporter(endpoint=settings.TRACING_OTLP_ENDPOINT)
+    else:
+        exporter = JsonlSpanExporter(settings.TRACING_JSONL_PATH)
+
+    provider = TracerProvider(
+        resource=Resource.create({"service.name": service_name, "service.version": settings.VERSION}),
+        sampler=ParentBasedTraceIdRatio(settings.TRACING_SAMPLE_RATIO)
+    )
+    # 批量导出在后台线程进行，不阻塞事件循环
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+    _provider = provider
+
+    from app.core.database import async_engine
+    instrument_sqlalchemy(async_engine.sync_engine)
+    logger.info("链路追踪已启用", exporter=settings.TRACING_EXPORTER, service=service_name)
+
+
+def shutdown_tracing():
+    """导出剩余的span"""
+    global _provider
+    if _provider is not None:
+        _provider.shutdown()
+        _provider = None
+
+
+def _tracer():
+    return trace.get_tracer("traveler-ai")
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Any]:
+    """以当前span为父节点创建子span，块内的调用自动挂在其下"""
+    if _provider is None:
+        yield NOOP_SPAN
+        return
+    with _tracer().start_as_current_span(name, attributes=clean_attributes(attributes)) as current:
+        yield current
+
+
+def start_span(name: str, **attributes) -> Any:
+    """创建span但不设为当前span，需手动end；用于跨越yield的异步生成器"""
+    if _provider is None:
+        return NOOP_SPAN
+    return _tracer().start_span(name, attributes=clean_attributes(attributes))
+
+
+def current_span() -> Any:
+    """当前span，用于补充属性"""
+    if _provider is None:
+        return NOOP_SPAN
+    return trace.get_current_span()
+
+
+def traced(name: str):
+    """异步函数装饰器：整个调用记为一个span"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with span(name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def clean_attributes(attributes: Dict[str, Any]) -> Dict[str, Any]:
+    """span属性只能是基本类型，去掉None并把其他类型转为字符串"""
+    return {
+        key: value if isinstance(value, (str, bool, int, float)) else str(value)
+        for key, value in attributes.items()
+        if value is not None
+    }
+
+
+class StageSpans:
+    """顺序执行的阶段span
+
+    切换到新阶段时结束上一阶段，阶段内的调用（含gather派生的任务）自动挂在当前阶段下。
+    """
+
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        self._span = None
+        self._token = None
+
+    def switch(self, stage: str):
+        """结束上一阶段并开始新阶段"""
+        self.close()
+        if _provider is None:
+            return
+        self._span = _tracer().start_span(f"{self.prefix}.{stage}")
+        self._token = otel_context.attach(trace.set_span_in_context(self._span))
+
+    def close(self, error: Optional[BaseException] = None):
+        """结束当前阶段，可重复调用"""
+        if self._span is None:
+            return
+        if error is not None:
+            self._span.record_exception(error)
+            self._span.set_status(Status(StatusCode.ERROR, str(error)))
+        otel_context.detach(self._token)
+        self._span.end()
+        self._span = None
+        self._token = None
+
+
+def instrument_sqlalchemy(engine):
+    """为每条SQL记录span（语句、耗时、错误）"""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        current = _tracer().start_span(
+            "db.query",
+            attributes={
+                "db.system": "postgresql",
+                "db.statement": statement[:MAX_STATEMENT_LENGTH],
+                "db.executemany": executemany,
+            }
+        )
+        context._trace_span = current
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        current = getattr(context, "_trace_span", None)
+        if current is not None:
+            if cursor.rowcount is not None and cursor.rowcount >= 0:
+                current.set_attribute("db.rowcount", cursor.rowcount)
+            current.end()
+            context._trace_span = None
+
+    @event.listens_for(engine, "handle_error")
+    def _error(exception_context):
+        context = exception_context.execution_context
+        current = getattr(context, "_trace_span", None) if context is not None else None
+        if current is not None:
+            current.record_exception(exception_context.original_exception)
+            current.set_status(Status(StatusCode.ERROR, str(exception_context.original_exception)))
+            current.end()
+            context._trace_span = None
@@ -4,17 +4,27 @@
 from fastapi import FastAPI, Request, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from fastapi.exceptions import RequestValidationError
 from starlette.exceptions import HTTPException as StarletteHTTPException
+import asyncio
 import structlog
 import time
 import uuid
 
+from app.core import metrics, tracing
 from app.core.config import settings
 from app.api.v1.router import api_router
 from app.core.database import init_db
-from app.core.redis import init_redis
+from app.core.redis import init_redis, close_redis, cache
+from app.core.http_client import init_http_clients, close_http_clients, http_clients
+from app.core.rate_limiter import rate_limiter, RateLimitExceeded
+from app.core.single_flight import stop_release_notifier
+from app.services.generation_worker import generation_worker
+from app.services.poi_warehouse import poi_warehouse
+from app.services.template_registry import template_registry
+from app.services.ai_service import ai_service
+from app.services.baidu_map_service import baidu_map_service
 from app.utils.logging import setup_logging
 
 # 设置结构化日志
@@ -46,6 +56,40 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 按客户端限制API请求频率
+rate_limiter.register("api", [
+    (settings.RATE_LIMIT_PER_MINUTE, 60),
+    (settings.RATE_LIMIT_PER_HOUR, 3600),
+    (settings.RATE_LIMIT_PER_DAY, 86400),
+], track_keys=False)
+
+@app.middleware("http")
+async def rate_limit(request: Request, call_next):
+    """API请求限流，超限时短暂排队，仍超限则返回429"""
+    if not request.url.path.startswith(settings.API_V1_STR):
+        return await call_next(request)
+    
+    client_key = request.client.host if request.client else "unknown"
+    try:
+        await rate_limiter.acquire("api", client_key, timeout=settings.RATE_LIMIT_QUEUE_TIMEOUT)
+    except RateLimitExceeded as e:
+        retry_after = max(1, int(e.retry_after + 0.999))
+        return JSONResponse(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            headers={"Retry-After": str(retry_after)},
+            content={
+                "success": False,
+                "error": {
+                    "code": "RATE_LIMIT_EXCEEDED",
+                    "message": "请求过于频繁，请稍后重试",
+                    "details": {"retry_after": retry_after}
+                },
+                "timestamp": time.time(),
+                "request_id": getattr(request.state, "request_id", "unknown")
+            }
+        )
+    return await call_next(request)
+
 # 请求ID和日志中间件
 @app.middleware("http")
 async def add_request_id_and_logging(request: Request, call_next):
@@ -53,28 +97,40 @@ async def add_request_id_and_logging(request: Request, call_next):
     request_id = str(uuid.uuid4())
     request.state.request_id = request_id
     
+    # 绑定到上下文，本请求内（含派生的任务）的日志自动带上request_id
+    structlog.contextvars.clear_contextvars()
+    structlog.contextvars.bind_contextvars(request_id=request_id)
+    
     start_time = time.time()
     
     # 记录请求开始
     logger.info(
         "请求开始",
-        request_id=request_id,
         method=request.method,
         url=str(request.url),
         client_ip=request.client.host if request.client else None
     )
     
-    response = await call_next(request)
+    with tracing.span("http.request", **{"http.method": request.method, "http.target": request.url.path}) as request_span:
+        response = await call_next(request)
+        request_span.set_attribute("http.status_code", response.status_code)
     
     # 记录请求完成
     process_time = time.time() - start_time
     logger.info(
         "请求完成",
-        request_id=request_id,
         status_code=response.status_code,
         process_time=round(process_time, 4)
     )
     
+    # 按路由模板统计，避免路径参数造成标签爆炸
+    route = request.scope.get("route")
+    metrics.http_request_seconds.labels(
+        request.method,
+        route.path if route else "unmatched",
+        str(response.status_code)
+    ).observe(process_time)
+    
     response.headers["X-Request-ID"] = request_id
     return response
 
@@ -86,7 +142,6 @@ async def http_exception_handler(request: Request, exc: StarletteHTTPException):
     
     logger.error(
         "HTTP异常",
-        request_id=request_id,
         status_code=exc.status_code,
         detail=exc.detail
     )
@@ -112,7 +167,6 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
     
     logger.error(
         "请求验证失败",
-        request_id=request_id,
         errors=exc.errors()
     )
     
@@ -137,7 +191,6 @@ async def general_exception_handler(request: Request, exc: Exception):
     
     logger.error(
         "服务器内部错误",
-        request_id=request_id,
         exception=str(exc),
         exc_info=True
     )
@@ -167,9 +220,25 @@ async def health_check():
         "status": "healthy",
         "service": settings.PROJECT_NAME,
         "version": settings.VERSION,
+        "http_pools": http_clients.get_pool_stats(),
+        "cache": cache.get_stats(),
+        "rate_limits": await rate_limiter.get_stats(),
+        "poi_warehouse": poi_warehouse.get_stats(),
+        "templates": template_registry.get_stats(),
+        "route_matrix": baidu_map_service.get_route_stats(),
+        "ai_routing": ai_service.router.get_stats(),
         "timestamp": time.time()
     }
 
+# 监控指标端点
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus指标，多worker部署时汇总所有进程"""
+    if not settings.METRICS_ENABLED:
+        return Response(status_code=status.HTTP_404_NOT_FOUND)
+    body, content_type = await asyncio.to_thread(metrics.render_metrics)
+    return Response(content=body, media_type=content_type)
+
 # 启动和关闭事件
 @app.on_event("startup")
 async def startup_event():
@@ -180,10 +249,25 @@ async def startup_event():
     await init_db()
     logger.info("数据库连接已初始化")
     
+    # 启用链路追踪（TRACING_ENABLED）
+    tracing.setup_tracing("traveler-ai-api")
+    
     # 初始化Redis连接
     await init_redis()
     logger.info("Redis连接已初始化")
     
+    # 初始化上游HTTP连接池
+    await init_http_clients()
+    logger.info("HTTP连接池已初始化")
+    
+    # 启动POI写回、模板使用次数写回
+    await poi_warehouse.start()
+    await template_registry.start()
+    
+    # 启动进程内攻略生成worker（独立部署时使用 python -m app.worker）
+    if settings.GENERATION_WORKER_ENABLED:
+        await generation_worker.start()
+    
     logger.info(f"{settings.PROJECT_NAME} v{settings.VERSION} 启动完成")
 
 @app.on_event("shutdown")
@@ -191,8 +275,22 @@ async def shutdown_event():
     """应用关闭事件"""
     logger.info("正在关闭应用服务...")
     
-    # 这里可以添加清理资源的代码
+    # 停止攻略生成worker
+    await generation_worker.stop()
+    
+    # 写完剩余的POI和模板使用次数
+    await poi_warehouse.stop()
+    await template_registry.stop()
+    
+    # 关闭上游HTTP连接池
+    await close_http_clients()
+    
+    # 关闭Redis连接
+    await stop_release_notifier()
+    await close_redis()
     
+    tracing.shutdown_tracing()
+    metrics.mark_process_dead()
     logger.info("应用服务已关闭")
 
 if __name__ == "__main__":
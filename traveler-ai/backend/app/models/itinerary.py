@@ -1,7 +1,7 @@
 """
 旅游攻略数据模型
 """
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, JSON, ForeignKey, Float, Enum
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, JSON, ForeignKey, Float, Enum, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 import enum
@@ -55,6 +55,11 @@ class Itinerary(Base):
     generation_prompt = Column(Text, comment="生成提示词")
     generation_config = Column(JSON, comment="生成配置")
     
+    # 复用信息
+    fingerprint = Column(String(32), comment="归一化请求指纹")
+    reuse_type = Column(String(20), comment="复用方式")  # clone、warm_start，新生成为空
+    source_itinerary_id = Column(Integer, comment="复用的源攻略ID")
+    
     # 状态信息
     status = Column(Enum(ItineraryStatus), default=ItineraryStatus.PENDING, comment="攻略状态")
     progress = Column(Integer, default=0, comment="生成进度(0-100)")
@@ -90,6 +95,11 @@ class Itinerary(Base):
     user = relationship("User", back_populates="itineraries")
     itinerary_days = relationship("ItineraryDay", back_populates="itinerary", cascade="all, delete-orphan")
     
+    # 索引
+    __table_args__ = (
+        Index('idx_itinerary_fingerprint', 'fingerprint', 'completed_at'),
+    )
+    
     def __repr__(self):
         return f"<Itinerary(id={self.id}, title='{self.title}', destination='{self.destination}')>"
     
@@ -111,6 +121,8 @@ class Itinerary(Base):
             "season": self.season,
             "ai_provider": self.ai_provider,
             "ai_model": self.ai_model,
+            "reuse_type": self.reuse_type,
+            "source_itinerary_id": self.source_itinerary_id,
             "status": self.status.value if self.status else None,
             "progress": self.progress,
             "error_message": self.error_message,
@@ -215,6 +227,11 @@ class ItineraryDay(Base):
     # 关联关系
     itinerary = relationship("Itinerary", back_populates="itinerary_days")
     
+    # 索引
+    __table_args__ = (
+        Index('uq_itinerary_day_number', 'itinerary_id', 'day_number', unique=True),
+    )
+    
     def __repr__(self):
         return f"<ItineraryDay(id={self.id}, itinerary_id={self.itinerary_id}, day_number={self.day_number})>"
     
@@ -19,6 +19,7 @@ class Location(Base):
     # 地理坐标
     latitude = Column(Float, nullable=False, comment="纬度")
     longitude = Column(Float, nullable=False, comment="经度")
+    geohash = Column(String(12), comment="Geohash编码")
     
     # 地理层级
     country = Column(String(100), comment="国家")
@@ -63,8 +64,10 @@ class Location(Base):
     # 创建地理位置索引
     __table_args__ = (
         Index('idx_location_coordinates', 'latitude', 'longitude'),
+        Index('idx_location_geohash', 'geohash', postgresql_ops={'geohash': 'varchar_pattern_ops'}),
         Index('idx_location_region', 'country', 'province', 'city'),
         Index('idx_location_type', 'type', 'category'),
+        Index('uq_location_baidu_uid', 'baidu_uid', unique=True),
     )
     
     def __repr__(self):
@@ -79,6 +82,7 @@ class Location(Base):
             "address": self.address,
             "latitude": self.latitude,
             "longitude": self.longitude,
+            "geohash": self.geohash,
             "country": self.country,
             "province": self.province,
             "city": self.city,
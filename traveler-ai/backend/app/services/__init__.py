@@ -4,15 +4,9 @@
 from app.services.ai_service import AIService
 from app.services.baidu_map_service import BaiduMapService
 from app.services.itinerary_service import ItineraryService
-from app.services.user_service import UserService
-from app.services.template_service import TemplateService
-from app.services.auth_service import AuthService
 
 __all__ = [
     "AIService",
     "BaiduMapService", 
     "ItineraryService",
-    "UserService",
-    "TemplateService",
-    "AuthService"
-] 
\ No newline at end of file
+]
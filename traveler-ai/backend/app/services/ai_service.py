@@ -4,13 +4,20 @@ AI服务集成层 - 支持多种大模型
 import hashlib
 import json
 import asyncio
-from typing import Dict, Any, Optional, AsyncGenerator
+import time
+from contextlib import aclosing
+from typing import Dict, Any, List, Optional, AsyncGenerator
 from abc import ABC, abstractmethod
-import httpx
 import structlog
 
+from app.core import metrics, tracing
 from app.core.config import settings, AI_PROVIDERS
 from app.core.redis import cache
+from app.core.http_client import http_clients
+from app.core.rate_limiter import rate_limiter, RateLimitExceeded
+from app.core.single_flight import SingleFlight
+from app.services.provider_router import ProviderRouter
+from app.services.semantic_cache import semantic_cache
 
 logger = structlog.get_logger()
 
@@ -18,12 +25,40 @@ logger = structlog.get_logger()
 class BaseAIProvider(ABC):
     """AI服务提供商基类"""
     
+    provider_name: str = "base"
+    
     def __init__(self, config: Dict[str, Any]):
         self.config = config
         self.base_url = config["base_url"]
         self.model = config["model"]
         self.api_key = config.get("api_key")
         self.timeout = config.get("timeout", 60)
+        # 单个提供商的并发请求上限，所有调用方共享
+        self.max_concurrency = max(1, config.get("max_concurrency", 4))
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        
+        # 注册共享HTTP客户端，复用长连接
+        self.client_name = f"ai_{self.provider_name}"
+        http_clients.register(self.client_name, self.base_url, self.timeout)
+        
+        # 跨worker共享的请求频率上限
+        rate_limiter.register(self.client_name, [(config.get("rate_per_minute", 0), 60)])
+    
+    async def throttle(self):
+        """按请求频率上限排队"""
+        await rate_limiter.acquire(
+            self.client_name,
+            self.model,
+            timeout=settings.AI_RATE_QUEUE_TIMEOUT
+        )
+    
+    def record_usage(self, prompt_tokens: Optional[int], completion_tokens: Optional[int], seconds: float):
+        """记录token用量：输出速度写入指标，token数写入当前span"""
+        metrics.observe_llm_tokens(self.provider_name, self.model, completion_tokens, seconds)
+        tracing.current_span().set_attributes(tracing.clean_attributes({
+            "llm.prompt_tokens": prompt_tokens,
+            "llm.completion_tokens": completion_tokens,
+        }))
     
     @abstractmethod
     async def generate_completion(
@@ -47,6 +82,8 @@ class BaseAIProvider(ABC):
 class OllamaProvider(BaseAIProvider):
     """Ollama本地模型提供商"""
     
+    provider_name = "ollama"
+    
     async def generate_completion(
         self, 
         prompt: str,
@@ -56,22 +93,26 @@ class OllamaProvider(BaseAIProvider):
     ) -> str:
         """生成文本完成"""
         try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.post(
-                    f"{self.base_url}/api/generate",
-                    json={
-                        "model": self.model,
-                        "prompt": prompt,
-                        "stream": False,
-                        "options": {
-                            "temperature": temperature,
-                            "num_predict": max_tokens,
-                        }
+            client = http_clients.get_client(self.client_name)
+            response = await client.post(
+                f"{self.base_url}/api/generate",
+                json={
+                    "model": self.model,
+                    "prompt": prompt,
+                    "stream": False,
+                    "options": {
+                        "temperature": temperature,
+                        "num_predict": max_tokens,
                     }
-                )
-                response.raise_for_status()
-                result = response.json()
-                return result.get("response", "")
+                }
+            )
+            response.raise_for_status()
+            result = response.json()
+            # Ollama返回输出token数和解码耗时(纳秒)
+            self.record_usage(
+                result.get("prompt_eval_count"), result.get("eval_count"), result.get("eval_duration", 0) / 1e9
+            )
+            return result.get("response", "")
         except Exception as e:
             logger.error("Ollama生成失败", error=str(e))
             raise
@@ -85,31 +126,31 @@ class OllamaProvider(BaseAIProvider):
     ) -> AsyncGenerator[str, None]:
         """生成流式文本"""
         try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                async with client.stream(
-                    "POST",
-                    f"{self.base_url}/api/generate",
-                    json={
-                        "model": self.model,
-                        "prompt": prompt,
-                        "stream": True,
-                        "options": {
-                            "temperature": temperature,
-                            "num_predict": max_tokens,
-                        }
+            client = http_clients.get_client(self.client_name)
+            async with client.stream(
+                "POST",
+                f"{self.base_url}/api/generate",
+                json={
+                    "model": self.model,
+                    "prompt": prompt,
+                    "stream": True,
+                    "options": {
+                        "temperature": temperature,
+                        "num_predict": max_tokens,
                     }
-                ) as response:
-                    response.raise_for_status()
-                    async for line in response.aiter_lines():
-                        if line:
-                            try:
-                                data = json.loads(line)
-                                if "response" in data:
-                                    yield data["response"]
-                                if data.get("done", False):
-                                    break
-                            except json.JSONDecodeError:
-                                continue
+                }
+            ) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if line:
+                        try:
+                            data = json.loads(line)
+                            if "response" in data:
+                                yield data["response"]
+                            if data.get("done", False):
+                                break
+                        except json.JSONDecodeError:
+                            continue
         except Exception as e:
             logger.error("Ollama流式生成失败", error=str(e))
             raise
@@ -118,6 +159,8 @@ class OllamaProvider(BaseAIProvider):
 class DeepSeekProvider(BaseAIProvider):
     """DeepSeek API提供商"""
     
+    provider_name = "deepseek"
+    
     async def generate_completion(
         self, 
         prompt: str,
@@ -130,25 +173,32 @@ class DeepSeekProvider(BaseAIProvider):
             raise ValueError("DeepSeek API密钥未配置")
         
         try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.post(
-                    f"{self.base_url}/chat/completions",
-                    headers={
-                        "Authorization": f"Bearer {self.api_key}",
-                        "Content-Type": "application/json"
-                    },
-                    json={
-                        "model": self.model,
-                        "messages": [
-                            {"role": "user", "content": prompt}
-                        ],
-                        "temperature": temperature,
-                        "max_tokens": max_tokens,
-                    }
-                )
-                response.raise_for_status()
-                result = response.json()
-                return result["choices"][0]["message"]["content"]
+            started = time.perf_counter()
+            client = http_clients.get_client(self.client_name)
+            response = await client.post(
+                f"{self.base_url}/chat/completions",
+                headers={
+                    "Authorization": f"Bearer {self.api_key}",
+                    "Content-Type": "application/json"
+                },
+                json={
+                    "model": self.model,
+                    "messages": [
+                        {"role": "user", "content": prompt}
+                    ],
+                    "temperature": temperature,
+                    "max_tokens": max_tokens,
+                }
+            )
+            response.raise_for_status()
+            result = response.json()
+            usage = result.get("usage") or {}
+            self.record_usage(
+                usage.get("prompt_tokens"),
+                usage.get("completion_tokens"),
+                time.perf_counter() - started
+            )
+            return result["choices"][0]["message"]["content"]
         except Exception as e:
             logger.error("DeepSeek生成失败", error=str(e))
             raise
@@ -165,38 +215,38 @@ class DeepSeekProvider(BaseAIProvider):
             raise ValueError("DeepSeek API密钥未配置")
         
         try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                async with client.stream(
-                    "POST",
-                    f"{self.base_url}/chat/completions",
-                    headers={
-                        "Authorization": f"Bearer {self.api_key}",
-                        "Content-Type": "application/json"
-                    },
-                    json={
-                        "model": self.model,
-                        "messages": [
-                            {"role": "user", "content": prompt}
-                        ],
-                        "temperature": temperature,
-                        "max_tokens": max_tokens,
-                        "stream": True
-                    }
-                ) as response:
-                    response.raise_for_status()
-                    async for line in response.aiter_lines():
-                        if line.startswith("data: "):
-                            line = line[6:]
-                            if line.strip() == "[DONE]":
-                                break
-                            try:
-                                data = json.loads(line)
-                                if "choices" in data and data["choices"]:
-                                    delta = data["choices"][0].get("delta", {})
-                                    if "content" in delta:
-                                        yield delta["content"]
-                            except json.JSONDecodeError:
-                                continue
+            client = http_clients.get_client(self.client_name)
+            async with client.stream(
+                "POST",
+                f"{self.base_url}/chat/completions",
+                headers={
+                    "Authorization": f"Bearer {self.api_key}",
+                    "Content-Type": "application/json"
+                },
+                json={
+                    "model": self.model,
+                    "messages": [
+                        {"role": "user", "content": prompt}
+                    ],
+                    "temperature": temperature,
+                    "max_tokens": max_tokens,
+                    "stream": True
+                }
+            ) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if line.startswith("data: "):
+                        line = line[6:]
+                        if line.strip() == "[DONE]":
+                            break
+                        try:
+                            data = json.loads(line)
+                            if "choices" in data and data["choices"]:
+                                delta = data["choices"][0].get("delta", {})
+                                if "content" in delta:
+                                    yield delta["content"]
+                        except json.JSONDecodeError:
+                            continue
         except Exception as e:
             logger.error("DeepSeek流式生成失败", error=str(e))
             raise
@@ -205,6 +255,8 @@ class DeepSeekProvider(BaseAIProvider):
 class BailianProvider(BaseAIProvider):
     """阿里云百炼API提供商"""
     
+    provider_name = "bailian"
+    
     async def generate_completion(
         self, 
         prompt: str,
@@ -217,25 +269,32 @@ class BailianProvider(BaseAIProvider):
             raise ValueError("阿里云百炼API密钥未配置")
         
         try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.post(
-                    f"{self.base_url}/chat/completions",
-                    headers={
-                        "Authorization": f"Bearer {self.api_key}",
-                        "Content-Type": "application/json"
-                    },
-                    json={
-                        "model": self.model,
-                        "messages": [
-                            {"role": "user", "content": prompt}
-                        ],
-                        "temperature": temperature,
-                        "max_tokens": max_tokens,
-                    }
-                )
-                response.raise_for_status()
-                result = response.json()
-                return result["choices"][0]["message"]["content"]
+            started = time.perf_counter()
+            client = http_clients.get_client(self.client_name)
+            response = await client.post(
+                f"{self.base_url}/chat/completions",
+                headers={
+                    "Authorization": f"Bearer {self.api_key}",
+                    "Content-Type": "application/json"
+                },
+                json={
+                    "model": self.model,
+                    "messages": [
+                        {"role": "user", "content": prompt}
+                    ],
+                    "temperature": temperature,
+                    "max_tokens": max_tokens,
+                }
+            )
+            response.raise_for_status()
+            result = response.json()
+            usage = result.get("usage") or {}
+            self.record_usage(
+                usage.get("prompt_tokens"),
+                usage.get("completion_tokens"),
+                time.perf_counter() - started
+            )
+            return result["choices"][0]["message"]["content"]
         except Exception as e:
             logger.error("阿里云百炼生成失败", error=str(e))
             raise
@@ -252,38 +311,38 @@ class BailianProvider(BaseAIProvider):
             raise ValueError("阿里云百炼API密钥未配置")
         
         try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                async with client.stream(
-                    "POST",
-                    f"{self.base_url}/chat/completions",
-                    headers={
-                        "Authorization": f"Bearer {self.api_key}",
-                        "Content-Type": "application/json"
-                    },
-                    json={
-                        "model": self.model,
-                        "messages": [
-                            {"role": "user", "content": prompt}
-                        ],
-                        "temperature": temperature,
-                        "max_tokens": max_tokens,
-                        "stream": True
-                    }
-                ) as response:
-                    response.raise_for_status()
-                    async for line in response.aiter_lines():
-                        if line.startswith("data: "):
-                            line = line[6:]
-                            if line.strip() == "[DONE]":
-                                break
-                            try:
-                                data = json.loads(line)
-                                if "choices" in data and data["choices"]:
-                                    delta = data["choices"][0].get("delta", {})
-                                    if "content" in delta:
-                                        yield delta["content"]
-                            except json.JSONDecodeError:
-                                continue
+            client = http_clients.get_client(self.client_name)
+            async with client.stream(
+                "POST",
+                f"{self.base_url}/chat/completions",
+                headers={
+                    "Authorization": f"Bearer {self.api_key}",
+                    "Content-Type": "application/json"
+                },
+                json={
+                    "model": self.model,
+                    "messages": [
+                        {"role": "user", "content": prompt}
+                    ],
+                    "temperature": temperature,
+                    "max_tokens": max_tokens,
+                    "stream": True
+                }
+            ) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if line.startswith("data: "):
+                        line = line[6:]
+                        if line.strip() == "[DONE]":
+                            break
+                        try:
+                            data = json.loads(line)
+                            if "choices" in data and data["choices"]:
+                                delta = data["choices"][0].get("delta", {})
+                                if "content" in delta:
+                                    yield delta["content"]
+                        except json.JSONDecodeError:
+                            continue
         except Exception as e:
             logger.error("阿里云百炼流式生成失败", error=str(e))
             raise
@@ -294,6 +353,8 @@ class AIService:
     
     def __init__(self):
         self.providers = {}
+        self.router = ProviderRouter()
+        self._flight = SingleFlight("ai")
         self._init_providers()
     
     def _init_providers(self):
@@ -308,6 +369,8 @@ class AIService:
                 if config["api_key"]:
                     self.providers[provider_name] = BailianProvider(config)
         
+        for provider_name in self.providers:
+            self.router.register(provider_name)
         logger.info("AI服务提供商初始化完成", providers=list(self.providers.keys()))
     
     def get_provider(self, provider_name: Optional[str] = None) -> BaseAIProvider:
@@ -320,6 +383,109 @@ class AIService:
         
         return self.providers[provider_name]
     
+    def get_candidates(self, provider_name: Optional[str] = None) -> List[str]:
+        """按路由顺序排列的候选提供商
+        
+        首选提供商未配置时从已配置的提供商中选择；一个都没有配置或全部熔断时抛出异常。
+        """
+        preferred = provider_name or settings.DEFAULT_AI_PROVIDER
+        if preferred not in self.providers:
+            logger.warning("首选AI服务提供商未配置，使用其他提供商", provider=preferred)
+        
+        candidates = [name for name in self.router.candidates(preferred) if name in self.providers]
+        if not candidates and not settings.AI_ROUTING_ENABLED:
+            # 关闭路由时路由只返回首选提供商
+            candidates = list(self.providers)
+        if not self.providers:
+            raise ValueError(f"AI服务提供商 '{preferred}' 不可用，没有已配置的提供商")
+        if not candidates:
+            raise ValueError("AI服务提供商全部熔断中，请稍后重试")
+        return candidates
+    
+    def _flight_lock_ttl(self, candidates: List[str]) -> int:
+        """请求合并锁的有效期(秒)
+        
+        故障转移和对冲可能用到所有候选提供商，按各候选的限流排队和请求超时之和计算，
+        避免调用未结束锁已过期、其他进程重复生成。
+        """
+        return int(sum(
+            self.providers[name].timeout + settings.AI_RATE_QUEUE_TIMEOUT for name in candidates
+        ))
+    
+    def _acquire(self, provider: BaseAIProvider):
+        """登记一次调用，提供商熔断中时抛出异常"""
+        if not self.router.acquire(provider.provider_name):
+            raise ValueError(f"AI服务提供商 '{provider.provider_name}' 熔断中")
+    
+    async def _complete_with(self, provider_name: str, prompt: str, **kwargs) -> str:
+        """调用指定提供商，记录上游耗时和成败
+        
+        本地限流排队超时和取消不计入提供商的错误率。
+        """
+        provider = self.providers[provider_name]
+        self._acquire(provider)
+        latency = None
+        success = None
+        try:
+            await provider.throttle()
+            async with provider.semaphore:
+                started = time.perf_counter()
+                with tracing.span("llm.request", **{"llm.provider": provider.provider_name, "llm.model": provider.model}):
+                    response = await provider.generate_completion(prompt, **kwargs)
+                latency = time.perf_counter() - started
+                metrics.llm_request_seconds.labels(provider.provider_name, provider.model, "completion").observe(latency)
+            success = True
+            return response
+        except RateLimitExceeded:
+            raise
+        except Exception:
+            success = False
+            raise
+        finally:
+            self.router.release(provider_name, latency, success)
+    
+    async def _stream_with(
+        self,
+        provider: BaseAIProvider,
+        prompt: str,
+        stream_span: Any,
+        **kwargs
+    ) -> AsyncGenerator[str, None]:
+        """调用指定提供商的流式接口，记录首个片段耗时、输出速度和成败"""
+        self._acquire(provider)
+        latency = None
+        success = None
+        try:
+            await provider.throttle()
+            async with provider.semaphore:
+                started = time.perf_counter()
+                first_at = None
+                chunks = 0
+                async for chunk in provider.generate_stream(prompt, **kwargs):
+                    if first_at is None:
+                        first_at = time.perf_counter()
+                        metrics.llm_first_token_seconds.labels(provider.provider_name, provider.model).observe(
+                            first_at - started
+                        )
+                        stream_span.set_attribute("llm.time_to_first_token", first_at - started)
+                    chunks += 1
+                    yield chunk
+                
+                # 流式片段基本一个token一段，输出速度按首个片段之后的片段数计算
+                finished = time.perf_counter()
+                latency = finished - started
+                metrics.llm_request_seconds.labels(provider.provider_name, provider.model, "stream").observe(latency)
+                if first_at is not None:
+                    metrics.observe_llm_tokens(provider.provider_name, provider.model, chunks - 1, finished - first_at)
+            success = True
+        except RateLimitExceeded:
+            raise
+        except Exception:
+            success = False
+            raise
+        finally:
+            self.router.release(provider.provider_name, latency, success)
+    
     def _generate_cache_key(self, prompt: str, **kwargs) -> str:
         """生成缓存键"""
         # 创建包含所有参数的字符串
@@ -330,24 +496,52 @@ class AIService:
         cache_string = json.dumps(cache_data, sort_keys=True, ensure_ascii=False)
         return hashlib.md5(cache_string.encode()).hexdigest()
     
+    @tracing.traced("llm.completion")
     async def generate_completion(
         self,
         prompt: str,
         provider_name: Optional[str] = None,
         use_cache: bool = True,
+        hedge: bool = False,
         **kwargs
     ) -> str:
-        """生成文本完成"""
+        """生成文本完成
+        
+        按路由顺序调用提供商，失败时故障转移；hedge为True时在AI_HEDGE_DELAY秒
+        未返回后向下一个提供商发起对冲请求。缓存键只取决于请求参数和请求的
+        提供商，与实际响应的提供商无关。
+        """
+        completion_span = tracing.current_span()
+        completion_span.set_attributes({
+            "llm.provider": provider_name or settings.DEFAULT_AI_PROVIDER,
+            "llm.prompt_length": len(prompt),
+        })
+        
         # 检查缓存
         if use_cache:
             cache_key = self._generate_cache_key(prompt, provider=provider_name, **kwargs)
             cached_response = await cache.get_ai_response(cache_key)
+            completion_span.set_attribute("llm.cache_hit", bool(cached_response))
             if cached_response:
+                await semantic_cache.record("prompt_hit")
                 logger.info("使用缓存的AI响应", cache_key=cache_key)
                 return cached_response
+            await semantic_cache.record("prompt_miss")
+        
+        # 获取候选提供商并生成
+        candidates = self.get_candidates(provider_name)
         
-        # 获取提供商并生成
-        provider = self.get_provider(provider_name)
+        async def generate() -> str:
+            response = await self.router.run(
+                candidates,
+                lambda name: self._complete_with(name, prompt, **kwargs),
+                hedge_delay=settings.AI_HEDGE_DELAY if hedge else None
+            )
+            
+            # 缓存响应
+            if use_cache and response:
+                await cache.cache_ai_response(cache_key, response)
+            return response
         
         try:
             logger.info(
@@ -356,11 +550,16 @@ class AIService:
                 prompt_length=len(prompt)
             )
             
-            response = await provider.generate_completion(prompt, **kwargs)
-            
-            # 缓存响应
-            if use_cache and response:
-                await cache.cache_ai_response(cache_key, response)
+            if use_cache:
+                # 相同提示词的并发请求只调用一次模型
+                response = await self._flight.do(
+                    cache_key,
+                    generate,
+                    reader=lambda: cache.get_ai_response(cache_key),
+                    lock_ttl=self._flight_lock_ttl(candidates)
+                )
+            else:
+                response = await generate()
             
             logger.info(
                 "AI文本生成完成",
@@ -384,8 +583,14 @@ class AIService:
         provider_name: Optional[str] = None,
         **kwargs
     ) -> AsyncGenerator[str, None]:
-        """生成流式文本"""
-        provider = self.get_provider(provider_name)
+        """生成流式文本
+        
+        尚未输出片段时失败会故障转移到下一个提供商，输出开始后失败直接抛出。
+        """
+        candidates = self.get_candidates(provider_name)
+        # 异步生成器跨越yield，span不设为当前span，结束时手动关闭
+        stream_span = tracing.start_span("llm.stream", **{"llm.prompt_length": len(prompt)})
+        chunks = 0
         
         try:
             logger.info(
@@ -394,8 +599,19 @@ class AIService:
                 prompt_length=len(prompt)
             )
             
-            async for chunk in provider.generate_stream(prompt, **kwargs):
-                yield chunk
+            for index, name in enumerate(candidates):
+                provider = self.providers[name]
+                stream_span.set_attributes({"llm.provider": name, "llm.model": provider.model})
+                try:
+                    async with aclosing(self._stream_with(provider, prompt, stream_span, **kwargs)) as stream:
+                        async for chunk in stream:
+                            chunks += 1
+                            yield chunk
+                    return
+                except Exception as e:
+                    if chunks or index == len(candidates) - 1:
+                        raise
+                    logger.warning("AI服务提供商调用失败", provider=name, error=str(e))
                 
         except Exception as e:
             logger.error(
@@ -403,17 +619,23 @@ class AIService:
                 provider=provider_name or settings.DEFAULT_AI_PROVIDER,
                 error=str(e)
             )
+            stream_span.record_exception(e)
             raise
+        finally:
+            stream_span.set_attribute("llm.chunks", chunks)
+            stream_span.end()
     
     async def get_available_providers(self) -> Dict[str, Dict[str, Any]]:
         """获取可用的AI服务提供商"""
+        routing = self.router.get_stats()
         result = {}
         for name, provider in self.providers.items():
             result[name] = {
                 "name": name,
                 "model": provider.model,
                 "base_url": provider.base_url,
-                "available": True
+                "available": True,
+                "routing": routing.get(name)
             }
         return result
     
@@ -1,16 +1,46 @@
 """
 百度地图服务集成
 """
+import asyncio
 import json
-from typing import Dict, List, Any, Optional, Tuple
+import time
+from typing import Awaitable, Callable, Dict, List, Any, Optional, Tuple
 import httpx
 import structlog
 
+from app.core import metrics, tracing
 from app.core.config import settings
-from app.core.redis import cache
+from app.core.redis import cache, destination_tag
+from app.core.local_cache import NEGATIVE_RESULT
+from app.core.http_client import http_clients
+from app.core.rate_limiter import rate_limiter
+from app.core.single_flight import SingleFlight
+from app.services.poi_warehouse import poi_warehouse
+from app.utils.geo import haversine_m
 
 logger = structlog.get_logger()
 
+# 缓存条目的包装标记，带新鲜期以支持过期后先返回旧值再后台刷新
+SWR_MARKER = "__swr__"
+DEFAULT_MAP_TTL = 3600 * 24 * 7
+
+# 批量算路单次请求的起终点组合上限
+ROUTE_MATRIX_MAX_ELEMENTS = 50
+ROUTE_MATRIX_ENDPOINTS = {
+    "driving": "routematrix/v2/driving",
+    "riding": "routematrix/v2/riding",
+    "walking": "routematrix/v2/walking",
+}
+# 步行、骑行不受单行道等限制，A→B与B→A近似相同；驾车不复用反向结果
+SYMMETRIC_ROUTE_MODES = ("walking", "riding")
+# 算路失败时按直线距离估算：绕行系数和各方式的平均速度(米/秒)
+ROUTE_ESTIMATE_DETOUR = 1.4
+ROUTE_ESTIMATE_SPEEDS = {
+    "driving": 40 / 3.6,
+    "riding": 15 / 3.6,
+    "walking": 5 / 3.6,
+}
+
 
 class BaiduMapService:
     """百度地图服务"""
@@ -19,15 +49,28 @@ class BaiduMapService:
         self.base_url = settings.BAIDU_MAP_BASE_URL
         self.ak = settings.BAIDU_MAP_AK
         self.timeout = settings.BAIDU_MAP_TIMEOUT
+        self.client_name = "baidu_map"
+        http_clients.register(self.client_name, self.base_url, self.timeout)
+        self._flight = SingleFlight("baidu_map")
+        # 百度配额按接口分别计算
+        rate_limiter.register(self.client_name, [
+            (settings.BAIDU_MAP_QPS, 1),
+            (settings.BAIDU_MAP_DAILY_QUOTA, 86400),
+        ])
+        self._refresh_tasks: Dict[str, asyncio.Task] = {}
+        self._route_stats = {"cell_hits": 0, "cell_misses": 0, "requests": 0}
     
     def _check_ak(self):
         """检查API密钥"""
         if not self.ak:
             raise ValueError("百度地图API密钥未配置")
     
+    @tracing.traced("baidu.request")
     async def _make_request(self, endpoint: str, params: Dict[str, Any]) -> Dict[str, Any]:
         """发起API请求"""
         self._check_ak()
+        request_span = tracing.current_span()
+        request_span.set_attribute("baidu.endpoint", endpoint)
         
         # 添加API密钥
         params["ak"] = self.ak
@@ -35,72 +78,220 @@ class BaiduMapService:
         
         url = f"{self.base_url}/{endpoint}"
         
+        # 超出QPS时排队，避免AK被百度限流
+        await rate_limiter.acquire(self.client_name, endpoint, timeout=settings.BAIDU_MAP_QUEUE_TIMEOUT)
+        
+        started = time.perf_counter()
         try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.get(url, params=params)
-                response.raise_for_status()
-                result = response.json()
+            client = http_clients.get_client(self.client_name)
+            response = await client.get(url, params=params)
+            response.raise_for_status()
+            result = response.json()
+            metrics.baidu_api_seconds.labels(endpoint, str(result.get("status"))).observe(
+                time.perf_counter() - started
+            )
+            request_span.set_attribute("baidu.status", str(result.get("status")))
                 
-                # 检查百度API状态
-                if result.get("status") != 0:
-                    error_msg = result.get("message", f"百度地图API错误，状态码: {result.get('status')}")
-                    logger.error("百度地图API请求失败", error=error_msg, params=params)
-                    raise ValueError(error_msg)
+            # 检查百度API状态
+            if result.get("status") != 0:
+                error_msg = result.get("message", f"百度地图API错误，状态码: {result.get('status')}")
+                logger.error("百度地图API请求失败", error=error_msg, endpoint=endpoint, status=result.get("status"))
+                raise ValueError(error_msg)
                 
-                return result
+            return result
                 
         except httpx.HTTPError as e:
-            logger.error("百度地图API请求失败", error=str(e), url=url, params=params)
+            metrics.baidu_api_seconds.labels(endpoint, "http_error").observe(time.perf_counter() - started)
+            logger.error("百度地图API请求失败", error=str(e), endpoint=endpoint)
             raise
     
-    async def geocode(self, address: str) -> Optional[Dict[str, Any]]:
-        """地理编码：地址转坐标"""
-        cache_key = f"geocode_{address}"
+    async def _read_cache(self, cache_key: str) -> Any:
+        """读取缓存并解包，返回None/NEGATIVE_RESULT/结果"""
+        cached = await cache.get_map_data(cache_key)
+        if isinstance(cached, dict) and cached.get(SWR_MARKER):
+            return cached["value"]
+        return cached
+    
+    async def _fetch_and_store(
+        self,
+        cache_key: str,
+        fetch: Callable[[], Awaitable[Optional[Dict[str, Any]]]],
+        ttl: int,
+        negative: bool,
+        tags: Optional[List[str]] = None
+    ) -> Any:
+        """请求上游并写入缓存"""
+        result = await fetch()
+        if result:
+            wrapped = {SWR_MARKER: True, "value": result, "fresh_until": time.time() + ttl}
+            await cache.cache_map_data(
+                cache_key, wrapped, ttl=ttl + settings.MAP_CACHE_STALE_TTL, tags=tags
+            )
+            return result
+        
+        if negative:
+            # 上游确认无结果，写入负缓存
+            await cache.cache_map_miss(cache_key, tags=tags)
+            return NEGATIVE_RESULT
+        return None
+    
+    def _schedule_refresh(
+        self,
+        cache_key: str,
+        fetch: Callable[[], Awaitable[Optional[Dict[str, Any]]]],
+        ttl: int,
+        negative: bool,
+        tags: Optional[List[str]] = None
+    ):
+        """后台刷新已过新鲜期的缓存，同一键只保留一个刷新任务"""
+        if cache_key in self._refresh_tasks:
+            return
         
-        # 检查缓存
-        cached_result = await cache.get_map_data(cache_key)
-        if cached_result:
-            return cached_result
+        async def refresh():
+            try:
+                await self._flight.do(
+                    cache_key,
+                    lambda: self._fetch_and_store(cache_key, fetch, ttl, negative, tags)
+                )
+            except Exception as e:
+                logger.error("地图缓存后台刷新失败", cache_key=cache_key, error=str(e))
         
-        try:
-            params = {
+        task = asyncio.create_task(refresh())
+        self._refresh_tasks[cache_key] = task
+        task.add_done_callback(lambda _: self._refresh_tasks.pop(cache_key, None))
+    
+    def _from_cache(
+        self,
+        cache_key: str,
+        cached: Any,
+        fetch: Callable[[], Awaitable[Optional[Dict[str, Any]]]],
+        ttl: int,
+        negative: bool,
+        tags: Optional[List[str]] = None
+    ) -> Any:
+        """处理读到的缓存值，返回结果、NEGATIVE_RESULT或None（未命中）
+        
+        过了新鲜期的条目照常返回，同时在后台刷新。
+        """
+        if not cached or not (isinstance(cached, dict) and cached.get(SWR_MARKER)):
+            return cached
+        if cached["fresh_until"] <= time.time():
+            self._schedule_refresh(cache_key, fetch, ttl, negative, tags)
+        return cached["value"]
+    
+    async def _load(
+        self,
+        cache_key: str,
+        fetch: Callable[[], Awaitable[Optional[Dict[str, Any]]]],
+        ttl: int,
+        negative: bool,
+        tags: Optional[List[str]] = None
+    ) -> Any:
+        """缓存未命中时请求上游，相同键的并发请求只执行一次"""
+        return await self._flight.do(
+            cache_key,
+            lambda: self._fetch_and_store(cache_key, fetch, ttl, negative, tags),
+            reader=lambda: self._read_cache(cache_key)
+        )
+    
+    async def _cached_request(
+        self,
+        cache_key: str,
+        fetch: Callable[[], Awaitable[Optional[Dict[str, Any]]]],
+        ttl: int = DEFAULT_MAP_TTL,
+        negative: bool = True,
+        tags: Optional[List[str]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """带缓存的上游请求
+        
+        相同键的并发未命中只请求一次上游（single-flight）；
+        缓存过了新鲜期但仍在保留期内时直接返回旧值，并在后台刷新。
+        negative为True时上游无结果会写入负缓存；tags用于按目的地等批量失效。
+        """
+        cached = await cache.get_map_data(cache_key)
+        result = self._from_cache(cache_key, cached, fetch, ttl, negative, tags)
+        if result is None:
+            result = await self._load(cache_key, fetch, ttl, negative, tags)
+        return result or None
+    
+    async def _cached_many(
+        self,
+        requests: List[Tuple[str, Callable[[], Awaitable[Optional[Dict[str, Any]]]], Optional[List[str]]]],
+        ttl: int = DEFAULT_MAP_TTL,
+        negative: bool = True
+    ) -> List[Optional[Dict[str, Any]]]:
+        """批量版 _cached_request，requests为(缓存键, 请求函数, 标签)列表
+        
+        缓存一次MGET读取，未命中的并发请求上游；单项失败返回None。
+        """
+        cached = await cache.get_map_data_many([cache_key for cache_key, _, _ in requests])
+        results = [
+            self._from_cache(cache_key, cached.get(cache_key), fetch, ttl, negative, tags)
+            for cache_key, fetch, tags in requests
+        ]
+        
+        async def load(index: int):
+            cache_key, fetch, tags = requests[index]
+            try:
+                results[index] = await self._load(cache_key, fetch, ttl, negative, tags)
+            except Exception as e:
+                logger.error("批量地图查询失败", cache_key=cache_key, error=str(e))
+        
+        await asyncio.gather(*[load(i) for i, result in enumerate(results) if result is None])
+        return [result or None for result in results]
+    
+    async def _fetch_geocode(self, address: str) -> Optional[Dict[str, Any]]:
+        """请求地理编码接口"""
+        params = {
+            "address": address,
+            "city": "",  # 可以指定城市范围
+        }
+        
+        result = await self._make_request("geocoding/v3", params)
+        
+        if result.get("result") and result["result"].get("location"):
+            location_data = result["result"]["location"]
+            formatted_result = {
+                "latitude": location_data["lat"],
+                "longitude": location_data["lng"],
                 "address": address,
-                "city": "",  # 可以指定城市范围
+                "formatted_address": result["result"].get("formatted_address", address),
+                "level": result["result"].get("level", "未知"),
+                "confidence": result["result"].get("confidence", 0),
             }
             
-            result = await self._make_request("geocoding/v3", params)
-            
-            if result.get("result") and result["result"].get("location"):
-                location_data = result["result"]["location"]
-                formatted_result = {
-                    "latitude": location_data["lat"],
-                    "longitude": location_data["lng"],
-                    "address": address,
-                    "formatted_address": result["result"].get("formatted_address", address),
-                    "level": result["result"].get("level", "未知"),
-                    "confidence": result["result"].get("confidence", 0),
-                }
-                
-                # 缓存结果
-                await cache.cache_map_data(cache_key, formatted_result)
-                return formatted_result
-            
-            return None
-            
+            return formatted_result
+        
+        return None
+    
+    async def geocode(self, address: str) -> Optional[Dict[str, Any]]:
+        """地理编码：地址转坐标"""
+        cache_key = f"geocode_{address}"
+        
+        try:
+            return await self._cached_request(
+                cache_key,
+                lambda: self._fetch_geocode(address),
+                tags=[destination_tag(address)]
+            )
         except Exception as e:
             logger.error("地理编码失败", address=address, error=str(e))
             return None
     
+    async def geocode_many(self, addresses: List[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+        """批量地理编码，缓存一次MGET读取，未命中的并发请求"""
+        addresses = list(dict.fromkeys(addresses))
+        results = await self._cached_many([
+            (f"geocode_{address}", lambda address=address: self._fetch_geocode(address), [destination_tag(address)])
+            for address in addresses
+        ])
+        return dict(zip(addresses, results))
+    
     async def reverse_geocode(self, latitude: float, longitude: float) -> Optional[Dict[str, Any]]:
         """逆地理编码：坐标转地址"""
         cache_key = f"reverse_geocode_{latitude}_{longitude}"
         
-        # 检查缓存
-        cached_result = await cache.get_map_data(cache_key)
-        if cached_result:
-            return cached_result
-        
-        try:
+        async def fetch() -> Optional[Dict[str, Any]]:
             params = {
                 "location": f"{latitude},{longitude}",
                 "coordtype": "wgs84ll",
@@ -124,12 +315,12 @@ class BaiduMapService:
                     "pois": result_data.get("pois", []),
                 }
                 
-                # 缓存结果
-                await cache.cache_map_data(cache_key, formatted_result)
                 return formatted_result
             
             return None
-            
+        
+        try:
+            return await self._cached_request(cache_key, fetch)
         except Exception as e:
             logger.error("逆地理编码失败", latitude=latitude, longitude=longitude, error=str(e))
             return None
@@ -147,12 +338,7 @@ class BaiduMapService:
         """地点检索"""
         cache_key = f"search_places_{query}_{region}_{location}_{radius}_{tag}_{page_num}_{page_size}"
         
-        # 检查缓存
-        cached_result = await cache.get_map_data(cache_key)
-        if cached_result:
-            return cached_result
-        
-        try:
+        async def fetch() -> Optional[Dict[str, Any]]:
             params = {
                 "query": query,
                 "page_num": page_num,
@@ -189,6 +375,8 @@ class BaiduMapService:
                     }
                     places.append(formatted_place)
                 
+                poi_warehouse.add_search_results(places)
+                
                 formatted_result = {
                     "total": result.get("total", 0),
                     "places": places,
@@ -196,63 +384,78 @@ class BaiduMapService:
                     "page_size": page_size,
                 }
                 
-                # 缓存结果
-                await cache.cache_map_data(cache_key, formatted_result, ttl=3600)  # 1小时缓存
                 return formatted_result
             
             return None
-            
+        
+        try:
+            tags = [destination_tag(region)] if region else None
+            return await self._cached_request(cache_key, fetch, ttl=3600, tags=tags)  # 1小时缓存
         except Exception as e:
             logger.error("地点检索失败", query=query, error=str(e))
             return None
     
-    async def get_place_details(self, uid: str) -> Optional[Dict[str, Any]]:
-        """获取地点详情"""
-        cache_key = f"place_details_{uid}"
+    async def _fetch_place_details(self, uid: str) -> Optional[Dict[str, Any]]:
+        """请求地点详情接口，本地POI库中有未过期的详情时直接使用"""
+        stored = await poi_warehouse.get_details(uid)
+        if stored:
+            return stored
         
-        # 检查缓存
-        cached_result = await cache.get_map_data(cache_key)
-        if cached_result:
-            return cached_result
+        params = {
+            "uid": uid,
+            "scope": 2,  # 获取详细信息
+        }
         
-        try:
-            params = {
+        result = await self._make_request("place/v2/detail", params)
+        
+        if result.get("result"):
+            place_data = result["result"]
+            formatted_result = {
                 "uid": uid,
-                "scope": 2,  # 获取详细信息
+                "name": place_data.get("name", ""),
+                "address": place_data.get("address", ""),
+                "latitude": place_data.get("location", {}).get("lat"),
+                "longitude": place_data.get("location", {}).get("lng"),
+                "telephone": place_data.get("telephone", ""),
+                "tag": place_data.get("tag", ""),
+                "type": place_data.get("type", ""),
+                "detail_info": place_data.get("detail_info", {}),
+                "photos": place_data.get("photos", []),
+                "comment_num": place_data.get("comment_num", 0),
+                "score": place_data.get("score", 0),
+                "price": place_data.get("price", ""),
+                "shop_hours": place_data.get("shop_hours", ""),
+                "overall_rating": place_data.get("overall_rating", {}),
             }
             
-            result = await self._make_request("place/v2/detail", params)
-            
-            if result.get("result"):
-                place_data = result["result"]
-                formatted_result = {
-                    "uid": uid,
-                    "name": place_data.get("name", ""),
-                    "address": place_data.get("address", ""),
-                    "latitude": place_data.get("location", {}).get("lat"),
-                    "longitude": place_data.get("location", {}).get("lng"),
-                    "telephone": place_data.get("telephone", ""),
-                    "tag": place_data.get("tag", ""),
-                    "type": place_data.get("type", ""),
-                    "detail_info": place_data.get("detail_info", {}),
-                    "photos": place_data.get("photos", []),
-                    "comment_num": place_data.get("comment_num", 0),
-                    "score": place_data.get("score", 0),
-                    "price": place_data.get("price", ""),
-                    "shop_hours": place_data.get("shop_hours", ""),
-                    "overall_rating": place_data.get("overall_rating", {}),
-                }
-                
-                # 缓存结果
-                await cache.cache_map_data(cache_key, formatted_result, ttl=3600 * 24)  # 24小时缓存
-                return formatted_result
-            
-            return None
-            
+            poi_warehouse.add_details(formatted_result)
+            return formatted_result
+        
+        return None
+    
+    async def get_place_details(self, uid: str) -> Optional[Dict[str, Any]]:
+        """获取地点详情"""
+        cache_key = f"place_details_{uid}"
+        
+        try:
+            return await self._cached_request(
+                cache_key,
+                lambda: self._fetch_place_details(uid),
+                ttl=3600 * 24  # 24小时缓存
+            )
         except Exception as e:
             logger.error("获取地点详情失败", uid=uid, error=str(e))
             return None
     
+    async def place_details_many(self, uids: List[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+        """批量获取地点详情"""
+        uids = list(dict.fromkeys(uids))
+        results = await self._cached_many(
+            [(f"place_details_{uid}", lambda uid=uid: self._fetch_place_details(uid), None) for uid in uids],
+            ttl=3600 * 24
+        )
+        return dict(zip(uids, results))
+    
     async def get_directions(
         self,
         origin: str,
@@ -262,12 +465,7 @@ class BaiduMapService:
         """路线规划"""
         cache_key = f"directions_{origin}_{destination}_{mode}"
         
-        # 检查缓存
-        cached_result = await cache.get_map_data(cache_key)
-        if cached_result:
-            return cached_result
-        
-        try:
+        async def fetch() -> Optional[Dict[str, Any]]:
             endpoint_map = {
                 "driving": "direction/v2/driving",
                 "riding": "direction/v2/riding", 
@@ -306,65 +504,175 @@ class BaiduMapService:
                     "taxi_fee": route_data.get("taxi_fee", {}),
                 }
                 
-                # 缓存结果
-                await cache.cache_map_data(cache_key, formatted_result, ttl=3600)  # 1小时缓存
                 return formatted_result
             
             return None
-            
+        
+        try:
+            return await self._cached_request(cache_key, fetch, ttl=3600, negative=False)  # 1小时缓存
         except Exception as e:
             logger.error("路线规划失败", origin=origin, destination=destination, mode=mode, error=str(e))
             return None
     
+    def _route_point(self, point: str) -> str:
+        """坐标保留4位小数（约11米）作为缓存键的一部分，非坐标按原文"""
+        try:
+            latitude, longitude = (float(value) for value in point.split(","))
+        except ValueError:
+            return point.strip()
+        return f"{latitude:.4f},{longitude:.4f}"
+    
+    def _route_cell_key(self, origin: str, destination: str, mode: str) -> str:
+        """单个起终点组合的缓存键"""
+        return f"route_{mode}_{self._route_point(origin)}_{self._route_point(destination)}"
+    
     async def get_directions_matrix(
         self,
         origins: List[str],
         destinations: List[str],
         mode: str = "driving"
     ) -> Optional[Dict[str, Any]]:
-        """批量算路"""
-        origins_str = "|".join(origins)
-        destinations_str = "|".join(destinations)
-        cache_key = f"directions_matrix_{origins_str}_{destinations_str}_{mode}"
+        """批量算路
         
-        # 检查缓存
-        cached_result = await cache.get_map_data(cache_key)
-        if cached_result:
-            return cached_result
+        按起终点组合逐格缓存：先一次MGET读取所有组合，步行、骑行再用反向组合补齐，
+        只把缺失的子矩阵按接口上限分块请求百度，结果逐格写回缓存。
+        仍缺失的组合按直线距离估算补齐（标记estimated），不丢弃已得到的结果。
+        """
+        pairs = [(origin, destination) for origin in origins for destination in destinations]
+        keys = {pair: self._route_cell_key(*pair, mode) for pair in pairs}
+        symmetric = mode in SYMMETRIC_ROUTE_MODES
         
         try:
-            endpoint_map = {
-                "driving": "routematrix/v2/driving",
-                "riding": "routematrix/v2/riding",
-                "walking": "routematrix/v2/walking"
+            lookup = list(keys.values())
+            if symmetric:
+                lookup += [self._route_cell_key(destination, origin, mode) for origin, destination in pairs]
+            cached = await cache.get_map_data_many(lookup)
+            
+            cells = {}
+            for (origin, destination), key in keys.items():
+                element = cached.get(key)
+                if element is None and symmetric:
+                    element = cached.get(self._route_cell_key(destination, origin, mode))
+                if element is not None:
+                    cells[(origin, destination)] = element
+            
+            missing = [pair for pair in pairs if pair not in cells]
+            self._route_stats["cell_hits"] += len(pairs) - len(missing)
+            self._route_stats["cell_misses"] += len(missing)
+            if missing:
+                fetched = await self._fetch_route_matrix(
+                    list(dict.fromkeys(origin for origin, _ in missing)),
+                    list(dict.fromkeys(destination for _, destination in missing)),
+                    mode
+                )
+                cells.update(fetched)
+                await cache.set_many(
+                    {
+                        cache.get_map_data_cache_key(self._route_cell_key(*pair, mode)): element
+                        for pair, element in fetched.items()
+                    },
+                    ttl=settings.ROUTE_MATRIX_CACHE_TTL
+                )
+            
+            missing = [pair for pair in pairs if pair not in cells]
+            if missing:
+                # 缓存和接口都没有结果的组合按直线距离估算，不写缓存
+                for pair in missing:
+                    element = self._estimate_route_cell(*pair, mode)
+                    if element is None:
+                        return None
+                    cells[pair] = element
+                logger.warning("批量算路部分组合使用直线距离估算", mode=mode, estimated=len(missing), total=len(pairs))
+            
+            return {
+                "origins": origins,
+                "destinations": destinations,
+                "mode": mode,
+                "matrix": [cells[pair] for pair in pairs],
             }
-            
-            endpoint = endpoint_map.get(mode, "routematrix/v2/driving")
-            
+        except Exception as e:
+            logger.error("批量算路失败", origins=origins, destinations=destinations, mode=mode, error=str(e))
+            return None
+    
+    def _estimate_route_cell(self, origin: str, destination: str, mode: str) -> Optional[Dict[str, Any]]:
+        """按直线距离乘绕行系数估算单个组合，格式同批量算路结果；非坐标无法估算时返回None"""
+        try:
+            origin_lat, origin_lng = (float(value) for value in origin.split(","))
+            destination_lat, destination_lng = (float(value) for value in destination.split(","))
+        except ValueError:
+            return None
+        
+        distance = haversine_m(origin_lat, origin_lng, destination_lat, destination_lng) * ROUTE_ESTIMATE_DETOUR
+        duration = distance / ROUTE_ESTIMATE_SPEEDS.get(mode, ROUTE_ESTIMATE_SPEEDS["driving"])
+        return {
+            "distance": {"value": round(distance)},
+            "duration": {"value": round(duration)},
+            "estimated": True,
+        }
+    
+    async def _fetch_route_matrix(
+        self,
+        origins: List[str],
+        destinations: List[str],
+        mode: str
+    ) -> Dict[Tuple[str, str], Dict[str, Any]]:
+        """按接口上限分块请求批量算路，返回 (起点, 终点) -> 结果；失败的分块跳过"""
+        destination_size = min(len(destinations), ROUTE_MATRIX_MAX_ELEMENTS)
+        origin_size = max(1, ROUTE_MATRIX_MAX_ELEMENTS // destination_size)
+        chunks = [
+            (origins[i:i + origin_size], destinations[j:j + destination_size])
+            for i in range(0, len(origins), origin_size)
+            for j in range(0, len(destinations), destination_size)
+        ]
+        
+        results = await asyncio.gather(
+            *[self._fetch_route_chunk(chunk_origins, chunk_destinations, mode)
+              for chunk_origins, chunk_destinations in chunks],
+            return_exceptions=True
+        )
+        
+        cells = {}
+        for (chunk_origins, chunk_destinations), elements in zip(chunks, results):
+            if isinstance(elements, Exception):
+                logger.error("批量算路分块失败", origins=chunk_origins, mode=mode, error=str(elements))
+                continue
+            if not elements or len(elements) != len(chunk_origins) * len(chunk_destinations):
+                continue
+            for index, element in enumerate(elements):
+                origin = chunk_origins[index // len(chunk_destinations)]
+                destination = chunk_destinations[index % len(chunk_destinations)]
+                cells[(origin, destination)] = element
+        return cells
+    
+    async def _fetch_route_chunk(
+        self,
+        origins: List[str],
+        destinations: List[str],
+        mode: str
+    ) -> Optional[List[Dict[str, Any]]]:
+        """请求一次批量算路接口，相同请求在进程内合并"""
+        origins_str = "|".join(origins)
+        destinations_str = "|".join(destinations)
+        
+        async def fetch() -> Optional[List[Dict[str, Any]]]:
+            endpoint = ROUTE_MATRIX_ENDPOINTS.get(mode, ROUTE_MATRIX_ENDPOINTS["driving"])
             params = {
                 "origins": origins_str,
                 "destinations": destinations_str,
             }
             
+            self._route_stats["requests"] += 1
             result = await self._make_request(endpoint, params)
-            
-            if result.get("result"):
-                formatted_result = {
-                    "origins": origins,
-                    "destinations": destinations,
-                    "mode": mode,
-                    "matrix": result["result"],
-                }
-                
-                # 缓存结果
-                await cache.cache_map_data(cache_key, formatted_result, ttl=3600)  # 1小时缓存
-                return formatted_result
-            
-            return None
-            
-        except Exception as e:
-            logger.error("批量算路失败", origins=origins, destinations=destinations, mode=mode, error=str(e))
-            return None
+            return result.get("result") or None
+        
+        return await self._flight.do(f"directions_matrix_{mode}_{origins_str}_{destinations_str}", fetch)
+    
+    def get_route_stats(self) -> Dict[str, Any]:
+        """批量算路逐格缓存的命中统计"""
+        stats: Dict[str, Any] = dict(self._route_stats)
+        total = stats["cell_hits"] + stats["cell_misses"]
+        stats["cell_hit_ratio"] = round(stats["cell_hits"] / total, 4) if total else 0.0
+        return stats
     
     async def get_weather(
         self,
@@ -374,12 +682,7 @@ class BaiduMapService:
         """天气查询"""
         cache_key = f"weather_{location}_{district_id}"
         
-        # 检查缓存
-        cached_result = await cache.get_map_data(cache_key)
-        if cached_result:
-            return cached_result
-        
-        try:
+        async def fetch() -> Optional[Dict[str, Any]]:
             params = {}
             
             if location:
@@ -398,12 +701,12 @@ class BaiduMapService:
                     "update_time": weather_data.get("update_time", ""),
                 }
                 
-                # 缓存结果（较短时间）
-                await cache.cache_map_data(cache_key, formatted_result, ttl=1800)  # 30分钟缓存
                 return formatted_result
             
             return None
-            
+        
+        try:
+            return await self._cached_request(cache_key, fetch, ttl=1800, negative=False)  # 30分钟缓存
         except Exception as e:
             logger.error("天气查询失败", location=location, district_id=district_id, error=str(e))
             return None
@@ -412,12 +715,7 @@ class BaiduMapService:
         """IP定位"""
         cache_key = f"ip_location_{ip or 'current'}"
         
-        # 检查缓存
-        cached_result = await cache.get_map_data(cache_key)
-        if cached_result:
-            return cached_result
-        
-        try:
+        async def fetch() -> Optional[Dict[str, Any]]:
             params = {}
             if ip:
                 params["ip"] = ip
@@ -434,12 +732,12 @@ class BaiduMapService:
                     "point": content.get("point", {}),
                 }
                 
-                # 缓存结果
-                await cache.cache_map_data(cache_key, formatted_result, ttl=3600)  # 1小时缓存
                 return formatted_result
             
             return None
-            
+        
+        try:
+            return await self._cached_request(cache_key, fetch, ttl=3600, negative=False)  # 1小时缓存
         except Exception as e:
             logger.error("IP定位失败", ip=ip, error=str(e))
             return None
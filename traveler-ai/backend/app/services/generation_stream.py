@@ -0,0 +1,95 @@
+"""
+攻略生成事件流 - 支持断线续传的流式输出
+"""
+import asyncio
+import json
+from typing import Any, AsyncGenerator, Dict, Tuple
+import structlog
+
+from app.core.config import settings, Constants
+from app.core.redis import get_redis
+
+logger = structlog.get_logger()
+
+# 事件类型
+EVENT_STAGE = "stage"
+EVENT_TOKEN = "token"
+EVENT_ERROR = "error"
+EVENT_DONE = "done"
+
+
+class GenerationStream:
+    """单个攻略的生成事件日志
+
+    事件按顺序追加到Redis列表，下标即事件偏移量。
+    生成任务与SSE连接解耦：客户端断开不影响生成，
+    重连时从指定偏移量回放已生成内容后继续跟随。
+    """
+
+    def __init__(self, itinerary_id: int):
+        self.itinerary_id = itinerary_id
+        self.key = f"{Constants.CACHE_PREFIX_ITINERARY}{itinerary_id}:stream"
+        self.ttl = settings.GENERATION_STREAM_TTL
+
+    async def append(self, event_type: str, **data) -> int:
+        """追加事件，返回事件偏移量"""
+        client = await get_redis()
+        event = json.dumps({"type": event_type, **data}, ensure_ascii=False, default=str)
+        length = await client.rpush(self.key, event)
+        if length == 1:
+            await client.expire(self.key, self.ttl)
+        return length - 1
+
+    async def stage(self, stage: str) -> int:
+        """阶段标记：queued、prompt、overview、day N、locations、done"""
+        return await self.append(EVENT_STAGE, stage=stage)
+
+    async def token(self, stage: str, text: str) -> int:
+        """生成的文本片段"""
+        return await self.append(EVENT_TOKEN, stage=stage, text=text)
+
+    async def error(self, stage: str, message: str) -> int:
+        """阶段错误（单日失败等，不终止事件流）"""
+        return await self.append(EVENT_ERROR, stage=stage, message=message)
+
+    async def done(self, status: str, message: str = "") -> int:
+        """结束事件，跟随方收到后停止"""
+        return await self.append(EVENT_DONE, status=status, message=message)
+
+    async def exists(self) -> bool:
+        """事件流是否存在"""
+        client = await get_redis()
+        return bool(await client.exists(self.key))
+
+    async def follow(
+        self,
+        offset: int = 0,
+        poll_interval: float = 0.1
+    ) -> AsyncGenerator[Tuple[int, Dict[str, Any]], None]:
+        """从offset开始回放并跟随事件，直到done事件或长时间无新事件"""
+        client = await get_redis()
+        loop = asyncio.get_running_loop()
+        last_event_at = loop.time()
+
+        while True:
+            items = await client.lrange(self.key, offset, -1)
+            for raw in items:
+                event = json.loads(raw)
+                yield offset, event
+                offset += 1
+                if event.get("type") == EVENT_DONE:
+                    return
+
+            if items:
+                last_event_at = loop.time()
+            elif loop.time() - last_event_at > settings.GENERATION_TIMEOUT:
+                logger.warning("生成事件流等待超时", itinerary_id=self.itinerary_id, offset=offset)
+                return
+            else:
+                await asyncio.sleep(poll_interval)
+
+
+def format_sse(offset: int, event: Dict[str, Any]) -> str:
+    """格式化为SSE消息，id为事件偏移量，便于Last-Event-ID续传"""
+    data = json.dumps(event, ensure_ascii=False)
+    return f"id: {offset}\nevent: {event.get('type', 'message')}\ndata: {data}\n\n"
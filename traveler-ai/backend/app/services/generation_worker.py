@@ -0,0 +1,134 @@
+"""
+攻略生成队列消费者
+"""
+import asyncio
+from typing import Any, Dict, Optional, Set
+import structlog
+
+from app.core.config import settings
+from app.services.itinerary_service import itinerary_service
+
+logger = structlog.get_logger()
+
+
+class GenerationWorker:
+    """攻略生成worker
+
+    从生成队列取任务执行，同时运行的任务数不超过concurrency，
+    名额占满时不再出队，剩余任务留在Redis中由其他worker消费。
+    后台定期刷新队列心跳，并把已退出的worker未完成的任务移回队列；
+    多次中断的任务标记为失败。
+    """
+
+    def __init__(self, concurrency: Optional[int] = None):
+        self.concurrency = concurrency or settings.MAX_CONCURRENT_GENERATIONS
+        self.queue = itinerary_service.generation_queue
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop_task: Optional[asyncio.Task] = None
+        self._maintain_task: Optional[asyncio.Task] = None
+        self._jobs: Set[asyncio.Task] = set()
+
+    @property
+    def running(self) -> bool:
+        """worker是否在运行"""
+        return self._loop_task is not None and not self._loop_task.done()
+
+    async def start(self):
+        """启动消费循环"""
+        if self.running:
+            return
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        await self.queue.heartbeat()
+        self._maintain_task = asyncio.create_task(self._maintain())
+        self._loop_task = asyncio.create_task(self._consume())
+        logger.info("攻略生成worker已启动", concurrency=self.concurrency)
+
+    async def stop(self):
+        """停止消费并取消进行中的任务，被取消的任务放回队列"""
+        for name in ("_loop_task", "_maintain_task"):
+            task = getattr(self, name)
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+                setattr(self, name, None)
+
+        for job in list(self._jobs):
+            job.cancel()
+        if self._jobs:
+            await asyncio.gather(*self._jobs, return_exceptions=True)
+
+        try:
+            await self.queue.release()
+        except Exception as e:
+            logger.error("生成任务放回队列失败", error=str(e))
+
+        logger.info("攻略生成worker已停止")
+
+    async def _consume(self):
+        """消费循环：先占名额再出队"""
+        while True:
+            await self._semaphore.acquire()
+            try:
+                job = await self.queue.dequeue(timeout=1)
+            except asyncio.CancelledError:
+                self._semaphore.release()
+                raise
+            except Exception as e:
+                self._semaphore.release()
+                logger.error("生成任务出队失败", error=str(e))
+                await asyncio.sleep(1)
+                continue
+
+            if job is None:
+                self._semaphore.release()
+                continue
+
+            task = asyncio.create_task(self._execute(*job))
+            self._jobs.add(task)
+            task.add_done_callback(self._jobs.discard)
+
+    async def _maintain(self):
+        """定期刷新心跳，恢复已退出worker的任务"""
+        while True:
+            try:
+                await self.queue.heartbeat()
+                for job in await self.queue.recover_stale():
+                    await itinerary_service.abandon_generation_job(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("生成队列维护失败", error=str(e))
+            await asyncio.sleep(settings.QUEUE_HEARTBEAT_INTERVAL)
+
+    async def _execute(self, job: Dict[str, Any], message: bytes):
+        """执行单个生成任务，结束后确认；被取消时不确认，任务留待重新执行"""
+        itinerary_id = job.get("itinerary_id")
+        # 任务内的日志自动带上攻略ID
+        structlog.contextvars.bind_contextvars(itinerary_id=itinerary_id)
+        try:
+            logger.info("开始执行生成任务", itinerary_id=itinerary_id)
+            result = await itinerary_service.run_generation_job(job)
+            logger.info(
+                "生成任务执行结束",
+                itinerary_id=itinerary_id,
+                success=result.get("success", False)
+            )
+        except asyncio.CancelledError:
+            logger.warning("生成任务被取消", itinerary_id=itinerary_id)
+            raise
+        except Exception as e:
+            logger.error("生成任务执行异常", itinerary_id=itinerary_id, error=str(e))
+        finally:
+            self._semaphore.release()
+
+        try:
+            await self.queue.ack(message)
+        except Exception as e:
+            logger.error("生成任务确认失败", itinerary_id=itinerary_id, error=str(e))
+
+
+# 全局生成worker实例
+generation_worker = GenerationWorker()
@@ -1,20 +1,61 @@
 """
 旅游攻略生成核心服务
 """
-import os
 import json
+import asyncio
+import time
 from datetime import datetime, timedelta
 from typing import Dict, List, Any, Optional
+from sqlalchemy import func, select, update
+from sqlalchemy.dialects.postgresql import insert
 import structlog
 
 from app.services.ai_service import ai_service
 from app.services.baidu_map_service import baidu_map_service
 from app.models.itinerary import Itinerary, ItineraryDay, ItineraryStatus
-from app.models.template import Template
-from app.core.config import settings
+from app.core import metrics, tracing
+from app.core.config import settings, Constants
+from app.core.database import db_manager
+from app.core.redis import get_redis
+from app.core.task_queue import TaskQueue
+from app.services.generation_stream import GenerationStream
+from app.services.prompt_builder import prompt_builder
+from app.services.poi_enrichment import poi_enrichment_service
+from app.services.template_registry import template_registry
+from app.services.semantic_cache import semantic_cache, normalize_request, request_fingerprint, season_of
 
 logger = structlog.get_logger()
 
+# 生成进度对应的阶段说明
+GENERATION_STEPS = {
+    0: "排队等待中",
+    20: "提示词已生成",
+    60: "攻略概览已生成",
+    80: "内容增强完成",
+    90: "每日行程已生成",
+    95: "地点信息已补全",
+    100: "攻略生成完成",
+}
+
+# 每日行程中可直接写入数据库的字段
+ITINERARY_DAY_FIELDS = (
+    "day_number", "date", "title", "content", "markdown_content",
+    "attractions", "transportation", "total_distance", "total_duration",
+    "accommodation_name", "accommodation_address",
+    "accommodation_latitude", "accommodation_longitude",
+)
+
+# 复用已完成攻略时复制的内容字段，其余字段按新请求填写
+CLONE_ITINERARY_FIELDS = (
+    "description", "season", "ai_model", "generation_prompt", "generation_config",
+    "overview_content", "overview_markdown", "overview_html",
+    "center_latitude", "center_longitude", "bounds_data",
+    "tags", "featured_attractions", "cost_breakdown",
+)
+
+# 概览末尾追加的实时天气章节标题，复用概览时按此去掉旧天气
+WEATHER_HEADING = "## 🌤️ 实时天气"
+
 
 class ItineraryService:
     """旅游攻略生成服务"""
@@ -22,6 +63,7 @@ class ItineraryService:
     def __init__(self):
         self.ai_service = ai_service
         self.map_service = baidu_map_service
+        self.generation_queue = TaskQueue(Constants.QUEUE_ITINERARY_GENERATION)
     
     async def generate_itinerary_prompt(
         self,
@@ -31,21 +73,40 @@ class ItineraryService:
         budget_range: Optional[str] = None,
         group_size: int = 2,
         start_date: Optional[datetime] = None,
-        special_requirements: Optional[str] = None
+        special_requirements: Optional[str] = None,
+        include_volatile: bool = True
     ) -> str:
-        """生成攻略生成提示词"""
+        """生成攻略生成提示词
+        
+        include_volatile为False时不嵌入实时天气和具体日期（改用季节），
+        使相同请求参数得到相同提示词，便于语义缓存复用。
+        """
         
         # 获取目的地地理信息
         location_info = await self.map_service.geocode(destination)
         weather_info = None
-        if location_info:
+        if location_info and include_volatile:
             weather_info = await self.map_service.get_weather(
                 location=f"{location_info['latitude']},{location_info['longitude']}"
             )
         
-        # 读取攻略概览模板
-        overview_template = await self._load_template("overview")
-        daily_template = await self._load_template("daily")
+        if include_volatile:
+            date_line = f"- 出发日期：{start_date.strftime('%Y年%m月%d日') if start_date else '待定'}"
+            weather_text = self._format_weather_info(weather_info) if weather_info else "天气信息待查"
+        else:
+            date_line = f"- 出行季节：{season_of(start_date) if start_date else '待定'}"
+            weather_text = "实时天气将在生成后补充，请按出行季节给出穿着和装备建议"
+        
+        # 读取攻略概览模板（只传入不随时间变化的参数，保证提示词可被缓存复用）
+        template_context = {
+            "destination": destination,
+            "days": days,
+            "group_size": group_size,
+            "travel_style": travel_style or "休闲",
+            "budget_range": budget_range or "中等",
+        }
+        overview_template = await template_registry.render("overview", **template_context)
+        daily_template = await template_registry.render("daily", **template_context)
         
         # 构建提示词
         prompt = f"""
@@ -57,14 +118,14 @@ class ItineraryService:
 - 出行人数：{group_size}人
 - 旅行风格：{travel_style or '休闲'}
 - 预算范围：{budget_range or '中等'}
-- 出发日期：{start_date.strftime('%Y年%m月%d日') if start_date else '待定'}
+{date_line}
 
 ## 地理位置信息
 {f"经纬度：{location_info['latitude']:.4f}, {location_info['longitude']:.4f}" if location_info else "位置信息待查"}
 {f"详细地址：{location_info['formatted_address']}" if location_info else ""}
 
 ## 天气信息
-{self._format_weather_info(weather_info) if weather_info else "天气信息待查"}
+{weather_text}
 
 ## 特殊要求
 {special_requirements or '无特殊要求'}
@@ -94,35 +155,6 @@ class ItineraryService:
         
         return prompt.strip()
     
-    async def _load_template(self, template_type: str) -> str:
-        """加载模板内容"""
-        try:
-            template_files = {
-                "overview": "旅游概览模板.md",
-                "daily": "每日行程模板.md"
-            }
-            
-            template_file = template_files.get(template_type)
-            if not template_file:
-                return f"# {template_type}模板\n模板内容待定"
-            
-            template_path = os.path.join(settings.TEMPLATES_PATH or "templates", template_file)
-            
-            # 如果模板文件不存在，从项目根目录的templates文件夹读取
-            if not os.path.exists(template_path):
-                template_path = os.path.join("templates", template_file)
-            
-            if os.path.exists(template_path):
-                with open(template_path, 'r', encoding='utf-8') as f:
-                    return f.read()
-            else:
-                logger.warning("模板文件不存在", template_type=template_type, path=template_path)
-                return f"# {template_type}模板\n模板内容待定"
-                
-        except Exception as e:
-            logger.error("加载模板失败", template_type=template_type, error=str(e))
-            return f"# {template_type}模板\n模板加载失败：{str(e)}"
-    
     def _format_weather_info(self, weather_info: Dict[str, Any]) -> str:
         """格式化天气信息"""
         if not weather_info:
@@ -142,6 +174,7 @@ class ItineraryService:
         
         return "\n".join(info)
     
+    @tracing.traced("itinerary.generate")
     async def generate_itinerary(
         self,
         destination: str,
@@ -153,12 +186,33 @@ class ItineraryService:
         group_size: int = 2,
         start_date: Optional[datetime] = None,
         ai_provider: Optional[str] = None,
-        special_requirements: Optional[str] = None
+        special_requirements: Optional[str] = None,
+        itinerary_id: Optional[int] = None,
+        stream: Optional[GenerationStream] = None,
+        warm_start_id: Optional[int] = None
     ) -> Dict[str, Any]:
-        """生成旅游攻略"""
+        """生成旅游攻略
+        
+        传入itinerary_id时，每个阶段完成后同步更新数据库中的进度，
+        生成结果写回对应的攻略记录；传入stream时，AI输出按片段写入事件流；
+        传入warm_start_id时沿用该攻略的概览，只重新生成每日行程。
+        """
+        root_span = tracing.current_span()
+        root_span.set_attributes(tracing.clean_attributes({
+            "itinerary.id": itinerary_id,
+            "itinerary.destination": destination,
+            "itinerary.days": days,
+            "itinerary.ai_provider": ai_provider or settings.DEFAULT_AI_PROVIDER,
+        }))
+        stages = tracing.StageSpans("itinerary")
         
         try:
             logger.info("开始生成旅游攻略", destination=destination, days=days, user_id=user_id)
+            stage_started = time.perf_counter()
+            stages.switch("prompt")
+            
+            if stream:
+                await stream.stage("prompt")
             
             # 1. 创建攻略记录
             itinerary_data = {
@@ -185,6 +239,7 @@ class ItineraryService:
             elif budget_max:
                 budget_range = f"{budget_max}元以内"
             
+            use_semantic_cache = settings.SEMANTIC_CACHE_ENABLED
             prompt = await self.generate_itinerary_prompt(
                 destination=destination,
                 days=days,
@@ -192,41 +247,124 @@ class ItineraryService:
                 budget_range=budget_range,
                 group_size=group_size,
                 start_date=start_date,
-                special_requirements=special_requirements
+                special_requirements=special_requirements,
+                include_volatile=not use_semantic_cache
             )
             
             itinerary_data["generation_prompt"] = prompt
-            itinerary_data["progress"] = 20
+            await self._set_progress(itinerary_id, itinerary_data, 20)
+            stage_started = metrics.observe_stage("prompt", stage_started)
+            stages.switch("overview")
             
             # 3. 调用AI生成攻略内容
             logger.info("调用AI生成攻略内容", ai_provider=ai_provider)
             
-            overview_content = await self.ai_service.generate_completion(
-                prompt=prompt,
-                provider_name=ai_provider,
-                temperature=0.8,
-                max_tokens=8000
-            )
+            overview_kwargs = {"temperature": 0.8, "max_tokens": 8000}
+            overview_content = None
+            location_info = None
+            
+            if warm_start_id:
+                overview_content = await self._load_warm_start_overview(warm_start_id)
+            warm_started = overview_content is not None
+            root_span.set_attribute("itinerary.warm_started", warm_started)
+            if warm_started and stream:
+                await stream.stage("overview")
+                await stream.token("overview", overview_content)
+            
+            if overview_content is None and use_semantic_cache:
+                # 按归一化请求参数查找缓存，天气等易变信息在取回后再补充
+                location_info = await self.map_service.geocode(destination)
+                cache_params = normalize_request(
+                    destination=destination,
+                    days=days,
+                    location_info=location_info,
+                    travel_style=travel_style,
+                    budget_min=budget_min,
+                    budget_max=budget_max,
+                    group_size=group_size,
+                    start_date=start_date,
+                    special_requirements=special_requirements
+                )
+                cache_key = semantic_cache.build_key(cache_params, ai_provider, **overview_kwargs)
+                overview_content = await semantic_cache.lookup(
+                    cache_key, cache_params, ai_provider, **overview_kwargs
+                )
+                root_span.set_attribute("itinerary.semantic_cache_hit", overview_content is not None)
+                if overview_content and stream:
+                    await stream.stage("overview")
+                    await stream.token("overview", overview_content)
+            
+            if overview_content is None:
+                overview_content = await self._complete(
+                    prompt=prompt,
+                    provider_name=ai_provider,
+                    stream=stream,
+                    stage="overview",
+                    use_cache=not use_semantic_cache,
+                    hedge=True,
+                    **overview_kwargs
+                )
+                if use_semantic_cache:
+                    await semantic_cache.store(
+                        cache_key, cache_params, overview_content, ai_provider, **overview_kwargs
+                    )
+            
+            if use_semantic_cache or warm_started:
+                if location_info is None:
+                    location_info = await self.map_service.geocode(destination)
+                weather_section = await self._build_weather_section(location_info)
+                if weather_section:
+                    overview_content = f"{overview_content.rstrip()}\n\n{weather_section}"
+                    if stream:
+                        await stream.token("overview", f"\n\n{weather_section}")
             
             itinerary_data["overview_content"] = overview_content
             itinerary_data["overview_markdown"] = overview_content  # 假设AI直接生成Markdown
-            itinerary_data["progress"] = 60
+            await self._set_progress(itinerary_id, itinerary_data, 60)
+            stage_started = metrics.observe_stage("overview", stage_started)
+            stages.switch("enhance")
             
-            # 4. 解析和增强内容
+            # 4. 解析和增强内容，按地理位置把景点分到各天
             await self._enhance_itinerary_content(itinerary_data)
-            itinerary_data["progress"] = 80
+            day_plan = None
+            if settings.DAY_CLUSTERING_ENABLED and days > 1:
+                day_plan = await self._plan_days(destination, overview_content, days)
+            await self._set_progress(itinerary_id, itinerary_data, 80)
+            stage_started = metrics.observe_stage("enhance", stage_started)
+            stages.switch("daily")
             
             # 5. 生成每日行程
             daily_itineraries = await self._generate_daily_itineraries(
-                itinerary_data, overview_content
+                itinerary_data, overview_content, stream=stream, day_plan=day_plan
             )
-            itinerary_data["progress"] = 90
+            await self._set_progress(itinerary_id, itinerary_data, 90)
+            stage_started = metrics.observe_stage("daily", stage_started)
+            stages.close()
+            
+            # 6. 提取地点并补全坐标、每日里程
+            if settings.POI_ENRICHMENT_ENABLED:
+                stages.switch("locations")
+                if stream:
+                    await stream.stage("locations")
+                await self._enrich_locations(itinerary_data, daily_itineraries)
+                await self._set_progress(itinerary_id, itinerary_data, 95)
+                stage_started = metrics.observe_stage("locations", stage_started)
+                stages.close()
             
-            # 6. 完成生成
+            # 7. 完成生成
             itinerary_data["status"] = ItineraryStatus.COMPLETED
             itinerary_data["progress"] = 100
             itinerary_data["completed_at"] = datetime.utcnow()
             
+            if itinerary_id:
+                stages.switch("save")
+                await self._save_generation_result(itinerary_id, itinerary_data, daily_itineraries)
+                metrics.observe_stage("save", stage_started)
+                stages.close()
+            
+            if stream:
+                await stream.done(ItineraryStatus.COMPLETED.value, "攻略生成完成")
+            
             logger.info("旅游攻略生成完成", destination=destination, days=days)
             
             return {
@@ -238,11 +376,37 @@ class ItineraryService:
             
         except Exception as e:
             logger.error("旅游攻略生成失败", destination=destination, error=str(e))
+            stages.close(e)
+            root_span.record_exception(e)
+            if itinerary_id:
+                await self._mark_failed(itinerary_id, str(e))
+            if stream:
+                await stream.done(ItineraryStatus.FAILED.value, str(e))
             return {
                 "success": False,
                 "error": str(e),
                 "message": "攻略生成失败"
             }
+        finally:
+            stages.close()
+    
+    async def _load_warm_start_overview(self, source_id: int) -> Optional[str]:
+        """读取源攻略的概览并去掉旧的实时天气章节，失败时返回None重新生成"""
+        async def _query(session):
+            result = await session.execute(
+                select(Itinerary.overview_content).where(Itinerary.id == source_id)
+            )
+            return result.scalar_one_or_none()
+        
+        try:
+            overview_content = await db_manager.execute_transaction(_query)
+        except Exception as e:
+            logger.error("读取复用概览失败", source_id=source_id, error=str(e))
+            return None
+        
+        if not overview_content:
+            return None
+        return overview_content.split(f"\n\n{WEATHER_HEADING}")[0]
     
     async def _enhance_itinerary_content(self, itinerary_data: Dict[str, Any]):
         """增强攻略内容 - 添加地理位置信息"""
@@ -256,83 +420,673 @@ class ItineraryService:
                 itinerary_data["center_longitude"] = location_info["longitude"]
             
             # 这里可以添加更多增强逻辑，比如：
-            # - 提取景点列表并获取详细信息
             # - 计算总预算
-            # - 生成地图边界数据
             # - 添加标签
+            # 景点提取和地图边界在每日行程生成后由 _enrich_locations 处理
             
         except Exception as e:
             logger.error("增强攻略内容失败", error=str(e))
     
+    async def _plan_days(
+        self,
+        destination: str,
+        overview_content: str,
+        days: int
+    ) -> Optional[Dict[int, List[str]]]:
+        """景点按地理位置分到各天，失败时沿用概览的安排"""
+        try:
+            return await poi_enrichment_service.plan_days(destination, overview_content, days)
+        except Exception as e:
+            logger.error("景点按天分组失败", destination=destination, error=str(e))
+            return None
+    
+    async def _enrich_locations(
+        self,
+        itinerary_data: Dict[str, Any],
+        daily_itineraries: List[Dict[str, Any]]
+    ):
+        """补全景点坐标、每日里程等地点信息，失败不影响生成结果"""
+        try:
+            await poi_enrichment_service.enrich(itinerary_data, daily_itineraries)
+        except Exception as e:
+            logger.error("补全地点信息失败", error=str(e))
+    
+    async def _build_weather_section(self, location_info: Optional[Dict[str, Any]]) -> str:
+        """生成实时天气章节，在缓存内容取回后追加"""
+        if not location_info:
+            return ""
+        weather_info = await self.map_service.get_weather(
+            location=f"{location_info['latitude']},{location_info['longitude']}"
+        )
+        if not weather_info:
+            return ""
+        return f"{WEATHER_HEADING}\n\n{self._format_weather_info(weather_info)}"
+    
+    async def _complete(
+        self,
+        prompt: str,
+        provider_name: Optional[str],
+        stream: Optional[GenerationStream] = None,
+        stage: str = "",
+        use_cache: bool = True,
+        hedge: bool = False,
+        **kwargs
+    ) -> str:
+        """调用AI生成文本，有事件流时改用流式接口并实时写入片段
+        
+        hedge只对非流式调用生效，流式输出开始后无法切换提供商。
+        """
+        if stream is None:
+            return await self.ai_service.generate_completion(
+                prompt=prompt,
+                provider_name=provider_name,
+                use_cache=use_cache,
+                hedge=hedge,
+                **kwargs
+            )
+        
+        await stream.stage(stage)
+        chunks = []
+        async for chunk in self.ai_service.generate_stream(
+            prompt,
+            provider_name=provider_name,
+            **kwargs
+        ):
+            chunks.append(chunk)
+            await stream.token(stage, chunk)
+        return "".join(chunks)
+    
     async def _generate_daily_itineraries(
         self, 
         itinerary_data: Dict[str, Any], 
-        overview_content: str
+        overview_content: str,
+        stream: Optional[GenerationStream] = None,
+        day_plan: Optional[Dict[int, List[str]]] = None
     ) -> List[Dict[str, Any]]:
-        """生成每日详细行程"""
-        daily_itineraries = []
+        """生成每日详细行程
+        
+        各天并行生成，并发度由AI服务提供商的并发上限控制；
+        结果按天数顺序返回，单日失败不影响其他天。
+        day_plan为按地理位置分好的每日景点，提供时替换概览中的每日安排。
+        """
+        days = itinerary_data["days"]
+        
+        # 概览只解析一次，各天共享摘要前缀
+        overview = overview_content
+        if settings.PROMPT_COMPACTION_ENABLED:
+            overview = prompt_builder.extract_summary(overview_content, days)
+            if day_plan:
+                overview = prompt_builder.apply_day_plan(overview, day_plan)
+        
+        tasks = [
+            self._generate_single_day(
+                itinerary_data, overview, day_num, stream,
+                pois=day_plan.get(day_num) if day_plan else None
+            )
+            for day_num in range(1, days + 1)
+        ]
+        daily_itineraries = await asyncio.gather(*tasks)
+        
+        failed_days = [day["day_number"] for day in daily_itineraries if day.get("error")]
+        if failed_days:
+            logger.warning("部分每日行程生成失败", failed_days=failed_days, total_days=days)
+        
+        return list(daily_itineraries)
+    
+    async def _generate_single_day(
+        self,
+        itinerary_data: Dict[str, Any],
+        overview: Any,
+        day_num: int,
+        stream: Optional[GenerationStream] = None,
+        pois: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """生成单日行程，失败时返回带错误信息的占位结果
+        
+        overview为概览摘要（dict）或完整概览文本（str），pois为分配到当天的景点。
+        """
+        current_date = None
+        start_date = itinerary_data.get("start_date")
+        if start_date:
+            current_date = start_date + timedelta(days=day_num - 1)
+        
+        daily_data = {
+            "day_number": day_num,
+            "date": current_date,
+            "title": f"第{day_num}天",
+            "content": None,
+            "markdown_content": None,
+        }
+        
+        if isinstance(overview, dict):
+            daily_prompt = prompt_builder.build_daily_prompt(overview, day_num)
+        else:
+            daily_prompt = prompt_builder.build_full_daily_prompt(overview, day_num, pois)
+        
+        try:
+            daily_content = await self._complete(
+                prompt=daily_prompt,
+                provider_name=itinerary_data.get("ai_provider"),
+                stream=stream,
+                stage=f"day {day_num}",
+                temperature=0.7,
+                max_tokens=4000
+            )
+            daily_data["content"] = daily_content
+            daily_data["markdown_content"] = daily_content
+        except Exception as e:
+            logger.error("生成每日行程失败", day_number=day_num, error=str(e))
+            daily_data["error"] = str(e)
+            if stream:
+                await stream.error(f"day {day_num}", str(e))
+        
+        return daily_data
+    
+    async def _set_progress(
+        self,
+        itinerary_id: Optional[int],
+        itinerary_data: Dict[str, Any],
+        progress: int
+    ):
+        """更新生成进度，异步任务模式下同步写入数据库"""
+        itinerary_data["progress"] = progress
+        if not itinerary_id:
+            return
+        
+        try:
+            await self._update_itinerary(
+                itinerary_id,
+                progress=progress,
+                status=ItineraryStatus.GENERATING
+            )
+        except Exception as e:
+            # 进度写入失败不影响生成流程
+            logger.error("更新生成进度失败", itinerary_id=itinerary_id, error=str(e))
+    
+    async def _update_itinerary(self, itinerary_id: int, **values):
+        """单行更新攻略记录"""
+        async def _update(session):
+            await session.execute(
+                update(Itinerary).where(Itinerary.id == itinerary_id).values(**values)
+            )
+        
+        await db_manager.execute_transaction(_update)
+    
+    async def _mark_failed(self, itinerary_id: int, error_message: str):
+        """标记攻略生成失败"""
+        try:
+            await self._update_itinerary(
+                itinerary_id,
+                status=ItineraryStatus.FAILED,
+                error_message=error_message
+            )
+        except Exception as e:
+            logger.error("更新攻略失败状态失败", itinerary_id=itinerary_id, error=str(e))
+    
+    async def _save_generation_result(
+        self,
+        itinerary_id: int,
+        itinerary_data: Dict[str, Any],
+        daily_itineraries: List[Dict[str, Any]]
+    ):
+        """保存生成结果到攻略记录和每日行程
+        
+        攻略记录单行更新，每日行程一条批量INSERT写入；
+        同一攻略重新生成时按(攻略ID, 天数)覆盖已有的每日行程，不会重复插入。
+        """
+        itinerary_columns = set(Itinerary.__table__.columns.keys()) - {"id", "user_id"}
+        values = {k: v for k, v in itinerary_data.items() if k in itinerary_columns}
+        rows = [
+            {"itinerary_id": itinerary_id, **{k: day.get(k) for k in ITINERARY_DAY_FIELDS}}
+            for day in daily_itineraries
+        ]
+        
+        stmt = insert(ItineraryDay)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[ItineraryDay.itinerary_id, ItineraryDay.day_number],
+            set_={
+                **{k: getattr(stmt.excluded, k) for k in ITINERARY_DAY_FIELDS if k != "day_number"},
+                "updated_at": func.now(),
+            }
+        )
+        
+        async def _save(session):
+            await session.execute(
+                update(Itinerary).where(Itinerary.id == itinerary_id).values(**values)
+            )
+            if rows:
+                await session.execute(stmt, rows)
+        
+        await db_manager.execute_transaction(_save)
+    
+    async def enqueue_generation(
+        self,
+        destination: str,
+        days: int,
+        user_id: int,
+        **params
+    ) -> Dict[str, Any]:
+        """创建攻略记录并提交到生成队列，立即返回攻略ID
+        
+        相同需求的攻略刚完成过时直接复制，不进入队列。
+        """
+        match = await self._match_request(destination, days, **params)
+        if match["fresh"]:
+            itinerary_id = await self._clone_itinerary(match, destination, days, user_id, **params)
+            return {
+                "success": True,
+                "itinerary_id": itinerary_id,
+                "status": ItineraryStatus.COMPLETED.value,
+                "message": "已复用相同需求的攻略"
+            }
+        
+        if not await self._acquire_user_slot(user_id):
+            return {
+                "success": False,
+                "error": "TOO_MANY_GENERATIONS",
+                "message": f"同时进行的攻略生成不能超过{settings.MAX_CONCURRENT_GENERATIONS_PER_USER}个"
+            }
         
         try:
-            days = itinerary_data["days"]
-            start_date = itinerary_data.get("start_date")
+            itinerary_id = await self._create_itinerary_record(
+                destination, days, user_id, match=match, **params
+            )
             
-            for day_num in range(1, days + 1):
-                current_date = None
-                if start_date:
-                    current_date = start_date + timedelta(days=day_num - 1)
-                
-                # 为每一天生成详细提示词
-                daily_prompt = f"""
-基于以下攻略概览，生成第{day_num}天的详细行程安排：
-
-{overview_content}
-
-请生成第{day_num}天的详细内容，包括：
-1. 详细时间安排（每小时）
-2. 景点介绍和游览建议
-3. 交通路线和时间
-4. 餐饮推荐
-5. 住宿安排
-6. 费用预算
-7. 注意事项
-
-格式要求：请使用Markdown格式，结构清晰，信息详实。
-"""
-                
-                # 生成每日内容
-                daily_content = await self.ai_service.generate_completion(
-                    prompt=daily_prompt,
-                    provider_name=itinerary_data.get("ai_provider"),
-                    temperature=0.7,
-                    max_tokens=4000
+            await self.generation_queue.enqueue({
+                "itinerary_id": itinerary_id,
+                "destination": destination,
+                "days": days,
+                "user_id": user_id,
+                "warm_start_id": match["source_id"],
+                **params
+            })
+        except Exception:
+            await self.release_user_slot(user_id)
+            raise
+        
+        logger.info("攻略生成任务已提交", itinerary_id=itinerary_id, user_id=user_id)
+        
+        return {
+            "success": True,
+            "itinerary_id": itinerary_id,
+            "status": ItineraryStatus.PENDING.value,
+            "message": "攻略生成任务已提交"
+        }
+    
+    async def _create_itinerary_record(
+        self,
+        destination: str,
+        days: int,
+        user_id: int,
+        match: Optional[Dict[str, Any]] = None,
+        **params
+    ) -> int:
+        """插入待生成的攻略记录，返回攻略ID；match中有源攻略时记为复用概览"""
+        match = match or {}
+        source_id = match.get("source_id")
+        
+        async def _create(session):
+            result = await session.execute(
+                insert(Itinerary).values(
+                    **self._request_values(destination, days, user_id, **params),
+                    fingerprint=match.get("fingerprint"),
+                    reuse_type="warm_start" if source_id else None,
+                    source_itinerary_id=source_id,
+                    status=ItineraryStatus.PENDING,
+                    progress=0
+                ).returning(Itinerary.id)
+            )
+            return result.scalar_one()
+        
+        return await db_manager.execute_transaction(_create)
+    
+    def _request_values(self, destination: str, days: int, user_id: int, **params) -> Dict[str, Any]:
+        """攻略记录中由请求参数决定的字段"""
+        return {
+            "title": f"{destination}{days}日游攻略",
+            "destination": destination,
+            "days": days,
+            "user_id": user_id,
+            "travel_style": params.get("travel_style"),
+            "budget_min": params.get("budget_min"),
+            "budget_max": params.get("budget_max"),
+            "group_size": params.get("group_size", 2),
+            "start_date": params.get("start_date"),
+            "ai_provider": params.get("ai_provider") or settings.DEFAULT_AI_PROVIDER,
+        }
+    
+    async def _match_request(self, destination: str, days: int, **params) -> Dict[str, Any]:
+        """计算请求指纹并查找可复用的已完成攻略
+        
+        返回 fingerprint、source_id（可复用的源攻略，没有为None）、
+        fresh（源攻略在ITINERARY_REUSE_MAX_AGE内完成，可直接复制）。
+        只匹配新生成的攻略，复用得到的攻略不再作为源，避免内容越传越旧。
+        """
+        match = {"fingerprint": None, "source_id": None, "fresh": False}
+        if not settings.ITINERARY_REUSE_ENABLED:
+            return match
+        
+        try:
+            location_info = await self.map_service.geocode(destination)
+            match["fingerprint"] = request_fingerprint(normalize_request(
+                destination=destination,
+                days=days,
+                location_info=location_info,
+                travel_style=params.get("travel_style"),
+                budget_min=params.get("budget_min"),
+                budget_max=params.get("budget_max"),
+                group_size=params.get("group_size"),
+                start_date=params.get("start_date"),
+                special_requirements=params.get("special_requirements")
+            ))
+            
+            async def _query(session):
+                result = await session.execute(
+                    select(
+                        Itinerary.id,
+                        (Itinerary.completed_at >= func.now() - timedelta(
+                            seconds=settings.ITINERARY_REUSE_MAX_AGE
+                        )).label("fresh")
+                    )
+                    .where(
+                        Itinerary.fingerprint == match["fingerprint"],
+                        Itinerary.status == ItineraryStatus.COMPLETED,
+                        Itinerary.reuse_type.is_(None),
+                        Itinerary.completed_at >= func.now() - timedelta(
+                            seconds=settings.ITINERARY_WARM_START_MAX_AGE
+                        )
+                    )
+                    .order_by(Itinerary.completed_at.desc())
+                    .limit(1)
                 )
-                
-                daily_data = {
-                    "day_number": day_num,
-                    "date": current_date,
-                    "title": f"第{day_num}天",
-                    "content": daily_content,
-                    "markdown_content": daily_content,
-                }
-                
-                daily_itineraries.append(daily_data)
-                
+                return result.first()
+            
+            row = await db_manager.execute_transaction(_query)
         except Exception as e:
-            logger.error("生成每日行程失败", error=str(e))
+            logger.error("查找可复用攻略失败", destination=destination, error=str(e))
+            return match
+        
+        if row is not None:
+            match["source_id"] = row.id
+            match["fresh"] = bool(row.fresh)
+            logger.info("找到可复用的攻略", destination=destination, source_id=row.id, fresh=match["fresh"])
+        return match
+    
+    async def _clone_itinerary(
+        self,
+        match: Dict[str, Any],
+        destination: str,
+        days: int,
+        user_id: int,
+        **params
+    ) -> int:
+        """复制源攻略的内容和每日行程，生成新用户的已完成攻略，返回攻略ID"""
+        source_id = match["source_id"]
+        start_date = params.get("start_date")
+        day_columns = [
+            column for column in ItineraryDay.__table__.columns.keys()
+            if column not in ("id", "itinerary_id", "date", "created_at", "updated_at")
+        ]
         
-        return daily_itineraries
+        async def _clone(session):
+            source = await session.execute(
+                select(*[getattr(Itinerary, field) for field in CLONE_ITINERARY_FIELDS])
+                .where(Itinerary.id == source_id)
+            )
+            result = await session.execute(
+                insert(Itinerary).values(
+                    **self._request_values(destination, days, user_id, **params),
+                    **source.one()._asdict(),
+                    fingerprint=match["fingerprint"],
+                    reuse_type="clone",
+                    source_itinerary_id=source_id,
+                    status=ItineraryStatus.COMPLETED,
+                    progress=100,
+                    completed_at=func.now()
+                ).returning(Itinerary.id)
+            )
+            itinerary_id = result.scalar_one()
+            
+            source_days = await session.execute(
+                select(*[getattr(ItineraryDay, column) for column in day_columns])
+                .where(ItineraryDay.itinerary_id == source_id)
+            )
+            rows = [
+                {
+                    **day._asdict(),
+                    "itinerary_id": itinerary_id,
+                    "date": start_date + timedelta(days=day.day_number - 1) if start_date else None,
+                }
+                for day in source_days
+            ]
+            if rows:
+                await session.execute(insert(ItineraryDay), rows)
+            return itinerary_id
+        
+        itinerary_id = await db_manager.execute_transaction(_clone)
+        logger.info("已复用相同需求的攻略", itinerary_id=itinerary_id, source_id=source_id, user_id=user_id)
+        return itinerary_id
+    
+    async def _replay_to_stream(self, itinerary_id: int, stream: GenerationStream):
+        """把复制得到的攻略内容写入事件流，与实时生成的事件格式一致"""
+        result = await self.get_itinerary(itinerary_id)
+        await stream.stage("overview")
+        await stream.token("overview", result["itinerary"].get("overview_content") or "")
+        for day in result["daily_itineraries"]:
+            stage = f"day {day['day_number']}"
+            await stream.stage(stage)
+            await stream.token(stage, day.get("content") or "")
+        await stream.done(ItineraryStatus.COMPLETED.value, "已复用相同需求的攻略")
     
-    async def get_generation_progress(self, itinerary_id: int) -> Dict[str, Any]:
+    async def get_reuse_stats(self) -> Dict[str, Any]:
+        """攻略复用统计：直接复制、复用概览的数量及占比"""
+        async def _query(session):
+            result = await session.execute(
+                select(
+                    func.count(),
+                    func.count().filter(Itinerary.reuse_type == "clone"),
+                    func.count().filter(Itinerary.reuse_type == "warm_start")
+                ).select_from(Itinerary)
+            )
+            return result.one()
+        
+        total, cloned, warm_started = await db_manager.execute_transaction(_query)
+        return {
+            "total": total,
+            "cloned": cloned,
+            "warm_started": warm_started,
+            "reuse_ratio": round((cloned + warm_started) / total, 4) if total else 0.0,
+        }
+    
+    async def start_stream_generation(
+        self,
+        destination: str,
+        days: int,
+        user_id: int,
+        **params
+    ) -> Dict[str, Any]:
+        """创建攻略记录并提交到生成队列，返回攻略ID
+        
+        与enqueue_generation共用生成队列和worker，worker执行时把结果写入事件流；
+        接口只跟随事件流，与客户端连接解耦，断线后可按偏移量续传。
+        相同需求的攻略刚完成过时直接复制，并把内容一次性写入事件流。
+        """
+        match = await self._match_request(destination, days, **params)
+        if match["fresh"]:
+            itinerary_id = await self._clone_itinerary(match, destination, days, user_id, **params)
+            await self._replay_to_stream(itinerary_id, GenerationStream(itinerary_id))
+            return {
+                "success": True,
+                "itinerary_id": itinerary_id,
+                "status": ItineraryStatus.COMPLETED.value,
+                "message": "已复用相同需求的攻略"
+            }
+        
+        if not await self._acquire_user_slot(user_id):
+            return {
+                "success": False,
+                "error": "TOO_MANY_GENERATIONS",
+                "message": f"同时进行的攻略生成不能超过{settings.MAX_CONCURRENT_GENERATIONS_PER_USER}个"
+            }
+        
+        try:
+            itinerary_id = await self._create_itinerary_record(
+                destination, days, user_id, match=match, **params
+            )
+            
+            # 先写入排队事件，事件流立即存在，客户端可随时续传
+            await GenerationStream(itinerary_id).stage("queued")
+            await self.generation_queue.enqueue({
+                "itinerary_id": itinerary_id,
+                "destination": destination,
+                "days": days,
+                "user_id": user_id,
+                "warm_start_id": match["source_id"],
+                "stream": True,
+                **params
+            })
+        except Exception:
+            await self.release_user_slot(user_id)
+            raise
+        
+        logger.info("流式攻略生成任务已提交", itinerary_id=itinerary_id, user_id=user_id)
+        
+        return {
+            "success": True,
+            "itinerary_id": itinerary_id,
+            "status": ItineraryStatus.PENDING.value,
+            "message": "攻略生成任务已提交"
+        }
+    
+    async def run_generation_job(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        """执行队列中的生成任务（由worker调用）
+        
+        任务结束（完成、失败或超时）后释放用户名额；被取消时任务会放回队列
+        由其他worker继续执行，名额保持占用。
+        """
+        job = dict(job)
+        itinerary_id = job.pop("itinerary_id")
+        stream = GenerationStream(itinerary_id) if job.pop("stream", False) else None
+        
+        start_date = job.get("start_date")
+        if isinstance(start_date, str):
+            job["start_date"] = datetime.fromisoformat(start_date)
+        
+        try:
+            result = await asyncio.wait_for(
+                self.generate_itinerary(itinerary_id=itinerary_id, stream=stream, **job),
+                timeout=settings.GENERATION_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            logger.error("攻略生成超时", itinerary_id=itinerary_id)
+            await self._mark_failed(itinerary_id, f"生成超时（{settings.GENERATION_TIMEOUT}秒）")
+            if stream:
+                await stream.done(ItineraryStatus.FAILED.value, "攻略生成超时")
+            result = {
+                "success": False,
+                "error": "GENERATION_TIMEOUT",
+                "message": "攻略生成超时"
+            }
+        except Exception:
+            await self.release_user_slot(job["user_id"])
+            raise
+        
+        await self.release_user_slot(job["user_id"])
+        return result
+    
+    async def abandon_generation_job(self, job: Dict[str, Any]):
+        """放弃多次中断的生成任务：标记失败、结束事件流并释放用户名额"""
+        itinerary_id = job.get("itinerary_id")
+        if itinerary_id:
+            await self._mark_failed(itinerary_id, "生成任务多次中断，请重新提交")
+            if job.get("stream"):
+                try:
+                    await GenerationStream(itinerary_id).done(ItineraryStatus.FAILED.value, "生成任务多次中断，请重新提交")
+                except Exception as e:
+                    logger.error("结束生成事件流失败", itinerary_id=itinerary_id, error=str(e))
+        if job.get("user_id") is not None:
+            await self.release_user_slot(job["user_id"])
+    
+    def _user_slot_key(self, user_id: int) -> str:
+        """用户并发生成计数键"""
+        return f"{Constants.QUEUE_ITINERARY_GENERATION}:active:{user_id}"
+    
+    async def _acquire_user_slot(self, user_id: int) -> bool:
+        """占用用户并发生成名额"""
+        client = await get_redis()
+        key = self._user_slot_key(user_id)
+        active = await client.incr(key)
+        # 计数键兜底过期，避免worker异常退出后名额永久占用
+        await client.expire(key, settings.GENERATION_TIMEOUT * 2)
+        
+        if active > settings.MAX_CONCURRENT_GENERATIONS_PER_USER:
+            await client.decr(key)
+            return False
+        return True
+    
+    async def release_user_slot(self, user_id: int):
+        """释放用户并发生成名额"""
+        try:
+            client = await get_redis()
+            key = self._user_slot_key(user_id)
+            if await client.decr(key) <= 0:
+                await client.delete(key)
+        except Exception as e:
+            logger.error("释放用户生成名额失败", user_id=user_id, error=str(e))
+    
+    async def get_generation_progress(self, itinerary_id: int) -> Optional[Dict[str, Any]]:
         """获取生成进度"""
-        # 这里应该从数据库查询实际进度
-        # 暂时返回模拟数据
+        async def _query(session):
+            result = await session.execute(
+                select(
+                    Itinerary.progress,
+                    Itinerary.status,
+                    Itinerary.error_message
+                ).where(Itinerary.id == itinerary_id)
+            )
+            return result.first()
+        
+        row = await db_manager.execute_transaction(_query)
+        if row is None:
+            return None
+        
+        progress = row.progress or 0
+        status = row.status.value if row.status else ItineraryStatus.PENDING.value
+        
+        if row.status == ItineraryStatus.FAILED:
+            message = row.error_message or "攻略生成失败"
+        else:
+            message = GENERATION_STEPS.get(progress, "攻略生成中")
+        
         return {
             "itinerary_id": itinerary_id,
-            "progress": 100,
-            "status": "completed",
-            "message": "攻略生成完成"
+            "progress": progress,
+            "status": status,
+            "message": message,
+            "current_step": GENERATION_STEPS.get(progress)
         }
     
+    async def get_itinerary(self, itinerary_id: int) -> Optional[Dict[str, Any]]:
+        """获取攻略及每日行程"""
+        async def _query(session):
+            itinerary = await session.get(Itinerary, itinerary_id)
+            if itinerary is None:
+                return None
+            
+            result = await session.execute(
+                select(ItineraryDay)
+                .where(ItineraryDay.itinerary_id == itinerary_id)
+                .order_by(ItineraryDay.day_number)
+            )
+            return {
+                "itinerary": itinerary.to_dict(include_content=True),
+                "daily_itineraries": [
+                    day.to_dict(include_content=True) for day in result.scalars()
+                ]
+            }
+        
+        return await db_manager.execute_transaction(_query)
+    
     async def validate_generation_request(
         self,
         destination: str,
@@ -0,0 +1,392 @@
+"""
+本地地点服务 - 地点入库与基于Geohash网格的附近检索
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional
+from sqlalchemy import func, or_, select, update
+from sqlalchemy.dialects.postgresql import insert
+import structlog
+
+from app.core.config import settings
+from app.core.database import db_manager
+from app.core.single_flight import SingleFlight
+from app.models.location import Location
+from app.services.baidu_map_service import baidu_map_service
+from app.services.poi_warehouse import GEOHASH_PRECISION, infer_location_type, parse_rating
+from app.utils.geo import (
+    bounding_box,
+    geohash_bounds,
+    geohash_cell_size,
+    geohash_cover,
+    geohash_encode,
+    haversine_m,
+)
+
+logger = structlog.get_logger()
+
+# 按区域（约39km×20km，城市级）加载到内存
+REGION_PRECISION = 4
+# 区域内按格子（约1.2km×0.6km）分桶
+CELL_PRECISION = 6
+
+# 附近检索回源百度时各类型使用的关键词
+TYPE_QUERIES = {
+    "attraction": "景点",
+    "hotel": "酒店",
+    "restaurant": "美食",
+    "transport": "交通设施",
+}
+
+INDEX_COLUMNS = (
+    Location.id,
+    Location.name,
+    Location.address,
+    Location.latitude,
+    Location.longitude,
+    Location.province,
+    Location.city,
+    Location.type,
+    Location.rating,
+    Location.baidu_uid,
+    Location.geohash,
+)
+
+
+class RegionIndex:
+    """单个区域的地点网格：格子 -> 地点列表"""
+
+    def __init__(self, prefix: str, locations: Iterable[Dict[str, Any]]):
+        self.prefix = prefix
+        self.loaded_at = time.monotonic()
+        self.cells: Dict[str, List[Dict[str, Any]]] = {}
+        self._keys: set = set()
+        self.add_many(locations)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def add_many(self, locations: Iterable[Dict[str, Any]]):
+        """增量加入地点，按百度UID或名称去重"""
+        for location in locations:
+            key = location.get("baidu_uid") or location["name"]
+            if key in self._keys:
+                continue
+            self._keys.add(key)
+            cell = location["geohash"][:CELL_PRECISION]
+            self.cells.setdefault(cell, []).append(location)
+
+    def candidates(self, cells: Optional[List[str]]) -> Iterable[Dict[str, Any]]:
+        """指定格子中的地点，cells为None时遍历整个区域"""
+        if cells is None:
+            for locations in self.cells.values():
+                yield from locations
+        else:
+            for cell in cells:
+                yield from self.cells.get(cell, ())
+
+
+class SpatialIndex:
+    """进程内地点空间索引
+
+    地点表的geohash列按区域前缀加载到内存，区域内按更细的格子分桶，
+    范围查询只遍历覆盖到的格子。新地点入库时同步加入已加载的区域；
+    其他进程写入的地点在区域过期重新加载后可见。
+    """
+
+    def __init__(self):
+        self._regions: "OrderedDict[str, RegionIndex]" = OrderedDict()
+        self._flight = SingleFlight("spatial_index")
+
+    async def _get_region(self, prefix: str) -> RegionIndex:
+        """获取区域索引，未加载或已过期时从数据库加载"""
+        region = self._regions.get(prefix)
+        if region is not None and time.monotonic() - region.loaded_at < settings.SPATIAL_INDEX_TTL:
+            self._regions.move_to_end(prefix)
+            return region
+
+        return await self._flight.do(prefix, lambda: self._load_region(prefix))
+
+    async def _load_region(self, prefix: str) -> RegionIndex:
+        """从数据库加载区域内的地点，顺带补写旧数据缺失的geohash"""
+        south, west, north, east = geohash_bounds(prefix)
+
+        async def _load(session):
+            result = await session.execute(
+                select(Location.id, Location.latitude, Location.longitude).where(
+                    Location.geohash.is_(None),
+                    Location.latitude.between(south, north),
+                    Location.longitude.between(west, east),
+                )
+            )
+            missing = [
+                {"id": location_id, "geohash": geohash_encode(latitude, longitude, GEOHASH_PRECISION)}
+                for location_id, latitude, longitude in result.all()
+            ]
+            if missing:
+                # 按主键批量更新
+                await session.execute(update(Location), missing)
+
+            result = await session.execute(
+                select(*INDEX_COLUMNS).where(Location.geohash.startswith(prefix))
+            )
+            return [dict(row._mapping) for row in result.all()], len(missing)
+
+        start = time.perf_counter()
+        locations, backfilled = await db_manager.execute_transaction(_load)
+        region = RegionIndex(prefix, locations)
+
+        self._regions[prefix] = region
+        self._regions.move_to_end(prefix)
+        while len(self._regions) > settings.SPATIAL_INDEX_MAX_REGIONS:
+            self._regions.popitem(last=False)
+
+        logger.info(
+            "空间索引区域加载完成",
+            region=prefix,
+            locations=len(region),
+            backfilled=backfilled,
+            duration=round(time.perf_counter() - start, 3)
+        )
+        return region
+
+    def add_many(self, locations: List[Dict[str, Any]]):
+        """新地点入库后加入已加载的区域，未加载的区域在首次查询时从数据库读取"""
+        for location in locations:
+            region = self._regions.get(location["geohash"][:REGION_PRECISION])
+            if region is not None:
+                region.add_many([location])
+
+    async def query(
+        self,
+        latitude: float,
+        longitude: float,
+        radius: float,
+        location_type: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """半径范围内的地点，按距离升序，附带distance(米)"""
+        bbox = bounding_box(latitude, longitude, radius)
+        south, west, north, east = bbox
+        regions = await asyncio.gather(*[
+            self._get_region(prefix) for prefix in geohash_cover(bbox, REGION_PRECISION)
+        ])
+
+        # 范围覆盖的格子数多于区域内已有的格子时，直接遍历区域比逐格查找更快
+        lat_step, lng_step = geohash_cell_size(CELL_PRECISION)
+        cell_count = ((north - south) / lat_step + 1) * ((east - west) / lng_step + 1)
+        cells = None
+        if cell_count <= sum(len(region.cells) for region in regions):
+            cells = geohash_cover(bbox, CELL_PRECISION)
+
+        results = []
+        for region in regions:
+            region_cells = None if cells is None else [cell for cell in cells if cell.startswith(region.prefix)]
+            for location in region.candidates(region_cells):
+                if location_type and location["type"] != location_type:
+                    continue
+                if not (south <= location["latitude"] <= north and west <= location["longitude"] <= east):
+                    continue
+                distance = haversine_m(latitude, longitude, location["latitude"], location["longitude"])
+                if distance <= radius:
+                    results.append({**location, "distance": round(distance)})
+
+        results.sort(key=lambda location: location["distance"])
+        return results
+
+    def get_stats(self) -> Dict[str, Any]:
+        """索引统计信息"""
+        return {
+            "regions": len(self._regions),
+            "locations": sum(len(region) for region in self._regions.values()),
+        }
+
+
+class LocationService:
+    """地点服务：入库、本地附近检索，本地数据不足时回源百度"""
+
+    def __init__(self):
+        self.map_service = baidu_map_service
+        self.index = SpatialIndex()
+
+    async def save_locations(self, places: List[Dict[str, Any]]):
+        """批量写入新地点，已存在的地点累加引用次数，新地点同步加入空间索引"""
+        uids = [place["uid"] for place in places if place["uid"]]
+        names = [place["name"] for place in places]
+
+        async def _save(session):
+            result = await session.execute(
+                select(Location.id, Location.baidu_uid, Location.name).where(
+                    or_(Location.baidu_uid.in_(uids), Location.name.in_(names))
+                )
+            )
+            existing_ids, existing_uids, existing_names = [], set(), set()
+            for location_id, baidu_uid, name in result.all():
+                existing_ids.append(location_id)
+                existing_uids.add(baidu_uid)
+                existing_names.add(name)
+
+            rows = [
+                {
+                    "name": place["name"],
+                    "address": place["address"],
+                    "latitude": place["latitude"],
+                    "longitude": place["longitude"],
+                    "province": place["province"],
+                    "city": place["city"],
+                    "type": place.get("type") or infer_location_type(place["name"], place["tag"]),
+                    "rating": place.get("rating"),
+                    "tags": [place["tag"]] if place["tag"] else [],
+                    "baidu_uid": place["uid"] or None,
+                    "geohash": geohash_encode(place["latitude"], place["longitude"], GEOHASH_PRECISION),
+                    "reference_count": 1,
+                }
+                for place in places
+                if place["name"] not in existing_names and (not place["uid"] or place["uid"] not in existing_uids)
+            ]
+            inserted = []
+            if rows:
+                # 同一UID可能刚由POI写回入库
+                result = await session.execute(
+                    insert(Location).on_conflict_do_nothing(index_elements=[Location.baidu_uid])
+                    .returning(*INDEX_COLUMNS),
+                    rows
+                )
+                inserted = [dict(row._mapping) for row in result.all()]
+            if existing_ids:
+                await session.execute(
+                    update(Location)
+                    .where(Location.id.in_(existing_ids))
+                    .values(reference_count=func.coalesce(Location.reference_count, 0) + 1)
+                )
+            return inserted
+
+        try:
+            inserted = await db_manager.execute_transaction(_save)
+            self.index.add_many(inserted)
+            logger.info("地点批量写入完成", inserted=len(inserted), total=len(places))
+        except Exception as e:
+            logger.error("地点批量写入失败", error=str(e))
+
+    async def get_opening_hours(self, uids: List[str]) -> Dict[str, str]:
+        """批量读取地点的营业时间文本，返回 百度UID -> 营业时间"""
+        if not uids:
+            return {}
+
+        async def _get(session):
+            result = await session.execute(
+                select(Location.baidu_uid, Location.opening_hours).where(
+                    Location.baidu_uid.in_(uids),
+                    Location.opening_hours.isnot(None)
+                )
+            )
+            return {
+                uid: opening_hours["text"]
+                for uid, opening_hours in result.all()
+                if isinstance(opening_hours, dict) and opening_hours.get("text")
+            }
+
+        try:
+            return await db_manager.execute_transaction(_get)
+        except Exception as e:
+            logger.error("读取营业时间失败", error=str(e))
+            return {}
+
+    async def nearby(
+        self,
+        latitude: float,
+        longitude: float,
+        radius: int = 5000,
+        location_type: Optional[str] = None,
+        limit: int = 20
+    ) -> Dict[str, Any]:
+        """附近地点
+
+        先查本地空间索引；结果少于NEARBY_MIN_RESULTS时视为覆盖稀疏，
+        回源百度周边检索，结果入库后与本地结果合并。
+        """
+        try:
+            places = await self.index.query(latitude, longitude, radius, location_type)
+        except Exception as e:
+            logger.error("本地附近检索失败", latitude=latitude, longitude=longitude, error=str(e))
+            places = []
+
+        source = "local"
+        if len(places) < settings.NEARBY_MIN_RESULTS:
+            fetched = await self._search_nearby(latitude, longitude, radius, location_type)
+            if fetched:
+                await self.save_locations(fetched)
+                known = {place.get("baidu_uid") or place["name"] for place in places}
+                for place in fetched:
+                    if (place["uid"] or place["name"]) in known:
+                        continue
+                    distance = haversine_m(latitude, longitude, place["latitude"], place["longitude"])
+                    if distance <= radius:
+                        places.append(self._to_result(place, distance))
+                places.sort(key=lambda place: place["distance"])
+                source = "baidu"
+
+        return {
+            "places": places[:limit],
+            "total": len(places),
+            "source": source,
+        }
+
+    async def _search_nearby(
+        self,
+        latitude: float,
+        longitude: float,
+        radius: int,
+        location_type: Optional[str]
+    ) -> List[Dict[str, Any]]:
+        """百度周边检索，整理为入库格式"""
+        query = TYPE_QUERIES.get(location_type or "attraction", TYPE_QUERIES["attraction"])
+        search_result = await self.map_service.search_places(
+            query,
+            location=f"{latitude},{longitude}",
+            radius=radius,
+            page_size=20
+        )
+        if not search_result:
+            return []
+
+        places = []
+        for place in search_result["places"]:
+            if place.get("latitude") is None:
+                continue
+            tag = place.get("tag", "")
+            places.append({
+                "name": place["name"],
+                "address": place.get("address", ""),
+                "latitude": place["latitude"],
+                "longitude": place["longitude"],
+                "province": place.get("province", ""),
+                "city": place.get("city", ""),
+                "uid": place.get("uid", ""),
+                "tag": tag,
+                "type": location_type or infer_location_type(place["name"], tag),
+                "rating": parse_rating((place.get("detail_info") or {}).get("overall_rating")),
+            })
+        return places
+
+    @staticmethod
+    def _to_result(place: Dict[str, Any], distance: float) -> Dict[str, Any]:
+        """百度检索结果转为与本地索引一致的格式"""
+        return {
+            "id": None,
+            "name": place["name"],
+            "address": place["address"],
+            "latitude": place["latitude"],
+            "longitude": place["longitude"],
+            "province": place["province"],
+            "city": place["city"],
+            "type": place["type"],
+            "rating": place["rating"],
+            "baidu_uid": place["uid"] or None,
+            "geohash": geohash_encode(place["latitude"], place["longitude"], GEOHASH_PRECISION),
+            "distance": round(distance),
+        }
+
+
+# 全局地点服务实例
+location_service = LocationService()
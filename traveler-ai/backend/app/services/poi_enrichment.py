@@ -0,0 +1,338 @@
+"""
+攻略地点补全 - 从生成内容中提取地点并批量解析坐标
+"""
+import asyncio
+import re
+from typing import Any, Dict, List, Optional, Tuple
+import structlog
+
+from app.core.config import settings
+from app.services.baidu_map_service import baidu_map_service
+from app.services.location_service import location_service
+from app.services.poi_warehouse import LODGING_SUFFIXES
+from app.services.prompt_builder import POI_PATTERN, LINK_PATTERN, prompt_builder
+from app.utils.day_clustering import cluster_days, order_clusters
+from app.utils.geo import haversine_m
+from app.utils.route_optimizer import RouteProblem, optimize_route, parse_time_window
+
+logger = structlog.get_logger()
+
+CODE_BLOCK_PATTERN = re.compile(r"```.*?```", re.S)
+
+# 动词前缀会被POI正则一并匹配，如“前往赛里木湖”
+ACTION_PREFIXES = (
+    "前往", "游览", "参观", "抵达", "到达", "返回", "入住", "经过", "途经",
+    "打卡", "探访", "漫步", "出发", "驱车", "乘车", "步行", "位于", "俯瞰", "泡",
+    "逛", "游", "去", "到", "在",
+)
+
+# 量词、修饰词开头或含描述词的是泛指，如“多数酒店”“经济型酒店”
+GENERIC_PREFIXES = ("含", "个", "间", "座", "家", "多数", "部分", "各", "该", "此")
+GENERIC_WORDS = (
+    "的", "和", "及", "或", "经济型", "早餐", "星级", "四星", "五星", "商务",
+    "天然", "传统", "当地", "附近", "周边", "特色",
+)
+
+# 无法算路时按直线距离×绕行系数、平均车速(米/秒)估算
+FALLBACK_DETOUR = 1.4
+FALLBACK_SPEED = 40 / 3.6
+
+
+def _strip_action(name: str) -> str:
+    """去掉地点名称前的动词"""
+    changed = True
+    while changed:
+        changed = False
+        for prefix in ACTION_PREFIXES:
+            if name.startswith(prefix) and len(name) - len(prefix) >= 2:
+                name = name[len(prefix):]
+                changed = True
+    return name
+
+
+def _is_specific(name: str) -> bool:
+    """排除泛指地点和过短的名称"""
+    if len(name) < 3 or name.startswith(GENERIC_PREFIXES):
+        return False
+    return not any(word in name for word in GENERIC_WORDS)
+
+
+def extract_place_names(markdown: str) -> List[str]:
+    """从Markdown中提取地点名称（保序去重）"""
+    text = CODE_BLOCK_PATTERN.sub("", markdown or "")
+    text = LINK_PATTERN.sub("", text)
+    names = [_strip_action(name) for name in POI_PATTERN.findall(text)]
+    return list(dict.fromkeys(name for name in names if _is_specific(name)))
+
+
+def _format_point(place: Dict[str, Any]) -> str:
+    """百度坐标参数格式：纬度,经度"""
+    return f"{place['latitude']},{place['longitude']}"
+
+
+def _leg_cost(element: Dict[str, Any], origin: Dict[str, Any], destination: Dict[str, Any]) -> Tuple[float, float]:
+    """批量算路结果中一段的 (距离米, 时长秒)，无法算路时按直线距离和平均车速估算"""
+    distance = (element.get("distance") or {}).get("value")
+    duration = (element.get("duration") or {}).get("value")
+    if distance is None or duration is None:
+        distance = haversine_m(
+            origin["latitude"], origin["longitude"], destination["latitude"], destination["longitude"]
+        ) * FALLBACK_DETOUR
+        duration = distance / FALLBACK_SPEED
+    return float(distance), float(duration)
+
+
+class PoiEnrichmentService:
+    """攻略地点补全
+
+    每日内容中的地点名称全局去重后并发解析（并发度受限，结果走地图缓存），
+    新地点批量写入Location表；每天的游览顺序按批量算路结果和营业时间优化。
+    """
+
+    def __init__(self):
+        self.map_service = baidu_map_service
+
+    async def enrich(
+        self,
+        itinerary_data: Dict[str, Any],
+        daily_itineraries: List[Dict[str, Any]]
+    ):
+        """补全攻略和每日行程的地点信息（原地修改）"""
+        destination = itinerary_data["destination"]
+
+        day_names = {
+            day["day_number"]: extract_place_names(day.get("markdown_content") or "")[:settings.POI_MAX_PER_DAY]
+            for day in daily_itineraries
+        }
+        names = list(dict.fromkeys(name for day in day_names.values() for name in day))
+        if not names:
+            return
+
+        places = await self.resolve_places(names, destination)
+        if not places:
+            return
+
+        await location_service.save_locations(list(places.values()))
+
+        opening_hours = await location_service.get_opening_hours(
+            [place["uid"] for place in places.values() if place["uid"]]
+        )
+
+        # 每天的路线从前一晚的住处出发，到当晚的住处结束
+        plans = []
+        last_lodging = None
+        for day in sorted(daily_itineraries, key=lambda day: day["day_number"]):
+            points = [places[name] for name in day_names[day["day_number"]] if name in places]
+            attractions = [place for place in points if not place["name"].endswith(LODGING_SUFFIXES)]
+            lodging = [place for place in points if place["name"].endswith(LODGING_SUFFIXES)]
+            lodging = lodging[-1] if lodging else None
+            if lodging:
+                day["accommodation_name"] = lodging["name"]
+                day["accommodation_address"] = lodging["address"]
+                day["accommodation_latitude"] = lodging["latitude"]
+                day["accommodation_longitude"] = lodging["longitude"]
+            day["attractions"] = attractions
+            plans.append((day, attractions, last_lodging or lodging, lodging or last_lodging))
+            last_lodging = lodging or last_lodging
+
+        routes = await asyncio.gather(*[
+            self.plan_route(attractions, start, end, opening_hours)
+            for _, attractions, start, end in plans
+        ])
+        for (day, _, _, _), route in zip(plans, routes):
+            if route:
+                day.update(route)
+
+        attractions = [place for place in places.values() if not place["name"].endswith(LODGING_SUFFIXES)]
+        itinerary_data["featured_attractions"] = [
+            {"name": place["name"], "latitude": place["latitude"], "longitude": place["longitude"]}
+            for place in attractions[:10]
+        ]
+        itinerary_data["bounds_data"] = {
+            "south": min(place["latitude"] for place in places.values()),
+            "west": min(place["longitude"] for place in places.values()),
+            "north": max(place["latitude"] for place in places.values()),
+            "east": max(place["longitude"] for place in places.values()),
+        }
+
+        logger.info(
+            "攻略地点补全完成",
+            destination=destination,
+            extracted=len(names),
+            resolved=len(places)
+        )
+
+    async def plan_days(
+        self,
+        destination: str,
+        overview_content: str,
+        days: int
+    ) -> Optional[Dict[int, List[str]]]:
+        """把概览中的景点按地理位置分到各天，返回 天数 -> 按顺路顺序排列的景点名称
+
+        按游览时长做容量均衡的k-medoids分组，组与天的对应优先沿用概览的安排；
+        可解析的景点少于天数时返回None，沿用概览原有安排。
+        """
+        names = extract_place_names(overview_content)
+        names = [name for name in names if not name.endswith(LODGING_SUFFIXES)][:settings.DAY_CLUSTERING_MAX_POIS]
+        if len(names) < days:
+            return None
+
+        places = await self.resolve_places(names, destination)
+        attractions = [places[name] for name in names if name in places]
+        if len(attractions) < days:
+            return None
+
+        points = [_format_point(place) for place in attractions]
+        matrix = await self.map_service.get_directions_matrix(points, points)
+        elements = matrix["matrix"] if matrix else [{}] * (len(points) ** 2)
+        count = len(attractions)
+        durations = [
+            [_leg_cost(elements[i * count + j], attractions[i], attractions[j])[1] / 60 for j in range(count)]
+            for i in range(count)
+        ]
+
+        stay = [float(settings.ROUTE_STAY_MINUTES)] * count
+        clusters = cluster_days(durations, stay, days, slack=settings.DAY_CLUSTERING_SLACK)
+
+        index = {place["name"]: i for i, place in enumerate(attractions)}
+        summary = prompt_builder.extract_summary(overview_content, days)
+        preferences = [
+            {
+                index[name]
+                for name in extract_place_names("\n".join(summary["days"].get(day_num, {}).get("details", [])))
+                if name in index
+            }
+            for day_num in range(1, days + 1)
+        ]
+
+        day_plan = {}
+        for day_num, cluster in enumerate(order_clusters(clusters, durations, preferences), start=1):
+            order = optimize_route(RouteProblem(durations, clusters[cluster], stay=stay)) if clusters[cluster] else []
+            day_plan[day_num] = [attractions[i]["name"] for i in order]
+
+        logger.info(
+            "景点按天分组完成",
+            destination=destination,
+            attractions=count,
+            sizes=[len(pois) for pois in day_plan.values()]
+        )
+        return day_plan
+
+    async def resolve_places(self, names: List[str], destination: str) -> Dict[str, Dict[str, Any]]:
+        """解析地点坐标，返回 名称 -> 地点信息
+
+        先并发地点检索，检索不到的再批量地理编码兜底。
+        """
+        semaphore = asyncio.Semaphore(settings.POI_ENRICHMENT_CONCURRENCY)
+
+        async def search(name: str) -> Optional[Dict[str, Any]]:
+            async with semaphore:
+                return await self._search_place(name, destination)
+
+        results = await asyncio.gather(*[search(name) for name in names])
+        places = {name: place for name, place in zip(names, results) if place}
+
+        unresolved = [name for name in names if name not in places]
+        if unresolved:
+            geocoded = await self.map_service.geocode_many([f"{destination}{name}" for name in unresolved])
+            for name in unresolved:
+                result = geocoded.get(f"{destination}{name}")
+                if result:
+                    places[name] = {
+                        "name": name,
+                        "address": result.get("formatted_address", ""),
+                        "latitude": result["latitude"],
+                        "longitude": result["longitude"],
+                        "province": "",
+                        "city": "",
+                        "uid": "",
+                        "tag": "",
+                    }
+        return places
+
+    async def _search_place(self, name: str, destination: str) -> Optional[Dict[str, Any]]:
+        """在目的地范围内检索地点，取第一条结果"""
+        search_result = await self.map_service.search_places(name, region=destination, page_size=1)
+        if not search_result or not search_result["places"]:
+            return None
+
+        place = search_result["places"][0]
+        if place.get("latitude") is None:
+            return None
+        return {
+            "name": name,
+            "address": place.get("address", ""),
+            "latitude": place["latitude"],
+            "longitude": place["longitude"],
+            "province": place.get("province", ""),
+            "city": place.get("city", ""),
+            "uid": place.get("uid", ""),
+            "tag": place.get("tag", ""),
+        }
+
+    async def plan_route(
+        self,
+        attractions: List[Dict[str, Any]],
+        start: Optional[Dict[str, Any]],
+        end: Optional[Dict[str, Any]],
+        opening_hours: Dict[str, str]
+    ) -> Optional[Dict[str, Any]]:
+        """规划当日游览顺序，计算各段交通和总里程(公里)、总时长(分钟)
+
+        起终点和景点两两之间的行程由一次批量算路得到，按营业时间求解顺序；
+        关闭路线优化时保持原顺序，只计算交通。
+        """
+        nodes = [place for place in (start, end) if place]
+        if start is not None and start is end:
+            nodes = [start]
+        nodes += attractions
+        if len(nodes) < 2:
+            return None
+
+        points = [_format_point(place) for place in nodes]
+        matrix = await self.map_service.get_directions_matrix(points, points)
+        if not matrix:
+            return None
+
+        count = len(nodes)
+        legs = [
+            [_leg_cost(matrix["matrix"][i * count + j], nodes[i], nodes[j]) for j in range(count)]
+            for i in range(count)
+        ]
+        first = count - len(attractions)
+        problem = RouteProblem(
+            [[duration / 60 for _, duration in row] for row in legs],
+            visits=list(range(first, count)),
+            start=0 if start else None,
+            end=(first - 1) if end else None,
+            stay=[0.0] * first + [float(settings.ROUTE_STAY_MINUTES)] * len(attractions),
+            windows=[parse_time_window(opening_hours.get(place["uid"])) for place in nodes],
+            start_time=settings.ROUTE_DAY_START_HOUR * 60
+        )
+        order = optimize_route(problem) if settings.ROUTE_OPTIMIZATION_ENABLED else problem.visits
+
+        path = ([problem.start] if start else []) + order + ([problem.end] if end else [])
+        arrivals = {node: arrive for node, (arrive, _) in zip(order, problem.schedule(order))}
+        transportation = []
+        for a, b in zip(path, path[1:]):
+            distance, duration = legs[a][b]
+            leg = {
+                "from": nodes[a]["name"],
+                "to": nodes[b]["name"],
+                "distance": round(distance / 1000, 1),
+                "duration": round(duration / 60),
+            }
+            if b in arrivals:
+                leg["arrive_at"] = f"{int(arrivals[b]) // 60 % 24:02d}:{int(arrivals[b]) % 60:02d}"
+            transportation.append(leg)
+
+        return {
+            "attractions": [nodes[node] for node in order],
+            "transportation": transportation,
+            "total_distance": round(sum(legs[a][b][0] for a, b in zip(path, path[1:])) / 1000, 1),
+            "total_duration": round(sum(legs[a][b][1] for a, b in zip(path, path[1:])) / 60),
+        }
+
+# 全局地点补全服务实例
+poi_enrichment_service = PoiEnrichmentService()
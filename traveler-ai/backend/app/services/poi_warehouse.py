@@ -0,0 +1,245 @@
+"""
+本地POI库 - 百度地图返回的地点批量写回Location表
+"""
+import asyncio
+import time
+from typing import Any, Dict, List, Optional
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert
+import structlog
+
+from app.core.config import settings
+from app.core.database import db_manager
+from app.models.location import Location
+from app.utils.geo import geohash_encode
+
+logger = structlog.get_logger()
+
+# 写入数据库的Geohash精度（约38m×19m），前缀即可检索任意更粗的格子
+GEOHASH_PRECISION = 8
+
+# 住宿类地点后缀
+LODGING_SUFFIXES = ("酒店", "宾馆", "民宿")
+
+# 冲突时以新值覆盖（新值为空则保留原值）的字段
+UPSERT_FIELDS = (
+    "name", "address", "latitude", "longitude", "province", "city", "district",
+    "type", "category", "rating", "phone", "tags", "geohash", "baidu_data", "opening_hours",
+)
+# 冲突时累加的计数字段
+COUNTER_FIELDS = ("search_count", "reference_count")
+
+
+def infer_location_type(name: str, tag: str = "") -> str:
+    """根据名称和百度分类标签推断地点类型"""
+    if name.endswith(LODGING_SUFFIXES) or tag.startswith("酒店"):
+        return "hotel"
+    if tag.startswith("美食"):
+        return "restaurant"
+    if tag.startswith("交通设施"):
+        return "transport"
+    return "attraction"
+
+
+def parse_rating(value: Any) -> Optional[float]:
+    """百度评分为字符串，缺失或无效时为None"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class PoiWarehouse:
+    """POI写回缓冲
+
+    地点检索、地点详情的百度响应先按UID合并到内存缓冲，
+    由后台任务定期或攒满一批后以 INSERT ... ON CONFLICT (baidu_uid) DO UPDATE
+    一次写入，不占用地图请求的响应时间。检索命中累加search_count，
+    查看详情累加reference_count；详情原文存入baidu_data，供之后直接读取，
+    营业时间存入opening_hours供路线优化使用。
+    """
+
+    def __init__(self):
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._flush_event: Optional[asyncio.Event] = None
+        self._loop_task: Optional[asyncio.Task] = None
+        self._flushed = 0
+        self._dropped = 0
+
+    @property
+    def running(self) -> bool:
+        """后台写入是否在运行"""
+        return self._loop_task is not None and not self._loop_task.done()
+
+    async def start(self):
+        """启动后台写入"""
+        if self.running or not settings.POI_WAREHOUSE_ENABLED:
+            return
+        self._flush_event = asyncio.Event()
+        self._loop_task = asyncio.create_task(self._flush_loop())
+        logger.info("POI写回已启动", batch_size=settings.POI_WAREHOUSE_BATCH_SIZE)
+
+    async def stop(self):
+        """停止后台写入，写完剩余缓冲"""
+        if self._loop_task:
+            self._loop_task.cancel()
+            try:
+                await self._loop_task
+            except asyncio.CancelledError:
+                pass
+            self._loop_task = None
+        await self.flush()
+        logger.info("POI写回已停止", flushed=self._flushed, dropped=self._dropped)
+
+    def add_search_results(self, places: List[Dict[str, Any]]):
+        """登记地点检索结果"""
+        for place in places:
+            detail_info = place.get("detail_info") or {}
+            self._add(place, {
+                "district": place.get("area") or None,
+                "rating": parse_rating(detail_info.get("overall_rating")),
+                "search_count": 1,
+            })
+
+    def add_details(self, details: Dict[str, Any]):
+        """登记地点详情，详情原文保存到baidu_data"""
+        self._add(details, {
+            "rating": parse_rating((details.get("detail_info") or {}).get("overall_rating")),
+            "baidu_data": {"details": details, "fetched_at": time.time()},
+            "opening_hours": {"text": details["shop_hours"]} if details.get("shop_hours") else None,
+            "reference_count": 1,
+        })
+
+    def _add(self, place: Dict[str, Any], extra: Dict[str, Any]):
+        """转换为Location行并与缓冲中相同UID的记录合并"""
+        if not self.running:
+            return
+        uid = place.get("uid")
+        if not uid or place.get("latitude") is None or place.get("longitude") is None:
+            return
+
+        name = place.get("name", "")
+        tag = place.get("tag") or ""
+        row = {
+            "baidu_uid": uid,
+            "name": name,
+            "address": place.get("address") or None,
+            "latitude": place["latitude"],
+            "longitude": place["longitude"],
+            "province": place.get("province") or None,
+            "city": place.get("city") or None,
+            "district": None,
+            "type": infer_location_type(name, tag),
+            "category": tag.split(";")[0] or None,
+            "rating": None,
+            "phone": place.get("telephone") or None,
+            "tags": tag.split(";") if tag else None,
+            "geohash": geohash_encode(place["latitude"], place["longitude"], GEOHASH_PRECISION),
+            "baidu_data": None,
+            "opening_hours": None,
+            "search_count": 0,
+            "reference_count": 0,
+        }
+        row.update(extra)
+
+        pending = self._pending.get(uid)
+        if pending is None:
+            if len(self._pending) >= settings.POI_WAREHOUSE_MAX_PENDING:
+                self._dropped += 1
+                return
+            self._pending[uid] = row
+        else:
+            for field in UPSERT_FIELDS:
+                if row[field] is not None:
+                    pending[field] = row[field]
+            for field in COUNTER_FIELDS:
+                pending[field] += row[field]
+
+        if len(self._pending) >= settings.POI_WAREHOUSE_BATCH_SIZE:
+            self._flush_event.set()
+
+    async def _flush_loop(self):
+        """定期或攒满一批时写入"""
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_event.wait(), settings.POI_WAREHOUSE_FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_event.clear()
+            await self.flush()
+
+    async def flush(self) -> int:
+        """把缓冲中的地点批量写入数据库，返回写入条数"""
+        if not self._pending:
+            return 0
+
+        rows = list(self._pending.values())
+        self._pending = {}
+
+        stmt = insert(Location)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Location.baidu_uid],
+            set_={
+                **{
+                    field: func.coalesce(getattr(stmt.excluded, field), getattr(Location, field))
+                    for field in UPSERT_FIELDS
+                },
+                **{
+                    field: func.coalesce(getattr(Location, field), 0) + getattr(stmt.excluded, field)
+                    for field in COUNTER_FIELDS
+                },
+                "updated_at": func.now(),
+            }
+        )
+
+        async def _upsert(session):
+            for start in range(0, len(rows), settings.POI_WAREHOUSE_BATCH_SIZE):
+                await session.execute(stmt, rows[start:start + settings.POI_WAREHOUSE_BATCH_SIZE])
+
+        start = time.perf_counter()
+        try:
+            await db_manager.execute_transaction(_upsert)
+        except Exception as e:
+            self._dropped += len(rows)
+            logger.error("POI批量写入失败", count=len(rows), error=str(e))
+            return 0
+
+        self._flushed += len(rows)
+        logger.info("POI批量写入完成", count=len(rows), duration=round(time.perf_counter() - start, 3))
+        return len(rows)
+
+    async def get_details(self, uid: str) -> Optional[Dict[str, Any]]:
+        """读取本地保存的地点详情，超过POI_WAREHOUSE_DETAILS_MAX_AGE视为过期"""
+        if not settings.POI_WAREHOUSE_ENABLED:
+            return None
+
+        async def _get(session):
+            result = await session.execute(
+                select(Location.baidu_data).where(Location.baidu_uid == uid)
+            )
+            return result.scalar_one_or_none()
+
+        try:
+            baidu_data = await db_manager.execute_transaction(_get)
+        except Exception as e:
+            logger.error("读取本地地点详情失败", uid=uid, error=str(e))
+            return None
+
+        if not baidu_data or "details" not in baidu_data:
+            return None
+        if time.time() - baidu_data.get("fetched_at", 0) > settings.POI_WAREHOUSE_DETAILS_MAX_AGE:
+            return None
+        return baidu_data["details"]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """写回统计信息"""
+        return {
+            "running": self.running,
+            "pending": len(self._pending),
+            "flushed": self._flushed,
+            "dropped": self._dropped,
+        }
+
+
+# 全局POI库实例
+poi_warehouse = PoiWarehouse()
@@ -0,0 +1,218 @@
+"""
+每日行程提示词构建 - 概览压缩与前缀稳定排序
+"""
+import re
+from typing import Any, Dict, List, Optional
+
+# 中文数字到阿拉伯数字
+CN_DIGITS = {"一": 1, "二": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7, "八": 8, "九": 9}
+
+DAY_PATTERN = re.compile(r"第\s*([0-9]{1,2}|[一二三四五六七八九十]{1,3})\s*天")
+ROUTE_PATTERN = re.compile(
+    r"([一-龥A-Za-z]{2,12})\s*(?:→|->|—>|⇒)\s*([一-龥A-Za-z]{2,12})"
+)
+LINK_PATTERN = re.compile(r"!?\[[^\]]*\]\([^)]*\)")
+HEADING_PATTERN = re.compile(r"^(#{1,6})\s+(.*)$")
+
+# 景点/住宿名称常见后缀，用于从行程描述中识别POI
+POI_SUFFIXES = (
+    "风景区", "景区", "博物馆", "纪念馆", "公园", "古城", "古镇", "老街", "八卦城",
+    "草原", "湖", "山", "峡谷", "湿地", "瀑布", "森林", "温泉", "大桥", "口岸",
+    "寺", "庙", "广场", "大巴扎", "市场", "营地", "酒店", "宾馆", "民宿", "基地",
+)
+POI_PATTERN = re.compile(
+    r"[一-龥]{1,10}(?:%s)" % "|".join(sorted(POI_SUFFIXES, key=len, reverse=True))
+)
+
+# 作为共享上下文保留的概览章节
+SHARED_SECTIONS = ("基本信息", "行程亮点")
+
+# 每日行程的固定生成要求，放在提示词最前面保证各天前缀一致
+DAILY_INSTRUCTIONS = """你是一位专业的旅游规划师，请基于下面的攻略摘要生成指定一天的详细行程。
+
+每日行程需包括：
+1. 详细时间安排（每小时）
+2. 景点介绍和游览建议
+3. 交通路线和时间
+4. 餐饮推荐
+5. 住宿安排
+6. 费用预算
+7. 注意事项
+
+格式要求：请使用Markdown格式，结构清晰，信息详实。"""
+
+# 每日景点已按地理位置分组时的当日安排说明
+ASSIGNED_POIS_TEMPLATE = "当日景点（已按地理位置分组并排好顺路顺序，请只安排这些景点，其他景点在其他天）：{pois}"
+
+
+def parse_day_number(text: str) -> Optional[int]:
+    """解析“第N天”中的天数，支持阿拉伯数字和中文数字"""
+    if text.isdigit():
+        return int(text)
+
+    if text == "十":
+        return 10
+    if text.startswith("十"):
+        return 10 + CN_DIGITS.get(text[1:], 0)
+    if "十" in text:
+        tens, _, ones = text.partition("十")
+        return CN_DIGITS.get(tens, 0) * 10 + CN_DIGITS.get(ones, 0)
+    return CN_DIGITS.get(text)
+
+
+def _unique(items: List[str]) -> List[str]:
+    """保序去重"""
+    seen = set()
+    result = []
+    for item in items:
+        if item and item not in seen:
+            seen.add(item)
+            result.append(item)
+    return result
+
+
+class PromptBuilder:
+    """每日行程提示词构建器
+
+    概览只解析一次，得到共享上下文、路线骨架和每天的城市/景点切片。
+    每日提示词按“固定要求 → 共享上下文 → 路线骨架 → 当日切片”排序，
+    前三段各天完全相同，便于DeepSeek上下文缓存和Ollama KV缓存复用前缀。
+    """
+
+    def __init__(self, shared_max_chars: int = 800, fallback_max_chars: int = 3000):
+        self.shared_max_chars = shared_max_chars
+        self.fallback_max_chars = fallback_max_chars
+
+    def _clean_line(self, line: str) -> str:
+        """去掉Markdown链接和表格符号，合并为单行文本"""
+        line = LINK_PATTERN.sub("", line)
+        if line.strip().startswith("|"):
+            cells = [cell.strip() for cell in line.strip().strip("|").split("|")]
+            line = "；".join(cell for cell in cells if cell and not set(cell) <= set("-: "))
+        line = line.replace("**", "").strip(" -*>\t")
+        return re.sub(r"\s+", " ", line)
+
+    def extract_summary(self, overview_content: str, days: int) -> Dict[str, Any]:
+        """从概览Markdown中提取结构化摘要"""
+        shared_lines: List[str] = []
+        day_lines: Dict[int, List[str]] = {day: [] for day in range(1, days + 1)}
+        shared_level: Optional[int] = None
+        in_code_block = False
+
+        for raw_line in (overview_content or "").splitlines():
+            stripped = raw_line.strip()
+            if stripped.startswith("```"):
+                in_code_block = not in_code_block
+                continue
+            if in_code_block or not stripped:
+                continue
+
+            heading = HEADING_PATTERN.match(stripped)
+            if heading:
+                level, title = len(heading.group(1)), heading.group(2)
+                if any(name in title for name in SHARED_SECTIONS):
+                    shared_level = level
+                elif shared_level is not None and level <= shared_level:
+                    shared_level = None
+                continue
+
+            line = self._clean_line(stripped)
+            if not line:
+                continue
+
+            if shared_level is not None:
+                shared_lines.append(line)
+
+            for match in DAY_PATTERN.finditer(line):
+                day_num = parse_day_number(match.group(1))
+                if day_num in day_lines:
+                    day_lines[day_num].append(line)
+
+        day_slices = {}
+        route = []
+        for day_num, lines in day_lines.items():
+            lines = _unique(lines)
+            text = "\n".join(lines)
+            cities = _unique([city for pair in ROUTE_PATTERN.findall(text) for city in pair])
+            pois = _unique(POI_PATTERN.findall(text))
+            day_slices[day_num] = {
+                "cities": cities,
+                "pois": pois,
+                "details": lines,
+            }
+            headline = DAY_PATTERN.sub("", lines[0], count=1).strip(" ；;:：") if lines else "待定"
+            route.append(f"第{day_num}天：{headline}")
+
+        shared_context = "\n".join(_unique(shared_lines))[:self.shared_max_chars]
+        parsed = any(slice_["details"] for slice_ in day_slices.values())
+        if not parsed:
+            # 概览没有可识别的每日结构时，退回截断的原文
+            shared_context = (overview_content or "")[:self.fallback_max_chars]
+
+        return {
+            "shared_context": shared_context,
+            "route": route if parsed else [],
+            "days": day_slices,
+        }
+
+    def build_daily_prompt(self, summary: Dict[str, Any], day_num: int) -> str:
+        """构建单日提示词，共享部分在前，当日切片在后"""
+        sections = [DAILY_INSTRUCTIONS, "## 攻略摘要", summary["shared_context"]]
+
+        if summary["route"]:
+            sections.extend(["## 路线骨架", "\n".join(summary["route"])])
+
+        day_slice = summary["days"].get(day_num) or {}
+        day_parts = [f"## 第{day_num}天安排"]
+        if day_slice.get("assigned"):
+            day_parts.append(ASSIGNED_POIS_TEMPLATE.format(pois="、".join(day_slice["pois"])))
+        else:
+            if day_slice.get("cities"):
+                day_parts.append(f"途经城市：{'、'.join(day_slice['cities'])}")
+            if day_slice.get("pois"):
+                day_parts.append(f"重点地点：{'、'.join(day_slice['pois'])}")
+            day_parts.extend(day_slice.get("details", []))
+        sections.append("\n".join(day_parts))
+
+        sections.append(f"请生成第{day_num}天的详细行程。")
+        return "\n\n".join(sections)
+
+    def apply_day_plan(self, summary: Dict[str, Any], day_plan: Dict[int, List[str]]) -> Dict[str, Any]:
+        """用按地理位置分好的每日景点替换概览中的每日切片和路线骨架"""
+        return {
+            **summary,
+            "route": [f"第{day_num}天：{'、'.join(pois)}" for day_num, pois in sorted(day_plan.items())],
+            "days": {
+                day_num: {"cities": [], "pois": pois, "details": [], "assigned": bool(pois)}
+                for day_num, pois in day_plan.items()
+            },
+        }
+
+    def build_full_daily_prompt(
+        self,
+        overview_content: str,
+        day_num: int,
+        pois: Optional[List[str]] = None
+    ) -> str:
+        """未压缩的单日提示词（嵌入完整概览），关闭压缩时使用"""
+        assigned = f"\n{ASSIGNED_POIS_TEMPLATE.format(pois='、'.join(pois))}\n" if pois else ""
+        return f"""
+基于以下攻略概览，生成第{day_num}天的详细行程安排：
+
+{overview_content}
+{assigned}
+请生成第{day_num}天的详细内容，包括：
+1. 详细时间安排（每小时）
+2. 景点介绍和游览建议
+3. 交通路线和时间
+4. 餐饮推荐
+5. 住宿安排
+6. 费用预算
+7. 注意事项
+
+格式要求：请使用Markdown格式，结构清晰，信息详实。
+"""
+
+
+# 全局提示词构建器实例
+prompt_builder = PromptBuilder()
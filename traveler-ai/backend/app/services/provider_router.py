@@ -0,0 +1,214 @@
+"""
+AI服务提供商路由 - 按延迟和在途请求数选择提供商，熔断、对冲请求与故障转移
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, TypeVar
+import structlog
+
+from app.core.config import settings
+
+logger = structlog.get_logger()
+
+T = TypeVar("T")
+
+# 熔断器状态
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half_open"
+
+# 延迟滑动平均的权重
+LATENCY_ALPHA = 0.2
+
+
+class ProviderHealth:
+    """单个提供商的运行状况
+
+    latency为上游调用耗时的指数滑动平均（不含本地排队），outcomes为最近
+    AI_ROUTING_WINDOW次调用是否成功，outstanding为在途请求数（含排队）。
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.latency: Optional[float] = None
+        self.outcomes: Deque[bool] = deque(maxlen=settings.AI_ROUTING_WINDOW)
+        self.outstanding = 0
+        self.state = CIRCUIT_CLOSED
+        self.opened_at = 0.0
+        self.probing = False
+
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+    def available(self) -> bool:
+        """熔断打开期间不可用；冷却结束后进入半开状态，只放行一个探测请求"""
+        if self.state == CIRCUIT_OPEN and time.monotonic() - self.opened_at >= settings.AI_CIRCUIT_OPEN_SECONDS:
+            self.state = CIRCUIT_HALF_OPEN
+        if self.state == CIRCUIT_HALF_OPEN:
+            return not self.probing
+        return self.state == CIRCUIT_CLOSED
+
+    def score(self) -> float:
+        """负载评分，越小越优先：排队后的预计耗时除以成功率"""
+        latency = self.latency if self.latency is not None else settings.AI_ROUTING_DEFAULT_LATENCY
+        return (self.outstanding + 1) * latency / max(1 - self.error_rate(), 0.1)
+
+
+class ProviderRouter:
+    """提供商路由
+
+    首选提供商（请求指定或DEFAULT_AI_PROVIDER）的负载评分不超过最优者的
+    AI_ROUTING_SWITCH_RATIO倍时优先使用，否则按评分从低到高排列；熔断中的
+    提供商跳过。调用失败时依次故障转移到下一个提供商，可选在首个请求超过
+    指定时间未返回时向下一个提供商发起对冲请求，先成功的结果生效。
+    """
+
+    def __init__(self):
+        self._health: Dict[str, ProviderHealth] = {}
+
+    def register(self, name: str):
+        """注册提供商"""
+        if name not in self._health:
+            self._health[name] = ProviderHealth(name)
+
+    def candidates(self, preferred: str) -> List[str]:
+        """按调用顺序排列的候选提供商，全部熔断时为空"""
+        if not settings.AI_ROUTING_ENABLED:
+            return [preferred]
+
+        available = [name for name, health in self._health.items() if health.available()]
+        if not available:
+            # 全部熔断时直接失败，冷却结束后由半开状态放行探测请求
+            return []
+
+        ranked = sorted(available, key=lambda name: self._health[name].score())
+        if preferred in available and ranked[0] != preferred:
+            # 半开的首选提供商直接用真实请求探测，失败时仍可故障转移
+            health = self._health[preferred]
+            if (
+                health.state == CIRCUIT_HALF_OPEN
+                or health.score() <= self._health[ranked[0]].score() * settings.AI_ROUTING_SWITCH_RATIO
+            ):
+                ranked.remove(preferred)
+                ranked.insert(0, preferred)
+        return ranked
+
+    def acquire(self, name: str) -> bool:
+        """开始一次调用，提供商熔断中时返回False"""
+        health = self._health.get(name)
+        if health is None:
+            return True
+        if settings.AI_ROUTING_ENABLED and not health.available():
+            return False
+        if health.state == CIRCUIT_HALF_OPEN:
+            health.probing = True
+        health.outstanding += 1
+        return True
+
+    def release(self, name: str, latency: Optional[float] = None, success: Optional[bool] = None):
+        """结束一次调用；success为None表示调用被取消，不计入成功率"""
+        health = self._health.get(name)
+        if health is None:
+            return
+        health.outstanding -= 1
+        if success is None:
+            health.probing = False
+            return
+
+        health.outcomes.append(success)
+        if success:
+            if latency is not None:
+                health.latency = latency if health.latency is None else (
+                    LATENCY_ALPHA * latency + (1 - LATENCY_ALPHA) * health.latency
+                )
+            if health.state != CIRCUIT_CLOSED:
+                # 探测成功，清空旧的失败记录
+                health.state = CIRCUIT_CLOSED
+                health.outcomes.clear()
+                logger.info("AI服务提供商熔断恢复", provider=name)
+        elif health.state == CIRCUIT_HALF_OPEN or (
+            health.state == CIRCUIT_CLOSED
+            and len(health.outcomes) >= settings.AI_CIRCUIT_MIN_REQUESTS
+            and health.error_rate() >= settings.AI_CIRCUIT_ERROR_RATE
+        ):
+            health.state = CIRCUIT_OPEN
+            health.opened_at = time.monotonic()
+            logger.warning("AI服务提供商熔断", provider=name, error_rate=round(health.error_rate(), 2))
+        health.probing = False
+
+    async def run(
+        self,
+        names: List[str],
+        call: Callable[[str], Awaitable[T]],
+        hedge_delay: Optional[float] = None
+    ) -> T:
+        """按顺序调用候选提供商，失败时转移到下一个
+
+        hedge_delay不为空时，首个请求超过该秒数仍未返回则同时请求下一个提供商，
+        先成功的结果生效，其余请求取消。对冲只发起一次。
+        """
+        if not hedge_delay or len(names) < 2:
+            last_error: Optional[Exception] = None
+            for name in names:
+                try:
+                    return await call(name)
+                except Exception as e:
+                    last_error = e
+                    logger.warning("AI服务提供商调用失败", provider=name, error=str(e))
+            raise last_error or ValueError("没有可用的AI服务提供商")
+
+        remaining = iter(names)
+        pending: Dict[asyncio.Task, str] = {}
+
+        def launch() -> bool:
+            name = next(remaining, None)
+            if name is None:
+                return False
+            pending[asyncio.create_task(call(name))] = name
+            return True
+
+        launch()
+        hedged = False
+        last_error = None
+        try:
+            while pending:
+                done, _ = await asyncio.wait(
+                    pending, timeout=None if hedged else hedge_delay, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    hedged = True
+                    if launch():
+                        logger.info("AI请求超时未返回，发起对冲请求", providers=list(pending.values()))
+                    continue
+
+                succeeded = None
+                for task in done:
+                    name = pending.pop(task)
+                    if task.exception() is None:
+                        succeeded = succeeded or task
+                        continue
+                    last_error = task.exception()
+                    logger.warning("AI服务提供商调用失败", provider=name, error=str(last_error))
+                if succeeded is not None:
+                    return succeeded.result()
+                if not pending:
+                    launch()
+        finally:
+            for task in pending:
+                task.cancel()
+        raise last_error or ValueError("没有可用的AI服务提供商")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """各提供商的延迟、错误率、在途请求数和熔断状态"""
+        return {
+            name: {
+                "state": health.state,
+                "latency": round(health.latency, 3) if health.latency is not None else None,
+                "error_rate": round(health.error_rate(), 4),
+                "outstanding": health.outstanding,
+            }
+            for name, health in self._health.items()
+        }
@@ -0,0 +1,384 @@
+"""
+AI响应语义缓存 - 基于结构化请求参数的归一化缓存键
+"""
+import hashlib
+import json
+import math
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+import structlog
+
+from app.core.config import settings, Constants
+from app.core.redis import cache, get_redis, destination_tag
+from app.core.http_client import http_clients
+
+logger = structlog.get_logger()
+
+# 旅行风格同义词归一
+STYLE_ALIASES = {
+    "休闲游": "休闲",
+    "轻松": "休闲",
+    "深度游": "深度",
+    "文化游": "文化",
+    "人文": "文化",
+    "探险游": "探险",
+    "户外": "探险",
+    "亲子游": "亲子",
+    "美食游": "美食",
+}
+
+# 预算分档边界(元)
+BUDGET_BUCKETS = (1000, 3000, 5000, 8000, 12000, 20000)
+
+SEASONS = {
+    12: "冬季", 1: "冬季", 2: "冬季",
+    3: "春季", 4: "春季", 5: "春季",
+    6: "夏季", 7: "夏季", 8: "夏季",
+    9: "秋季", 10: "秋季", 11: "秋季",
+}
+
+STATS_KEY = f"{Constants.CACHE_PREFIX_AI_RESPONSE}stats"
+# 向量数据（哈希）和登记时间（有序集合），与缓存的响应同样过期
+VECTORS_KEY = f"{Constants.CACHE_PREFIX_AI_RESPONSE}vectors"
+VECTORS_TIME_KEY = f"{Constants.CACHE_PREFIX_AI_RESPONSE}vectors:time"
+# 概览响应的缓存时长(秒)
+RESPONSE_TTL = 3600 * 24
+
+
+def normalize_style(travel_style: Optional[str]) -> str:
+    """归一化旅行风格"""
+    style = (travel_style or "休闲").strip()
+    return STYLE_ALIASES.get(style, style.rstrip("游") or "休闲")
+
+
+def budget_bucket(budget_min: Optional[float], budget_max: Optional[float]) -> str:
+    """按预算中值分档"""
+    if budget_min and budget_max:
+        value = (budget_min + budget_max) / 2
+    else:
+        value = budget_max or budget_min
+    if not value:
+        return "any"
+
+    lower = 0
+    for upper in BUDGET_BUCKETS:
+        if value < upper:
+            return f"{lower}-{upper}"
+        lower = upper
+    return f"{lower}+"
+
+
+def group_bucket(group_size: Optional[int]) -> str:
+    """按出行人数分档"""
+    size = group_size or 2
+    if size <= 1:
+        return "1"
+    if size == 2:
+        return "2"
+    if size <= 5:
+        return "3-5"
+    if size <= 10:
+        return "6-10"
+    return "10+"
+
+
+def season_of(start_date: Optional[datetime]) -> str:
+    """出行季节"""
+    if not start_date:
+        return "any"
+    return SEASONS[start_date.month]
+
+
+def canonical_location(destination: str, location_info: Optional[Dict[str, Any]]) -> str:
+    """规范化目的地：有地理编码时使用两位小数坐标（约1公里精度）"""
+    if location_info and location_info.get("latitude") is not None:
+        return f"{location_info['latitude']:.2f},{location_info['longitude']:.2f}"
+    return "".join(destination.split())
+
+
+def normalize_request(
+    destination: str,
+    days: int,
+    location_info: Optional[Dict[str, Any]] = None,
+    travel_style: Optional[str] = None,
+    budget_min: Optional[float] = None,
+    budget_max: Optional[float] = None,
+    group_size: Optional[int] = None,
+    start_date: Optional[datetime] = None,
+    special_requirements: Optional[str] = None
+) -> Dict[str, Any]:
+    """将攻略请求归一化为缓存用的结构化参数，剔除天气、具体日期等易变信息"""
+    requirements = "".join((special_requirements or "").split())
+    return {
+        "destination": "".join(destination.split()),
+        "location": canonical_location(destination, location_info),
+        "days": days,
+        "style": normalize_style(travel_style),
+        "budget": budget_bucket(budget_min, budget_max),
+        "group": group_bucket(group_size),
+        "season": season_of(start_date),
+        "requirements": hashlib.md5(requirements.encode()).hexdigest()[:12] if requirements else "",
+    }
+
+
+def request_fingerprint(params: Dict[str, Any]) -> str:
+    """攻略请求指纹：归一化参数的摘要，目的地只取规范化后的位置，不区分写法"""
+    fields = {k: v for k, v in params.items() if k != "destination"}
+    return hashlib.md5(json.dumps(fields, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+
+def _cosine(a: List[float], b: List[float]) -> float:
+    """余弦相似度"""
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class VectorIndex:
+    """进程内向量索引，按分区暴力检索余弦相似度
+
+    分区为必须严格一致的参数（天数、模型等），只在同分区内找近似请求。
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, Tuple[str, List[float]]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, key: str, partition: str, vector: List[float]):
+        """添加或覆盖向量"""
+        self._entries[key] = (partition, vector)
+
+    def remove(self, key: str):
+        """删除向量"""
+        self._entries.pop(key, None)
+
+    def clear(self):
+        """清空索引"""
+        self._entries.clear()
+
+    def search(self, partition: str, vector: List[float]) -> Tuple[Optional[str], float]:
+        """返回同分区内最相似的键及相似度"""
+        best_key, best_score = None, 0.0
+        for key, (entry_partition, entry_vector) in self._entries.items():
+            if entry_partition != partition:
+                continue
+            score = _cosine(vector, entry_vector)
+            if score > best_score:
+                best_key, best_score = key, score
+        return best_key, best_score
+
+
+class SemanticCache:
+    """攻略概览的语义缓存
+
+    缓存键由归一化请求参数生成，与提示词中的天气、日期等易变内容无关；
+    可选地通过本地向量索引匹配近似请求，索引定期从Redis重新加载以看到
+    其他进程登记的向量。命中统计写入Redis供多进程汇总。
+    """
+
+    def __init__(self):
+        self.index = VectorIndex()
+        self._index_loaded_at: Optional[float] = None
+
+    def build_key(self, params: Dict[str, Any], provider: Optional[str], **kwargs) -> str:
+        """生成缓存键"""
+        provider = provider or settings.DEFAULT_AI_PROVIDER
+        cache_data = {**params, "provider": provider, **kwargs}
+        cache_string = json.dumps(cache_data, sort_keys=True, ensure_ascii=False)
+        return f"semantic:{hashlib.md5(cache_string.encode()).hexdigest()}"
+
+    def _partition(self, params: Dict[str, Any], provider: Optional[str], **kwargs) -> str:
+        """近似匹配的分区：除目的地描述和风格外的参数必须一致
+
+        特殊需求（无障碍、饮食等）只有摘要，不能按语义近似，也要求完全一致。
+        """
+        hard = {k: v for k, v in params.items() if k not in ("destination", "style")}
+        hard.update(provider=provider or settings.DEFAULT_AI_PROVIDER, **kwargs)
+        return json.dumps(hard, sort_keys=True, ensure_ascii=False)
+
+    def _embedding_text(self, params: Dict[str, Any]) -> str:
+        """参与向量化的请求描述"""
+        return f"{params['destination']} {params['style']}"
+
+    async def lookup(
+        self,
+        cache_key: str,
+        params: Dict[str, Any],
+        provider: Optional[str] = None,
+        **kwargs
+    ) -> Optional[str]:
+        """按缓存键查找，未命中时尝试近似请求"""
+        cached = await cache.get_ai_response(cache_key)
+        if cached:
+            await self.record("semantic_hit")
+            logger.info("语义缓存命中", cache_key=cache_key)
+            return cached
+
+        if settings.SEMANTIC_CACHE_EMBEDDING_ENABLED:
+            near = await self._lookup_near(params, provider, **kwargs)
+            if near:
+                return near
+
+        await self.record("semantic_miss")
+        return None
+
+    async def store(
+        self,
+        cache_key: str,
+        params: Dict[str, Any],
+        response: str,
+        provider: Optional[str] = None,
+        **kwargs
+    ):
+        """写入缓存，启用向量检索时同时登记向量"""
+        if not response:
+            return
+        await cache.cache_ai_response(
+            cache_key, response, ttl=RESPONSE_TTL, tags=[destination_tag(params["destination"])]
+        )
+
+        if settings.SEMANTIC_CACHE_EMBEDDING_ENABLED:
+            try:
+                vector = await self._embed(self._embedding_text(params))
+                partition = self._partition(params, provider, **kwargs)
+                self.index.add(cache_key, partition, vector)
+                await self._save_vector(cache_key, partition, vector)
+            except Exception as e:
+                logger.error("语义缓存向量登记失败", cache_key=cache_key, error=str(e))
+
+    async def _lookup_near(
+        self,
+        params: Dict[str, Any],
+        provider: Optional[str],
+        **kwargs
+    ) -> Optional[str]:
+        """在本地向量索引中查找近似请求"""
+        try:
+            await self._load_index()
+            vector = await self._embed(self._embedding_text(params))
+            key, score = self.index.search(self._partition(params, provider, **kwargs), vector)
+            if key is None or score < settings.SEMANTIC_CACHE_SIMILARITY:
+                return None
+
+            cached = await cache.get_ai_response(key)
+            if cached:
+                await self.record("near_hit")
+                logger.info("语义缓存近似命中", cache_key=key, similarity=round(score, 4))
+                return cached
+            # 响应已过期或被失效，向量一并删除
+            await self._drop_vectors([key])
+        except Exception as e:
+            logger.error("语义缓存近似查找失败", error=str(e))
+        return None
+
+    async def _save_vector(self, cache_key: str, partition: str, vector: List[float]):
+        """向量写入Redis，超过SEMANTIC_CACHE_MAX_VECTORS时淘汰最早登记的"""
+        client = await get_redis()
+        async with client.pipeline(transaction=True) as pipe:
+            pipe.hset(VECTORS_KEY, cache_key, json.dumps({"partition": partition, "vector": vector}))
+            pipe.zadd(VECTORS_TIME_KEY, {cache_key: time.time()})
+            pipe.expire(VECTORS_KEY, RESPONSE_TTL)
+            pipe.expire(VECTORS_TIME_KEY, RESPONSE_TTL)
+            pipe.zcard(VECTORS_TIME_KEY)
+            size = (await pipe.execute())[-1]
+
+        overflow = size - settings.SEMANTIC_CACHE_MAX_VECTORS
+        if overflow > 0:
+            oldest = await client.zrange(VECTORS_TIME_KEY, 0, overflow - 1)
+            await self._drop_vectors([key.decode() if isinstance(key, bytes) else key for key in oldest])
+
+    async def _drop_vectors(self, keys: List[str]):
+        """从Redis和本地索引删除向量"""
+        if not keys:
+            return
+        for key in keys:
+            self.index.remove(key)
+        client = await get_redis()
+        async with client.pipeline(transaction=True) as pipe:
+            pipe.hdel(VECTORS_KEY, *keys)
+            pipe.zrem(VECTORS_TIME_KEY, *keys)
+            await pipe.execute()
+
+    async def _load_index(self):
+        """从Redis加载所有进程登记的向量，每SEMANTIC_CACHE_INDEX_REFRESH秒重新加载
+
+        加载时删除超过响应缓存时长或响应已不存在的向量。
+        """
+        now = time.monotonic()
+        if self._index_loaded_at is not None and now - self._index_loaded_at < settings.SEMANTIC_CACHE_INDEX_REFRESH:
+            return
+        self._index_loaded_at = now
+
+        client = await get_redis()
+        expired = await client.zrangebyscore(VECTORS_TIME_KEY, "-inf", time.time() - RESPONSE_TTL)
+        entries = {
+            (key.decode() if isinstance(key, bytes) else key): value
+            for key, value in (await client.hgetall(VECTORS_KEY)).items()
+        }
+        keys = list(entries)
+        async with client.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.exists(cache.get_ai_response_cache_key(key))
+            alive = await pipe.execute() if keys else []
+
+        stale = {key.decode() if isinstance(key, bytes) else key for key in expired}
+        stale.update(key for key, exists in zip(keys, alive) if not exists)
+        await self._drop_vectors(list(stale))
+
+        self.index.clear()
+        for key, value in entries.items():
+            if key in stale:
+                continue
+            data = json.loads(value)
+            self.index.add(key, data["partition"], data["vector"])
+        logger.info("语义缓存向量索引已加载", size=len(self.index), dropped=len(stale))
+
+    async def _embed(self, text: str) -> List[float]:
+        """调用Ollama嵌入接口"""
+        client = http_clients.get_client("ai_ollama")
+        response = await client.post(
+            f"{settings.OLLAMA_BASE_URL}/api/embeddings",
+            json={"model": settings.SEMANTIC_CACHE_EMBEDDING_MODEL, "prompt": text}
+        )
+        response.raise_for_status()
+        return response.json()["embedding"]
+
+    async def record(self, event: str):
+        """累加命中统计"""
+        try:
+            client = await get_redis()
+            await client.hincrby(STATS_KEY, event, 1)
+        except Exception as e:
+            logger.error("缓存统计写入失败", event=event, error=str(e))
+
+    async def get_stats(self) -> Dict[str, Any]:
+        """获取命中统计（所有worker汇总）"""
+        client = await get_redis()
+        raw = await client.hgetall(STATS_KEY)
+        counts = {
+            (k.decode() if isinstance(k, bytes) else k): int(v)
+            for k, v in raw.items()
+        }
+
+        stats = {}
+        for kind in ("prompt", "semantic"):
+            hits = counts.get(f"{kind}_hit", 0)
+            if kind == "semantic":
+                hits += counts.get("near_hit", 0)
+            misses = counts.get(f"{kind}_miss", 0)
+            total = hits + misses
+            stats[kind] = {
+                "hits": hits,
+                "misses": misses,
+                "hit_ratio": round(hits / total, 4) if total else 0.0,
+            }
+        stats["semantic"]["near_hits"] = counts.get("near_hit", 0)
+        stats["vector_index_size"] = len(self.index)
+        return stats
+
+
+# 全局语义缓存实例
+semantic_cache = SemanticCache()
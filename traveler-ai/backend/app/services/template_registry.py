@@ -0,0 +1,242 @@
+"""
+提示词模板注册表 - 文件模板和数据库模板的加载、预编译与缓存
+"""
+import asyncio
+import os
+import time
+from typing import Any, Dict, Optional, Tuple
+import aiofiles
+import aiofiles.os
+from jinja2 import Environment, TemplateError
+from sqlalchemy import func, select, update
+import structlog
+
+from app.core.config import settings
+from app.core.database import db_manager
+from app.core.single_flight import SingleFlight
+from app.models.template import Template
+
+logger = structlog.get_logger()
+
+# 各类型对应的模板文件
+TEMPLATE_FILES = {
+    "overview": "旅游概览模板.md",
+    "daily": "每日行程模板.md",
+}
+
+# 模板为Markdown原文，不转义、保留末尾换行
+_environment = Environment(autoescape=False, keep_trailing_newline=True)
+
+
+class CompiledTemplate:
+    """预编译的模板
+
+    version用于判断模板是否变化：文件模板为(路径, mtime)，
+    数据库模板为(模板ID, 版本号, 更新时间)。不含Jinja语法的模板直接返回原文。
+    """
+
+    def __init__(
+        self,
+        content: str,
+        source: str,
+        version: Tuple,
+        template_id: Optional[int] = None,
+        defaults: Optional[Dict[str, Any]] = None
+    ):
+        self.content = content
+        self.source = source
+        self.version = version
+        self.template_id = template_id
+        self.defaults = defaults or {}
+        self._compiled = None
+        if "{" in content:
+            try:
+                self._compiled = _environment.from_string(content)
+            except TemplateError as e:
+                logger.warning("模板编译失败，按原文输出", source=source, version=version, error=str(e))
+
+    def render(self, **context) -> str:
+        """用默认值和context渲染模板"""
+        if self._compiled is None:
+            return self.content
+        return self._compiled.render(**{**self.defaults, **context})
+
+
+class TemplateRegistry:
+    """提示词模板注册表
+
+    每种模板加载一次后常驻内存，每隔TEMPLATE_CHECK_INTERVAL秒检查一次
+    数据库版本号或文件mtime，变化时才重新读取并编译。启用中的数据库模板
+    优先于文件模板。数据库模板的使用次数在内存中累计，由后台任务定期批量写回。
+    """
+
+    def __init__(self):
+        self._templates: Dict[str, CompiledTemplate] = {}
+        self._checked_at: Dict[str, float] = {}
+        self._single_flight = SingleFlight("template_registry")
+        self._usage: Dict[int, int] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """启动使用次数的定期写回"""
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        """停止定期写回，写完剩余的使用次数"""
+        if self._flush_task:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self.flush_usage()
+
+    async def render(self, template_type: str, **context) -> str:
+        """渲染指定类型的模板，模板不存在时返回占位内容"""
+        template = await self.get(template_type)
+        if template is None:
+            return f"# {template_type}模板\n模板内容待定"
+
+        if template.template_id is not None:
+            self._usage[template.template_id] = self._usage.get(template.template_id, 0) + 1
+        try:
+            return template.render(**context)
+        except Exception as e:
+            logger.error("渲染模板失败", template_type=template_type, error=str(e))
+            return template.content
+
+    async def get(self, template_type: str) -> Optional[CompiledTemplate]:
+        """获取编译好的模板，超过检查间隔时校验版本"""
+        cached = self._templates.get(template_type)
+        if cached and time.monotonic() - self._checked_at.get(template_type, 0) < settings.TEMPLATE_CHECK_INTERVAL:
+            return cached
+        return await self._single_flight.do(template_type, lambda: self._refresh(template_type))
+
+    async def _refresh(self, template_type: str) -> Optional[CompiledTemplate]:
+        """按数据库模板、文件模板的顺序校验并在变化时重新加载"""
+        cached = self._templates.get(template_type)
+        template = await self._load_db_template(template_type, cached)
+        if template is None:
+            template = await self._load_file_template(template_type, cached)
+        if template is None:
+            # 都读取失败时继续使用旧模板
+            template = cached
+
+        self._checked_at[template_type] = time.monotonic()
+        if template is not None:
+            if template is not cached:
+                logger.info("模板已加载", template_type=template_type, source=template.source, version=template.version)
+            self._templates[template_type] = template
+        else:
+            logger.warning("模板不存在", template_type=template_type)
+        return template
+
+    async def _load_db_template(
+        self,
+        template_type: str,
+        cached: Optional[CompiledTemplate]
+    ) -> Optional[CompiledTemplate]:
+        """读取启用中的数据库模板，自定义模板优先于系统模板；版本未变时返回缓存"""
+        async def _query_version(session):
+            result = await session.execute(
+                select(Template.id, Template.version, Template.updated_at)
+                .where(Template.type == template_type, Template.is_active.is_(True))
+                .order_by(Template.is_system.asc(), Template.updated_at.desc().nullslast(), Template.id.desc())
+                .limit(1)
+            )
+            return result.first()
+
+        async def _query_content(session, template_id):
+            result = await session.execute(
+                select(Template.content, Template.default_values).where(Template.id == template_id)
+            )
+            return result.first()
+
+        try:
+            row = await db_manager.execute_transaction(_query_version)
+            if row is None:
+                return None
+            version = (row.id, row.version, row.updated_at)
+            if cached and cached.source == "db" and cached.version == version:
+                return cached
+
+            content = await db_manager.execute_transaction(_query_content, row.id)
+        except Exception as e:
+            logger.error("读取数据库模板失败", template_type=template_type, error=str(e))
+            return None
+
+        if content is None:
+            return None
+        return CompiledTemplate(content.content, "db", version, template_id=row.id, defaults=content.default_values)
+
+    async def _load_file_template(
+        self,
+        template_type: str,
+        cached: Optional[CompiledTemplate]
+    ) -> Optional[CompiledTemplate]:
+        """读取模板文件，优先TEMPLATES_PATH，其次项目根目录的templates；mtime未变时返回缓存"""
+        template_file = TEMPLATE_FILES.get(template_type)
+        if not template_file:
+            return None
+
+        for directory in (settings.TEMPLATES_PATH or "templates", "templates"):
+            path = os.path.join(directory, template_file)
+            try:
+                stat = await aiofiles.os.stat(path)
+            except FileNotFoundError:
+                continue
+
+            version = (path, stat.st_mtime_ns)
+            if cached and cached.source == "file" and cached.version == version:
+                return cached
+            try:
+                async with aiofiles.open(path, "r", encoding="utf-8") as f:
+                    content = await f.read()
+            except Exception as e:
+                logger.error("读取模板文件失败", template_type=template_type, path=path, error=str(e))
+                return None
+            return CompiledTemplate(content, "file", version)
+        return None
+
+    async def _flush_loop(self):
+        """定期写回使用次数"""
+        while True:
+            await asyncio.sleep(settings.TEMPLATE_USAGE_FLUSH_INTERVAL)
+            await self.flush_usage()
+
+    async def flush_usage(self):
+        """把累计的使用次数在一个事务内写回数据库"""
+        if not self._usage:
+            return
+
+        usage = self._usage
+        self._usage = {}
+
+        async def _update(session):
+            for template_id, count in usage.items():
+                await session.execute(
+                    update(Template)
+                    .where(Template.id == template_id)
+                    .values(usage_count=func.coalesce(Template.usage_count, 0) + count)
+                )
+
+        try:
+            await db_manager.execute_transaction(_update)
+        except Exception as e:
+            logger.error("写回模板使用次数失败", templates=len(usage), error=str(e))
+
+    def get_stats(self) -> Dict[str, Any]:
+        """已加载模板及待写回的使用次数"""
+        return {
+            "templates": {
+                template_type: {"source": template.source, "template_id": template.template_id}
+                for template_type, template in self._templates.items()
+            },
+            "pending_usage": sum(self._usage.values()),
+        }
+
+
+# 全局模板注册表实例
+template_registry = TemplateRegistry()
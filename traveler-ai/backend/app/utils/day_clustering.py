@@ -0,0 +1,132 @@
+"""
+多日景点分组 - 带容量约束的k-medoids
+"""
+from typing import List, Optional, Sequence, Set
+
+Matrix = Sequence[Sequence[float]]
+
+
+def _symmetric(matrix: Matrix) -> List[List[float]]:
+    """往返行程取平均，作为两点间的距离"""
+    count = len(matrix)
+    return [[(matrix[i][j] + matrix[j][i]) / 2 for j in range(count)] for i in range(count)]
+
+
+def _initial_medoids(distance: List[List[float]], k: int) -> List[int]:
+    """最中心的点作为第一个中心，之后依次取离已选中心最远的点"""
+    count = len(distance)
+    medoids = [min(range(count), key=lambda i: sum(distance[i]))]
+    while len(medoids) < k:
+        medoids.append(max(
+            (i for i in range(count) if i not in medoids),
+            key=lambda i: min(distance[i][m] for m in medoids)
+        ))
+    return medoids
+
+
+def _assign(
+    distance: List[List[float]],
+    weights: Sequence[float],
+    medoids: List[int],
+    capacity: float
+) -> List[List[int]]:
+    """按后悔值从大到小依次把点分到最近且未满的组，都满时分到负载最小的组"""
+    clusters = [[m] for m in medoids]
+    loads = [weights[m] for m in medoids]
+    rest = [i for i in range(len(distance)) if i not in medoids]
+
+    def regret(i: int) -> float:
+        ranked = sorted(distance[i][m] for m in medoids)
+        return ranked[1] - ranked[0] if len(ranked) > 1 else 0.0
+
+    for i in sorted(rest, key=regret, reverse=True):
+        ranked = sorted(range(len(medoids)), key=lambda c: distance[i][medoids[c]])
+        target = next((c for c in ranked if loads[c] + weights[i] <= capacity), None)
+        if target is None:
+            target = min(range(len(medoids)), key=lambda c: loads[c])
+        clusters[target].append(i)
+        loads[target] += weights[i]
+    return clusters
+
+
+def cluster_days(
+    matrix: Matrix,
+    weights: Sequence[float],
+    days: int,
+    slack: float = 0.25,
+    max_iterations: int = 20
+) -> List[List[int]]:
+    """把地点分成days组，每组总权重（游览时长）不超过平均值的(1+slack)倍
+
+    matrix为两点间行程时间，返回各组的地点下标；地点数少于天数时多出的组为空。
+    """
+    count = len(matrix)
+    if count == 0:
+        return [[] for _ in range(days)]
+    if count <= days:
+        return [[i] for i in range(count)] + [[] for _ in range(days - count)]
+
+    distance = _symmetric(matrix)
+    capacity = max(sum(weights) / days * (1 + slack), max(weights))
+    medoids = _initial_medoids(distance, days)
+
+    clusters = _assign(distance, weights, medoids, capacity)
+    for _ in range(max_iterations):
+        updated = [
+            min(cluster, key=lambda i: sum(distance[i][j] * weights[j] for j in cluster))
+            for cluster in clusters
+        ]
+        if updated == medoids:
+            break
+        medoids = updated
+        clusters = _assign(distance, weights, medoids, capacity)
+    return clusters
+
+
+def order_clusters(
+    clusters: List[List[int]],
+    matrix: Matrix,
+    preferences: Optional[List[Set[int]]] = None
+) -> List[int]:
+    """确定各组安排在第几天，返回每天对应的组下标
+
+    preferences[d]为原方案第d天包含的地点，先按重合数量贪心匹配；
+    剩余的组从已排定的天往后按就近原则依次排列。
+    """
+    days = len(clusters)
+    assigned: List[Optional[int]] = [None] * days
+    free = set(range(days))
+
+    if preferences:
+        pairs = sorted(
+            (
+                (len(preferences[day] & set(clusters[c])), day, c)
+                for day in range(min(days, len(preferences)))
+                for c in range(days)
+            ),
+            reverse=True
+        )
+        for overlap, day, c in pairs:
+            if overlap == 0:
+                break
+            if assigned[day] is None and c in free:
+                assigned[day] = c
+                free.remove(c)
+
+    def gap(a: int, b: int) -> float:
+        if not clusters[a] or not clusters[b]:
+            return 0.0
+        return min(matrix[i][j] for i in clusters[a] for j in clusters[b])
+
+    for day in range(days):
+        if assigned[day] is not None:
+            continue
+        prev = next((assigned[d] for d in range(day - 1, -1, -1) if assigned[d] is not None), None)
+        if prev is None:
+            # 第一天没有参照时选最靠边的组，后面的天依次就近
+            c = max(free, key=lambda c: sum(gap(c, other) for other in free))
+        else:
+            c = min(free, key=lambda c: gap(prev, c))
+        assigned[day] = c
+        free.remove(c)
+    return assigned
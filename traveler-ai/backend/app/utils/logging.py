@@ -1,19 +1,83 @@
 """
 结构化日志配置
 """
+import atexit
+import logging
+import queue
+import random
 import sys
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional
+import orjson
 import structlog
 from structlog import dev
 from app.core.config import settings
 
+# 后台输出线程，进程退出时写完队列中剩余的日志
+_listener: Optional[QueueListener] = None
+
+
+class EventSampler:
+    """按事件名采样的structlog处理器
+
+    只对info及以下级别生效，warning以上和未配置采样率的事件全部保留；
+    保留下来的事件带上sample_rate，统计时可按比例还原。
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        self.rates = rates
+
+    def __call__(self, logger: Any, method_name: str, event_dict: Dict[str, Any]) -> Dict[str, Any]:
+        rate = self.rates.get(event_dict.get("event"))
+        if rate is None or rate >= 1 or method_name not in ("debug", "info"):
+            return event_dict
+        if random.random() >= rate:
+            raise structlog.DropEvent
+        event_dict["sample_rate"] = rate
+        return event_dict
+
+
+class DroppingQueueHandler(QueueHandler):
+    """队列满时丢弃日志而不阻塞调用方"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # structlog的日志已渲染为字符串，直接入队；uvicorn、sqlalchemy等标准库日志
+        # 带参数或异常信息，在调用线程合并，避免参数在输出前被修改或无法跨队列传递
+        if not record.args and not record.exc_info and isinstance(record.msg, str):
+            return record
+        return super().prepare(record)
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def _orjson_dumps(obj: Any, **kwargs) -> str:
+    """orjson序列化，无法序列化的值转为字符串"""
+    return orjson.dumps(obj, default=str).decode()
+
 
 def setup_logging():
-    """设置结构化日志"""
-    
+    """设置结构化日志
+
+    请求ID等上下文通过contextvars绑定，自动合并到同一请求内的所有日志；
+    按LOG_SAMPLE_RATES对高频事件采样；日志经队列交给后台线程写入stdout，
+    不在事件循环中阻塞。
+    """
+    global _listener
+
     # 配置structlog
     structlog.configure(
         processors=[
             structlog.stdlib.filter_by_level,
+            EventSampler(settings.LOG_SAMPLE_RATES),
+            structlog.contextvars.merge_contextvars,
             structlog.stdlib.add_logger_name,
             structlog.stdlib.add_log_level,
             structlog.stdlib.PositionalArgumentsFormatter(),
@@ -22,7 +86,7 @@ def setup_logging():
             structlog.processors.format_exc_info,
             structlog.processors.UnicodeDecoder(),
             # 根据配置选择输出格式
-            structlog.processors.JSONRenderer(ensure_ascii=False)
+            structlog.processors.JSONRenderer(serializer=_orjson_dumps)
             if settings.LOG_FORMAT == "json"
             else dev.ConsoleRenderer(colors=True),
         ],
@@ -31,11 +95,18 @@ def setup_logging():
         wrapper_class=structlog.stdlib.BoundLogger,
         cache_logger_on_first_use=True,
     )
-    
-    # 设置标准库日志级别
-    import logging
-    logging.basicConfig(
-        format="%(message)s",
-        stream=sys.stdout,
-        level=getattr(logging, settings.LOG_LEVEL.upper()),
-    ) 
\ No newline at end of file
+
+    # 标准库日志经队列由后台线程输出
+    if _listener is not None:
+        return
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(logging.Formatter("%(message)s"))
+    log_queue: queue.Queue = queue.Queue(maxsize=settings.LOG_QUEUE_SIZE)
+    _listener = QueueListener(log_queue, stream_handler)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    root = logging.getLogger()
+    root.handlers = [DroppingQueueHandler(log_queue)]
+    root.setLevel(getattr(logging, settings.LOG_LEVEL.upper()))
@@ -0,0 +1,322 @@
+"""
+单日路线优化 - 带营业时间窗的游览顺序求解
+"""
+import re
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# 地点数不超过该值时用状态压缩DP精确求解
+EXACT_LIMIT = 9
+# 晚于关门时间到达的惩罚（每分钟折合的行程分钟数）
+LATE_PENALTY = 60.0
+# 局部搜索只尝试与最近的若干个点相连的改动
+NEIGHBOR_COUNT = 8
+# 局部搜索的时间上限(秒)，到时返回当前最优顺序
+TIME_LIMIT = 0.03
+
+TIME_RANGE_PATTERN = re.compile(r"(\d{1,2})[:：](\d{2})\s*[-~至到]\s*(次日)?(\d{1,2})[:：](\d{2})")
+
+Matrix = Sequence[Sequence[float]]
+Window = Optional[Tuple[float, float]]
+
+
+def parse_time_window(text: Optional[str]) -> Window:
+    """解析营业时间文本（如“08:30-18:00”），返回当天分钟数(开门, 关门)"""
+    if not text:
+        return None
+    match = TIME_RANGE_PATTERN.search(text)
+    if not match:
+        return None
+    open_hour, open_minute, next_day, close_hour, close_minute = match.groups()
+    open_at = int(open_hour) * 60 + int(open_minute)
+    close_at = int(close_hour) * 60 + int(close_minute)
+    if next_day or close_at <= open_at:
+        close_at += 24 * 60
+    return float(open_at), float(close_at)
+
+
+class RouteProblem:
+    """单日路线问题
+
+    matrix为所有点两两之间的行程时间(分钟)，visits为需要排序的点，
+    start/end为固定的起终点（如前一晚和当晚的酒店），为None时不计该段行程。
+    stay、windows按点下标给出停留时长和营业时间窗(分钟)。
+    """
+
+    def __init__(
+        self,
+        matrix: Matrix,
+        visits: List[int],
+        start: Optional[int] = None,
+        end: Optional[int] = None,
+        stay: Optional[Sequence[float]] = None,
+        windows: Optional[Sequence[Window]] = None,
+        start_time: float = 0.0
+    ):
+        self.matrix = matrix
+        self.visits = visits
+        self.start = start
+        self.end = end
+        self.stay = stay or [0.0] * len(matrix)
+        self.windows = windows or [None] * len(matrix)
+        self.start_time = start_time
+        self.timed = any(self.windows[node] for node in visits)
+
+    def neighbors(self, count: int = NEIGHBOR_COUNT) -> Dict[int, set]:
+        """每个点（含起点）行程时间最近的count个待游览点"""
+        nodes = list(self.visits) + ([self.start] if self.start is not None else [])
+        return {
+            node: set(sorted(
+                (other for other in self.visits if other != node),
+                key=lambda other: min(self.matrix[node][other], self.matrix[other][node])
+            )[:count])
+            for node in nodes
+        }
+
+    def travel(self, order: Sequence[int]) -> float:
+        """按顺序游览的总行程时间"""
+        matrix = self.matrix
+        total = 0.0
+        prev = self.start if self.start is not None else order[0]
+        for node in order:
+            total += matrix[prev][node]
+            prev = node
+        if self.end is not None:
+            total += matrix[prev][self.end]
+        return total
+
+    def cost(self, order: Sequence[int]) -> float:
+        """行程时间加晚到惩罚"""
+        return self.suffix_cost(order, 0, self.initial_state(), float("inf"))
+
+    def initial_state(self) -> Tuple[float, float, Optional[int]]:
+        """出发前的状态 (已计代价, 当前时间, 当前位置)；没有起点时位置为None，第一段不计行程"""
+        return 0.0, self.start_time, self.start
+
+    def prefix_states(self, order: Sequence[int]) -> List[Tuple[float, float, Optional[int]]]:
+        """游览到每个位置之前的状态，局部搜索时前半段不变的顺序可直接复用"""
+        matrix, stay, windows = self.matrix, self.stay, self.windows
+        cost, now, prev = self.initial_state()
+        states = [(cost, now, prev)]
+        for node in order:
+            leg = matrix[prev][node] if prev is not None else 0.0
+            cost += leg
+            now += leg
+            window = windows[node]
+            if window:
+                if now < window[0]:
+                    now = window[0]
+                elif now > window[1]:
+                    cost += LATE_PENALTY * (now - window[1])
+            now += stay[node]
+            prev = node
+            states.append((cost, now, prev))
+        return states
+
+    def suffix_cost(
+        self,
+        order: Sequence[int],
+        begin: int,
+        state: Tuple[float, float, Optional[int]],
+        bound: float
+    ) -> float:
+        """从第begin个位置和给定状态算起的总代价（行程时间加晚到惩罚）
+
+        代价只增不减，超过bound时提前返回inf。
+        """
+        matrix, stay, windows = self.matrix, self.stay, self.windows
+        cost, now, prev = state
+        for index in range(begin, len(order)):
+            node = order[index]
+            leg = matrix[prev][node] if prev is not None else 0.0
+            cost += leg
+            now += leg
+            window = windows[node]
+            if window:
+                if now < window[0]:
+                    now = window[0]
+                elif now > window[1]:
+                    cost += LATE_PENALTY * (now - window[1])
+            if cost >= bound:
+                return float("inf")
+            now += stay[node]
+            prev = node
+        if self.end is not None:
+            cost += matrix[prev][self.end]
+        return cost
+
+    def schedule(self, order: Sequence[int]) -> List[Tuple[float, float]]:
+        """各点的到达和离开时间(分钟)"""
+        result = []
+        now = self.start_time
+        prev = self.start if self.start is not None else order[0]
+        for node in order:
+            now += self.matrix[prev][node]
+            window = self.windows[node]
+            if window and now < window[0]:
+                now = window[0]
+            result.append((now, now + self.stay[node]))
+            now += self.stay[node]
+            prev = node
+        return result
+
+
+def solve_exact(problem: RouteProblem) -> List[int]:
+    """状态压缩DP（Held-Karp），按到达时间顺带计算晚到惩罚"""
+    visits = problem.visits
+    count = len(visits)
+    matrix, stay, windows = problem.matrix, problem.stay, problem.windows
+    size = 1 << count
+
+    # best[mask][j]: 游览mask中的点且最后停在j时的 (代价, 离开时间, 前一个点)
+    best: List[List[Optional[Tuple[float, float, int]]]] = [[None] * count for _ in range(size)]
+    for j, node in enumerate(visits):
+        leg = matrix[problem.start][node] if problem.start is not None else 0.0
+        best[1 << j][j] = _arrive(leg, problem.start_time + leg, windows[node], stay[node], -1)
+
+    for mask in range(1, size):
+        row = best[mask]
+        for j in range(count):
+            state = row[j]
+            if state is None:
+                continue
+            cost, now, _ = state
+            origin = matrix[visits[j]]
+            for k in range(count):
+                if mask & (1 << k):
+                    continue
+                node = visits[k]
+                leg = origin[node]
+                candidate = _arrive(cost + leg, now + leg, windows[node], stay[node], j)
+                target = best[mask | (1 << k)]
+                if target[k] is None or candidate[0] < target[k][0]:
+                    target[k] = candidate
+
+    full = size - 1
+    last, best_cost = 0, float("inf")
+    for j in range(count):
+        cost = best[full][j][0]
+        if problem.end is not None:
+            cost += matrix[visits[j]][problem.end]
+        if cost < best_cost:
+            last, best_cost = j, cost
+
+    order = []
+    mask = full
+    while last >= 0:
+        order.append(visits[last])
+        prev = best[mask][last][2]
+        mask ^= 1 << last
+        last = prev
+    order.reverse()
+    return order
+
+
+def _arrive(cost: float, now: float, window: Window, stay: float, prev: int) -> Tuple[float, float, int]:
+    """到达一个点后的代价和离开时间"""
+    if window:
+        if now < window[0]:
+            now = window[0]
+        elif now > window[1]:
+            cost += LATE_PENALTY * (now - window[1])
+    return cost, now + stay, prev
+
+
+def nearest_neighbor(problem: RouteProblem) -> List[int]:
+    """最近邻构造初始顺序；有时间窗时优先关门早的点"""
+    matrix, windows = problem.matrix, problem.windows
+    remaining = list(problem.visits)
+    if problem.start is not None:
+        prev = problem.start
+    else:
+        prev = min(remaining, key=lambda node: windows[node][1] if windows[node] else float("inf"))
+        remaining.remove(prev)
+
+    order = [] if problem.start is not None else [prev]
+    while remaining:
+        node = min(
+            remaining,
+            key=lambda node: (matrix[prev][node], windows[node][1] if windows[node] else float("inf"))
+        )
+        remaining.remove(node)
+        order.append(node)
+        prev = node
+    return order
+
+
+def two_opt(problem: RouteProblem, order: List[int], near: Dict[int, set]) -> Tuple[List[int], bool]:
+    """反转一段顺序，一轮内接受所有更优的改动
+
+    反转order[i:j]后新增 order[i-1]→order[j-1] 一段，只尝试这两点相近的改动。
+    """
+    states = problem.prefix_states(order)
+    current = problem.cost(order)
+    improved = False
+    for i in range(len(order) - 1):
+        prev = order[i - 1] if i > 0 else problem.start
+        for j in range(i + 2, len(order) + 1):
+            if prev is not None and order[j - 1] not in near[prev]:
+                continue
+            candidate = order[:i] + order[i:j][::-1] + order[j:]
+            candidate_cost = problem.suffix_cost(candidate, i, states[i], current - 1e-9)
+            if candidate_cost < current - 1e-9:
+                order, current, improved = candidate, candidate_cost, True
+                states = problem.prefix_states(order)
+                prev = order[i - 1] if i > 0 else problem.start
+    return order, improved
+
+
+def or_opt(problem: RouteProblem, order: List[int], near: Dict[int, set]) -> Tuple[List[int], bool]:
+    """把长度1~3的一段挪到其他位置，一轮内接受所有更优的改动
+
+    只尝试插入位置前一个点与段首相近、或后一个点与段尾相近的改动。
+    """
+    states = problem.prefix_states(order)
+    current = problem.cost(order)
+    improved = False
+    for length in (1, 2, 3):
+        for i in range(len(order) - length + 1):
+            segment = order[i:i + length]
+            rest = order[:i] + order[i + length:]
+            tail = near[segment[-1]]
+            for position in range(len(rest) + 1):
+                if position == i:
+                    continue
+                before = rest[position - 1] if position > 0 else problem.start
+                after = rest[position] if position < len(rest) else None
+                if segment[0] not in near.get(before, ()) and after not in tail:
+                    continue
+                candidate = rest[:position] + segment + rest[position:]
+                begin = min(i, position)
+                candidate_cost = problem.suffix_cost(candidate, begin, states[begin], current - 1e-9)
+                if candidate_cost < current - 1e-9:
+                    order, current, improved = candidate, candidate_cost, True
+                    states = problem.prefix_states(order)
+                    break
+    return order, improved
+
+
+def local_search(problem: RouteProblem, order: List[int], time_limit: float = TIME_LIMIT) -> List[int]:
+    """交替2-opt和Or-opt直到无法改进或超时"""
+    deadline = time.perf_counter() + time_limit
+    near = problem.neighbors()
+    while time.perf_counter() < deadline:
+        order, improved_2opt = two_opt(problem, order, near)
+        order, improved_oropt = or_opt(problem, order, near)
+        if not (improved_2opt or improved_oropt):
+            break
+    return order
+
+
+def optimize_route(problem: RouteProblem, exact_limit: int = EXACT_LIMIT) -> List[int]:
+    """求解游览顺序
+
+    点数少时用DP求解，有时间窗时DP按最早到达合并状态、不保证最优，再做一次局部搜索；
+    点数多时最近邻构造后局部搜索。
+    """
+    if len(problem.visits) <= 1:
+        return list(problem.visits)
+    if len(problem.visits) <= exact_limit:
+        order = solve_exact(problem)
+        return local_search(problem, order) if problem.timed else order
+    return local_search(problem, nearest_neighbor(problem))
@@ -0,0 +1,55 @@
+"""
+独立的攻略生成worker进程
+
+用法：python -m app.worker
+"""
+import asyncio
+import signal
+import structlog
+
+from app.core.database import init_db
+from app.core import metrics, tracing
+from app.core.redis import init_redis, close_redis
+from app.core.http_client import init_http_clients, close_http_clients
+from app.core.single_flight import stop_release_notifier
+from app.services.generation_worker import generation_worker
+from app.services.poi_warehouse import poi_warehouse
+from app.services.template_registry import template_registry
+from app.utils.logging import setup_logging
+
+setup_logging()
+logger = structlog.get_logger()
+
+
+async def main():
+    """启动worker并等待退出信号"""
+    await init_db()
+    tracing.setup_tracing("traveler-ai-worker")
+    await init_redis()
+    await init_http_clients()
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    await poi_warehouse.start()
+    await template_registry.start()
+    await generation_worker.start()
+    logger.info("攻略生成worker进程已就绪")
+
+    await stop_event.wait()
+
+    await generation_worker.stop()
+    await poi_warehouse.stop()
+    await template_registry.stop()
+    await close_http_clients()
+    await stop_release_notifier()
+    await close_redis()
+    tracing.shutdown_tracing()
+    metrics.mark_process_dead()
+    logger.info("攻略生成worker进程已退出")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+缓存编解码基准测试
+
+对比原实现（json.dumps, ensure_ascii=False）与各序列化/压缩组合的
+编码后大小和编解码耗时；指定 --url 时额外写入Redis，用 MEMORY USAGE 统计实际内存占用。
+样本为攻略概览Markdown（AI响应）和地点检索结果（地图缓存）。
+
+用法：
+    python benchmarks/cache_codec.py
+    python benchmarks/cache_codec.py --url redis://localhost:6379/15
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import sys
+import time
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+from app.core.codec import CacheCodec, COMPRESSOR_IDS, SERIALIZER_IDS  # noqa: E402
+
+DEFAULT_OVERVIEW = project_root.parent.parent / "新疆伊犁旅游概览.md"
+
+
+def place_search_sample() -> dict:
+    """模拟 search_places 的缓存结果"""
+    places = [
+        {
+            "name": f"赛里木湖景点{i}",
+            "address": "新疆维吾尔自治区博尔塔拉蒙古自治州博乐市",
+            "latitude": 44.6 + i * 0.001,
+            "longitude": 81.2 + i * 0.001,
+            "uid": f"{i:024x}",
+            "area": "博乐市",
+            "city": "博尔塔拉蒙古自治州",
+            "province": "新疆维吾尔自治区",
+            "telephone": "",
+            "detail": 1,
+            "tag": "旅游景点;风景区",
+            "type": "scope",
+            "detail_info": {"overall_rating": "4.7", "comment_num": 1200 + i},
+        }
+        for i in range(20)
+    ]
+    return {"total": 20, "places": places, "page_num": 0, "page_size": 20}
+
+
+class LegacyCodec:
+    """原实现：JSON文本，读取时直接json.loads"""
+
+    name = "legacy json"
+
+    def encode(self, value):
+        return json.dumps(value, ensure_ascii=False).encode("utf-8")
+
+    def decode(self, data):
+        return json.loads(data)
+
+
+def available_codecs(threshold: int):
+    """所有可用的编码组合（不可用的组合会退回标准库，跳过重复项）"""
+    codecs = {"legacy json": LegacyCodec()}
+    for serializer, compressor in itertools.product(SERIALIZER_IDS, COMPRESSOR_IDS):
+        codec = CacheCodec(serializer, compressor, threshold)
+        codecs.setdefault(codec.name, codec)
+    return codecs.values()
+
+
+def measure(codec, value, rounds: int):
+    """编码后大小和平均编解码耗时(微秒)"""
+    encoded = codec.encode(value)
+    assert codec.decode(encoded) == value
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        codec.encode(value)
+    encode_us = (time.perf_counter() - start) * 1e6 / rounds
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        codec.decode(encoded)
+    decode_us = (time.perf_counter() - start) * 1e6 / rounds
+
+    return encoded, encode_us, decode_us
+
+
+async def redis_memory(url: str, encoded_values: dict) -> dict:
+    """写入Redis并读取每个键的 MEMORY USAGE"""
+    import redis.asyncio as redis
+
+    client = redis.Redis.from_url(url)
+    try:
+        usage = {}
+        for key, data in encoded_values.items():
+            await client.set(f"bench:codec:{key}", data, ex=60)
+            usage[key] = await client.memory_usage(f"bench:codec:{key}")
+            await client.delete(f"bench:codec:{key}")
+        return usage
+    finally:
+        await client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="缓存编解码基准测试")
+    parser.add_argument("--overview", default=str(DEFAULT_OVERVIEW), help="AI响应样本（Markdown文件）")
+    parser.add_argument("--rounds", type=int, default=200, help="编解码耗时测量轮数")
+    parser.add_argument("--threshold", type=int, default=1024, help="压缩阈值(字节)")
+    parser.add_argument("--url", help="指定Redis时统计实际内存占用")
+    args = parser.parse_args()
+
+    samples = {
+        "AI响应": Path(args.overview).read_text(encoding="utf-8"),
+        "地点检索": place_search_sample(),
+    }
+
+    for sample_name, value in samples.items():
+        rows = []
+        encoded_values = {}
+        for codec in available_codecs(args.threshold):
+            encoded, encode_us, decode_us = measure(codec, value, args.rounds)
+            rows.append((codec.name, len(encoded), encode_us, decode_us))
+            encoded_values[codec.name] = encoded
+
+        memory = asyncio.run(redis_memory(args.url, encoded_values)) if args.url else {}
+
+        baseline = rows[0][1]
+        print(f"\n样本：{sample_name}（原实现 {baseline} 字节）")
+        print(f"{'编码':<16}{'字节':>10}{'压缩比':>8}{'编码us':>10}{'解码us':>10}{'Redis内存':>12}")
+        for name, size, encode_us, decode_us in rows:
+            usage = memory.get(name, "-")
+            print(f"{name:<16}{size:>10}{size / baseline:>8.2f}{encode_us:>10.1f}{decode_us:>10.1f}{usage:>12}")
+
+
+if __name__ == "__main__":
+    main()
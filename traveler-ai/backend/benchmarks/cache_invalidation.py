@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+缓存批量失效基准测试
+
+在本地Redis的独立库中写入大量 map_data: 键（默认100个目的地×1万 = 100万），
+对比三种失效方式删除单个目的地的耗时，以及删除期间其他请求的延迟：
+
+- KEYS + DEL：原 clear_pattern 的实现
+- SCAN + UNLINK：CacheManager.clear_pattern
+- 标签集合：CacheManager.invalidate_tags
+
+注意：会清空 --url 指定的库，请勿指向业务库。
+
+用法：
+    python benchmarks/cache_invalidation.py --url redis://localhost:6379/15
+    python benchmarks/cache_invalidation.py --destinations 10 --keys-per-destination 1000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+KEY_PREFIX = "map_data:bench_"
+
+
+def key_of(destination: int, index: int) -> str:
+    return f"{KEY_PREFIX}{destination}_{index}"
+
+
+async def build_fixture(client, destinations: int, keys_per_destination: int, chunk: int = 10000):
+    """写入测试数据，每个目的地的键同时登记到标签集合"""
+    from app.core.redis import TAG_PREFIX, destination_tag
+
+    await client.flushdb()
+    value = b'{"latitude": 43.9, "longitude": 81.3, "formatted_address": "bench"}'
+    for destination in range(destinations):
+        tag_key = f"{TAG_PREFIX}{destination_tag(f'bench_{destination}')}"
+        for start in range(0, keys_per_destination, chunk):
+            async with client.pipeline(transaction=False) as pipe:
+                keys = [key_of(destination, i) for i in range(start, min(start + chunk, keys_per_destination))]
+                for key in keys:
+                    pipe.setex(key, 3600, value)
+                pipe.sadd(tag_key, *keys)
+                await pipe.execute()
+        await client.expire(tag_key, 3600)
+
+
+async def probe(client, stop: asyncio.Event, latencies: list, interval: float = 0.005):
+    """模拟其他请求：持续发送GET并记录延迟"""
+    while not stop.is_set():
+        start = time.perf_counter()
+        await client.get(key_of(0, 0))
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(interval)
+
+
+async def legacy_clear(client, pattern: str) -> int:
+    """原实现：KEYS + 一次性DEL"""
+    keys = await client.keys(pattern)
+    if keys:
+        return await client.delete(*keys)
+    return 0
+
+
+async def run_case(name: str, action, probe_client):
+    """执行一种失效方式，同时测量探测请求延迟"""
+    latencies: list = []
+    stop = asyncio.Event()
+    probe_task = asyncio.create_task(probe(probe_client, stop, latencies))
+    await asyncio.sleep(0.05)
+
+    start = time.perf_counter()
+    deleted = await action()
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    await probe_task
+    latencies.sort()
+    return {
+        "name": name,
+        "deleted": deleted,
+        "elapsed_ms": elapsed * 1000,
+        "probe_p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000 if latencies else 0.0,
+        "probe_max_ms": latencies[-1] * 1000 if latencies else 0.0,
+    }
+
+
+async def main_async(args):
+    os.environ["REDIS_URL"] = args.url
+    os.environ["CACHE_L1_ENABLED"] = "false"
+
+    import redis.asyncio as redis
+    from app.core.redis import init_redis, close_redis, cache, destination_tag
+
+    await init_redis()
+    client = redis.Redis.from_url(args.url)
+    probe_client = redis.Redis.from_url(args.url)
+
+    try:
+        total = args.destinations * args.keys_per_destination
+        print(f"写入测试数据：{args.destinations}个目的地 × {args.keys_per_destination}键 = {total}键")
+        start = time.perf_counter()
+        await build_fixture(client, args.destinations, args.keys_per_destination)
+        print(f"写入耗时：{time.perf_counter() - start:.1f}s，库中键数：{await client.dbsize()}")
+
+        results = [
+            await run_case(
+                "KEYS + DEL",
+                lambda: legacy_clear(client, f"{KEY_PREFIX}0_*"),
+                probe_client
+            ),
+            await run_case(
+                "SCAN + UNLINK",
+                lambda: cache.clear_pattern(f"{KEY_PREFIX}1_*"),
+                probe_client
+            ),
+            await run_case(
+                "标签集合",
+                lambda: cache.invalidate_tags(destination_tag("bench_2")),
+                probe_client
+            ),
+        ]
+
+        print(f"{'方式':<16}{'删除键数':>10}{'耗时ms':>12}{'探测p99 ms':>14}{'探测max ms':>14}")
+        for result in results:
+            print(
+                f"{result['name']:<16}{result['deleted']:>10}{result['elapsed_ms']:>12.1f}"
+                f"{result['probe_p99_ms']:>14.2f}{result['probe_max_ms']:>14.2f}"
+            )
+    finally:
+        if not args.keep:
+            await client.flushdb()
+        await client.close()
+        await probe_client.close()
+        await close_redis()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="缓存批量失效基准测试")
+    parser.add_argument("--url", default="redis://localhost:6379/15", help="测试用Redis库（会被清空）")
+    parser.add_argument("--destinations", type=int, default=100, help="目的地数量")
+    parser.add_argument("--keys-per-destination", type=int, default=10000, help="每个目的地的键数")
+    parser.add_argument("--keep", action="store_true", help="结束后保留测试数据")
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
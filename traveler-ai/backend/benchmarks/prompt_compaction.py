@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+每日提示词压缩基准测试
+
+对比完整概览提示词与摘要提示词的提示词规模、可复用前缀和构建耗时；
+指定 --provider 时额外调用真实模型测量每日生成延迟。
+
+用法：
+    python benchmarks/prompt_compaction.py --days 11
+    python benchmarks/prompt_compaction.py --days 3 --provider deepseek
+"""
+import argparse
+import asyncio
+import os
+import re
+import sys
+import time
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+from app.services.prompt_builder import prompt_builder  # noqa: E402
+
+DEFAULT_OVERVIEW = project_root.parent.parent / "新疆伊犁旅游概览.md"
+CJK_PATTERN = re.compile(r"[一-鿿]")
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算token数：中文约0.6 token/字，其他字符约4字符/token"""
+    cjk = len(CJK_PATTERN.findall(text))
+    return int(cjk * 0.6 + (len(text) - cjk) / 4)
+
+
+def common_prefix_length(prompts):
+    """所有提示词的公共前缀长度（可被前缀缓存复用的部分）"""
+    return len(os.path.commonprefix(prompts)) if len(prompts) > 1 else 0
+
+
+def build_prompts(overview: str, days: int, compact: bool):
+    """构建全部每日提示词"""
+    if compact:
+        summary = prompt_builder.extract_summary(overview, days)
+        return [prompt_builder.build_daily_prompt(summary, day) for day in range(1, days + 1)]
+    return [prompt_builder.build_full_daily_prompt(overview, day) for day in range(1, days + 1)]
+
+
+def measure(overview: str, days: int, compact: bool, rounds: int):
+    """统计提示词规模和构建耗时"""
+    start = time.perf_counter()
+    for _ in range(rounds):
+        prompts = build_prompts(overview, days, compact)
+    build_ms = (time.perf_counter() - start) * 1000 / rounds
+
+    prefix = common_prefix_length(prompts)
+    return {
+        "prompts": prompts,
+        "total_tokens": sum(estimate_tokens(p) for p in prompts),
+        "avg_tokens": sum(estimate_tokens(p) for p in prompts) // len(prompts),
+        "prefix_tokens": estimate_tokens(prompts[0][:prefix]),
+        "build_ms": build_ms,
+    }
+
+
+async def measure_latency(prompts, provider: str, max_tokens: int):
+    """调用真实模型，返回每个提示词的生成耗时(秒)"""
+    from app.core.http_client import close_http_clients
+    from app.services.ai_service import ai_service
+
+    latencies = []
+    try:
+        for prompt in prompts:
+            start = time.perf_counter()
+            await ai_service.generate_completion(
+                prompt=prompt,
+                provider_name=provider,
+                use_cache=False,
+                max_tokens=max_tokens
+            )
+            latencies.append(time.perf_counter() - start)
+    finally:
+        await close_http_clients()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="每日提示词压缩基准测试")
+    parser.add_argument("--overview", default=str(DEFAULT_OVERVIEW), help="概览Markdown文件")
+    parser.add_argument("--days", type=int, default=11, help="行程天数")
+    parser.add_argument("--rounds", type=int, default=50, help="构建耗时测量轮数")
+    parser.add_argument("--provider", help="指定AI服务提供商时测量真实生成延迟")
+    parser.add_argument("--max-tokens", type=int, default=256, help="延迟测试的最大生成token数")
+    args = parser.parse_args()
+
+    overview = Path(args.overview).read_text(encoding="utf-8")
+    results = {
+        "完整概览": measure(overview, args.days, compact=False, rounds=args.rounds),
+        "摘要压缩": measure(overview, args.days, compact=True, rounds=args.rounds),
+    }
+
+    if args.provider:
+        for result in results.values():
+            latencies = asyncio.run(measure_latency(result["prompts"], args.provider, args.max_tokens))
+            result["avg_latency"] = sum(latencies) / len(latencies)
+
+    print(f"概览文件：{args.overview}（{len(overview)}字符），行程天数：{args.days}")
+    print(f"{'模式':<8}{'总tokens':>10}{'平均tokens':>12}{'公共前缀tokens':>16}{'构建ms':>10}{'平均延迟s':>12}")
+    for name, result in results.items():
+        latency = f"{result['avg_latency']:.2f}" if "avg_latency" in result else "-"
+        print(
+            f"{name:<8}{result['total_tokens']:>10}{result['avg_tokens']:>12}"
+            f"{result['prefix_tokens']:>16}{result['build_ms']:>10.2f}{latency:>12}"
+        )
+
+    before, after = results["完整概览"], results["摘要压缩"]
+    print(f"提示词token减少：{1 - after['total_tokens'] / before['total_tokens']:.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+单日路线优化基准测试
+
+随机生成5~30个地点的单日行程（伊犁周边约60km范围，行程时间按直线距离
+×绕行系数/车速估算并加入双向差异，部分地点带营业时间窗），对比原顺序
+（模拟LLM给出的顺序）与优化后的行程时间和晚到时长，统计每天的求解耗时。
+点数不超过精确求解上限时，另外用局部搜索求解，对比与最优解的差距。
+
+用法：
+    python benchmarks/route_optimizer.py
+    python benchmarks/route_optimizer.py --days 50 --sizes 5 10 20 30 --window-ratio 0.5
+"""
+import argparse
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+from app.utils.geo import haversine_m  # noqa: E402
+from app.utils.route_optimizer import (  # noqa: E402
+    EXACT_LIMIT,
+    RouteProblem,
+    local_search,
+    nearest_neighbor,
+    optimize_route,
+)
+
+CENTER = (43.92, 81.32)
+SPREAD = 0.3  # 约±33km
+SPEED_KMH = 40.0
+DAY_START = 9 * 60
+
+
+def synthetic_day(size: int, window_ratio: float, rng: random.Random) -> RouteProblem:
+    """生成一天的地点：下标0为前一晚酒店，1为当晚酒店，其余为景点"""
+    points = [
+        (CENTER[0] + rng.uniform(-SPREAD, SPREAD), CENTER[1] + rng.uniform(-SPREAD, SPREAD))
+        for _ in range(size + 2)
+    ]
+    matrix = []
+    for a in points:
+        row = []
+        for b in points:
+            km = haversine_m(a[0], a[1], b[0], b[1]) / 1000
+            row.append(km * rng.uniform(1.2, 1.6) / SPEED_KMH * 60 if a != b else 0.0)
+        matrix.append(row)
+
+    stay = [0.0, 0.0] + [rng.choice((30.0, 45.0, 60.0, 90.0)) for _ in range(size)]
+    windows = [None, None]
+    for _ in range(size):
+        if rng.random() < window_ratio:
+            open_at = rng.choice((8, 9, 10)) * 60
+            windows.append((float(open_at), float(open_at + rng.choice((4, 6, 8, 10)) * 60)))
+        else:
+            windows.append(None)
+
+    return RouteProblem(
+        matrix,
+        visits=list(range(2, size + 2)),
+        start=0,
+        end=1,
+        stay=stay,
+        windows=windows,
+        start_time=DAY_START
+    )
+
+
+def lateness(problem: RouteProblem, order) -> float:
+    """晚于关门时间到达的总分钟数"""
+    total = 0.0
+    for node, (arrive, _) in zip(order, problem.schedule(order)):
+        window = problem.windows[node]
+        if window and arrive > window[1]:
+            total += arrive - window[1]
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="单日路线优化基准测试")
+    parser.add_argument("--days", type=int, default=30, help="每种规模的天数")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[5, 8, 10, 15, 20, 25, 30], help="每天地点数")
+    parser.add_argument("--window-ratio", type=float, default=0.3, help="带营业时间窗的地点比例")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"精确求解上限：{EXACT_LIMIT}个地点，时间窗比例：{args.window_ratio}")
+    print(
+        f"{'地点数':>6}{'平均ms':>10}{'P95 ms':>10}{'最大ms':>10}"
+        f"{'原行程min':>12}{'优化后min':>12}{'原晚到min':>12}{'优化后晚到':>12}{'启发式差距':>12}"
+    )
+
+    for size in args.sizes:
+        timings, before, after, late_before, late_after, gaps = [], [], [], [], [], []
+        for _ in range(args.days):
+            problem = synthetic_day(size, args.window_ratio, rng)
+            original = list(problem.visits)
+            rng.shuffle(original)
+
+            start = time.perf_counter()
+            order = optimize_route(problem)
+            timings.append((time.perf_counter() - start) * 1000)
+
+            assert sorted(order) == sorted(problem.visits)
+            before.append(problem.travel(original))
+            after.append(problem.travel(order))
+            late_before.append(lateness(problem, original))
+            late_after.append(lateness(problem, order))
+
+            if size <= EXACT_LIMIT:
+                heuristic = local_search(problem, nearest_neighbor(problem))
+                gaps.append(problem.cost(heuristic) / problem.cost(order) - 1)
+
+        timings.sort()
+        gap = f"{statistics.mean(gaps) * 100:.2f}%" if gaps else "-"
+        print(
+            f"{size:>6}{statistics.mean(timings):>10.2f}{timings[int(len(timings) * 0.95) - 1]:>10.2f}"
+            f"{timings[-1]:>10.2f}{statistics.mean(before):>12.1f}{statistics.mean(after):>12.1f}"
+            f"{statistics.mean(late_before):>12.1f}{statistics.mean(late_after):>12.1f}{gap:>12}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+"""
+测试公共夹具 - Redis使用进程内的fakeredis
+"""
+import os
+
+os.environ.setdefault("REDIS_URL", "fakeredis://")
+
+import pytest_asyncio  # noqa: E402
+
+from app.core.redis import cache, close_redis, get_redis, init_redis  # noqa: E402
+from app.core.single_flight import stop_release_notifier  # noqa: E402
+
+
+@pytest_asyncio.fixture
+async def redis_client():
+    """每个用例使用独立的fakeredis实例，并清空一级缓存"""
+    await init_redis()
+    if cache.local is not None:
+        cache.local.clear()
+    client = await get_redis()
+    yield client
+    await stop_release_notifier()
+    await close_redis()
@@ -0,0 +1,67 @@
+"""
+两级缓存测试
+"""
+from app.core.local_cache import NEGATIVE_RESULT
+from app.core.redis import cache
+
+
+async def test_set_and_get(redis_client):
+    await cache.set("map_data:北京", {"lng": 116.4, "lat": 39.9})
+    assert await cache.get("map_data:北京") == {"lng": 116.4, "lat": 39.9}
+    assert await redis_client.exists("map_data:北京")
+
+
+async def test_l2_hit_fills_l1(redis_client):
+    await cache.set("map_data:上海", {"lng": 121.5})
+    cache.local.clear()
+
+    before = cache.stats.snapshot()
+    assert await cache.get("map_data:上海") == {"lng": 121.5}
+    assert await cache.get("map_data:上海") == {"lng": 121.5}
+    after = cache.stats.snapshot()
+    assert after["l2_hits"] == before["l2_hits"] + 1
+    assert after["l1_hits"] == before["l1_hits"] + 1
+
+
+async def test_get_many_mixes_tiers(redis_client):
+    await cache.set("map_data:a", {"v": 1})
+    await cache.set("map_data:b", {"v": 2})
+    cache.local.delete("map_data:b")
+
+    found = await cache.get_many(["map_data:a", "map_data:b", "map_data:missing"])
+    assert found == {"map_data:a": {"v": 1}, "map_data:b": {"v": 2}}
+
+
+async def test_negative_cache(redis_client):
+    await cache.cache_map_miss("不存在的地点")
+    cache.local.clear()
+    assert await cache.get_map_data("不存在的地点") is NEGATIVE_RESULT
+
+
+async def test_delete_and_tags(redis_client):
+    await cache.set("map_data:c", {"v": 3}, tags=["dest:杭州"])
+    await cache.set("map_data:d", {"v": 4}, tags=["dest:杭州"])
+    await cache.delete("map_data:c")
+    assert await cache.get("map_data:c") is None
+
+    await cache.invalidate_tags("dest:杭州")
+    assert await cache.get("map_data:d") is None
+
+
+async def test_l1_and_l2_return_same_types(redis_client):
+    value = {"location": (116.4, 39.9), "tags": ["景点"]}
+    await cache.set("map_data:e", value)
+    await cache.set_many({"map_data:f": value})
+
+    from_l1 = await cache.get("map_data:e")
+    cache.local.clear()
+    from_l2 = await cache.get("map_data:e")
+    assert from_l1 == from_l2 == {"location": [116.4, 39.9], "tags": ["景点"]}
+    assert (await cache.get("map_data:f")) == from_l2
+
+
+async def test_l1_copy_is_isolated_from_caller(redis_client):
+    value = {"count": 1}
+    await cache.set("map_data:g", value)
+    value["count"] = 2
+    assert await cache.get("map_data:g") == {"count": 1}
@@ -0,0 +1,41 @@
+"""
+多日景点分组测试
+"""
+from app.utils.day_clustering import cluster_days, order_clusters
+
+
+def _points_matrix(points):
+    return [[abs(a - b) for b in points] for a in points]
+
+
+def test_separated_groups_split_into_days():
+    # 两簇相距很远的点
+    points = [0, 1, 2, 100, 101, 102]
+    clusters = cluster_days(_points_matrix(points), [60.0] * 6, days=2)
+    assert sorted(sorted(cluster) for cluster in clusters) == [[0, 1, 2], [3, 4, 5]]
+
+
+def test_capacity_limits_group_load():
+    # 一簇4个点、另一簇2个点，两天的容量只够每天4个点中的3个
+    points = [0, 1, 2, 3, 100, 101]
+    clusters = cluster_days(_points_matrix(points), [60.0] * 6, days=2, slack=0.0)
+    assert sorted(len(cluster) for cluster in clusters) == [3, 3]
+
+
+def test_fewer_points_than_days():
+    clusters = cluster_days(_points_matrix([0, 10]), [60.0, 60.0], days=3)
+    assert clusters == [[0], [1], []]
+
+
+def test_order_clusters_follows_preferences():
+    clusters = [[0, 1], [2, 3], [4, 5]]
+    matrix = _points_matrix([0, 1, 50, 51, 100, 101])
+    assert order_clusters(clusters, matrix, [{4}, {0, 1}, {2}]) == [2, 0, 1]
+
+
+def test_order_clusters_chains_nearest_without_preferences():
+    clusters = [[2, 3], [0, 1], [4, 5]]
+    matrix = _points_matrix([0, 1, 50, 51, 100, 101])
+    order = order_clusters(clusters, matrix)
+    assert order[1] == 0
+    assert sorted(order) == [0, 1, 2]
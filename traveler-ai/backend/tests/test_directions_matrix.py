@@ -0,0 +1,60 @@
+"""
+批量算路测试 - 部分组合失败时用直线距离估算补齐
+"""
+from app.services.baidu_map_service import BaiduMapService
+
+A = "39.9087,116.3975"
+B = "39.9163,116.3972"
+C = "39.8822,116.4066"
+
+
+def _element(distance, duration):
+    return {"distance": {"value": distance}, "duration": {"value": duration}}
+
+
+async def test_missing_cells_are_estimated(redis_client, monkeypatch):
+    service = BaiduMapService()
+
+    async def fetch(origins, destinations, mode):
+        # 只有A出发的组合算路成功
+        return {(A, destination): _element(1000, 120) for destination in destinations if A in origins}
+
+    monkeypatch.setattr(service, "_fetch_route_matrix", fetch)
+    result = await service.get_directions_matrix([A, B], [B, C])
+
+    assert result is not None
+    matrix = result["matrix"]
+    assert matrix[0] == _element(1000, 120)
+    assert matrix[1] == _element(1000, 120)
+    for element in matrix[2:]:
+        assert element["estimated"] is True
+        assert element["distance"]["value"] >= 0
+        assert element["duration"]["value"] >= 0
+    assert matrix[3]["distance"]["value"] > matrix[2]["distance"]["value"]
+
+
+async def test_estimates_are_not_cached(redis_client, monkeypatch):
+    service = BaiduMapService()
+    calls = []
+
+    async def fetch(origins, destinations, mode):
+        calls.append((origins, destinations))
+        return {}
+
+    monkeypatch.setattr(service, "_fetch_route_matrix", fetch)
+    first = await service.get_directions_matrix([A], [B])
+    second = await service.get_directions_matrix([A], [B])
+
+    assert first["matrix"][0]["estimated"] is True
+    assert second["matrix"] == first["matrix"]
+    assert len(calls) == 2
+
+
+async def test_unparseable_points_return_none(redis_client, monkeypatch):
+    service = BaiduMapService()
+
+    async def fetch(origins, destinations, mode):
+        return {}
+
+    monkeypatch.setattr(service, "_fetch_route_matrix", fetch)
+    assert await service.get_directions_matrix(["天安门"], [B]) is None
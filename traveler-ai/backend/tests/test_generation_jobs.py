@@ -0,0 +1,82 @@
+"""
+生成任务测试 - 用户名额只在任务结束时释放，流式生成走生成队列
+"""
+import asyncio
+
+from app.services.generation_stream import GenerationStream
+from app.services.itinerary_service import ItineraryService
+
+USER_ID = 7
+
+
+async def _active_slots(service: ItineraryService, redis_client) -> int:
+    value = await redis_client.get(service._user_slot_key(USER_ID))
+    return int(value or 0)
+
+
+def _job(**extra):
+    return {"itinerary_id": 42, "destination": "杭州", "days": 2, "user_id": USER_ID, **extra}
+
+
+async def test_finished_job_releases_slot(redis_client, monkeypatch):
+    service = ItineraryService()
+
+    async def generate(**kwargs):
+        return {"success": True}
+
+    monkeypatch.setattr(service, "generate_itinerary", generate)
+    assert await service._acquire_user_slot(USER_ID)
+
+    assert await service.run_generation_job(_job()) == {"success": True}
+    assert await _active_slots(service, redis_client) == 0
+
+
+async def test_cancelled_job_keeps_slot(redis_client, monkeypatch):
+    service = ItineraryService()
+    started = asyncio.Event()
+
+    async def generate(**kwargs):
+        started.set()
+        await asyncio.sleep(10)
+
+    monkeypatch.setattr(service, "generate_itinerary", generate)
+    assert await service._acquire_user_slot(USER_ID)
+
+    task = asyncio.create_task(service.run_generation_job(_job()))
+    await started.wait()
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+    # 任务放回队列后由下一个worker执行并释放名额
+    assert await _active_slots(service, redis_client) == 1
+
+
+async def test_stream_generation_goes_through_queue(redis_client, monkeypatch):
+    service = ItineraryService()
+
+    async def match_request(destination, days, **params):
+        return {"fresh": False, "source_id": None}
+
+    async def create_record(destination, days, user_id, match=None, **params):
+        return 42
+
+    monkeypatch.setattr(service, "_match_request", match_request)
+    monkeypatch.setattr(service, "_create_itinerary_record", create_record)
+
+    result = await service.start_stream_generation("杭州", 2, USER_ID)
+
+    assert result["success"] and result["itinerary_id"] == 42
+    assert await GenerationStream(42).exists()
+    job, message = await service.generation_queue.dequeue(timeout=1)
+    assert job["stream"] is True and job["itinerary_id"] == 42
+
+    received = {}
+
+    async def generate(**kwargs):
+        received.update(kwargs)
+        return {"success": True}
+
+    monkeypatch.setattr(service, "generate_itinerary", generate)
+    await service.run_generation_job(job)
+    assert isinstance(received["stream"], GenerationStream)
+    assert await _active_slots(service, redis_client) == 0
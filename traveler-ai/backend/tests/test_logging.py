@@ -0,0 +1,46 @@
+"""
+日志队列测试
+"""
+import logging
+import queue
+import sys
+
+from app.utils.logging import DroppingQueueHandler
+
+
+def _record(msg, args=(), exc_info=None) -> logging.LogRecord:
+    return logging.LogRecord("test", logging.INFO, __file__, 1, msg, args, exc_info)
+
+
+def test_rendered_message_is_enqueued_as_is():
+    handler = DroppingQueueHandler(queue.Queue())
+    record = _record('{"event": "请求完成"}')
+    assert handler.prepare(record) is record
+
+
+def test_stdlib_args_are_merged_before_enqueue():
+    handler = DroppingQueueHandler(queue.Queue())
+    items = ["a"]
+    prepared = handler.prepare(_record("items=%s", (items,)))
+    items.append("b")
+
+    assert prepared.msg == "items=['a']"
+    assert not prepared.args
+
+
+def test_exception_is_formatted_before_enqueue():
+    handler = DroppingQueueHandler(queue.Queue())
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        prepared = handler.prepare(_record("failed", exc_info=sys.exc_info()))
+
+    assert prepared.exc_info is None
+    assert "ValueError: boom" in prepared.msg
+
+
+def test_full_queue_drops_records():
+    handler = DroppingQueueHandler(queue.Queue(maxsize=1))
+    handler.emit(_record("first"))
+    handler.emit(_record("second"))
+    assert handler.dropped == 1
@@ -0,0 +1,234 @@
+"""
+AI服务提供商路由测试 - 故障转移、熔断和对冲请求
+"""
+import asyncio
+from typing import Any, Dict, Optional
+
+import pytest
+
+from app.core.config import settings
+from app.services import provider_router
+from app.services.ai_service import AIService, BaseAIProvider
+from app.services.provider_router import (
+    CIRCUIT_CLOSED,
+    CIRCUIT_HALF_OPEN,
+    CIRCUIT_OPEN,
+    ProviderRouter,
+)
+
+
+class StubUpstream:
+    """桩提供商：按设定的延迟返回或失败，像AIService一样登记在途请求和成败"""
+
+    def __init__(self, router: ProviderRouter, name: str, delay: float = 0.0, fail: bool = False):
+        self.router = router
+        self.name = name
+        self.delay = delay
+        self.fail = fail
+        self.calls = 0
+        self.cancelled = 0
+        router.register(name)
+
+    async def __call__(self) -> str:
+        if not self.router.acquire(self.name):
+            raise ValueError(f"{self.name} 熔断中")
+        self.calls += 1
+        success: Optional[bool] = None
+        try:
+            await asyncio.sleep(self.delay)
+            if self.fail:
+                raise RuntimeError(f"{self.name} 上游错误")
+            success = True
+            return self.name
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        except Exception:
+            success = False
+            raise
+        finally:
+            self.router.release(self.name, self.delay, success)
+
+
+class StubProvider(BaseAIProvider):
+    """桩AI服务提供商，不发起网络请求"""
+
+    def __init__(self, name: str, fail: bool = False):
+        self.provider_name = name
+        super().__init__({"base_url": f"http://{name}.invalid", "model": f"{name}-model", "timeout": 5})
+        self.fail = fail
+
+    async def throttle(self):
+        pass
+
+    async def generate_completion(self, prompt: str, **kwargs) -> str:
+        if self.fail:
+            raise RuntimeError(f"{self.provider_name} 上游错误")
+        return f"{self.provider_name}: {prompt}"
+
+    async def generate_stream(self, prompt: str, **kwargs):
+        yield await self.generate_completion(prompt, **kwargs)
+
+
+def _upstreams(router: ProviderRouter, **specs: Dict[str, Any]) -> Dict[str, StubUpstream]:
+    return {name: StubUpstream(router, name, **spec) for name, spec in specs.items()}
+
+
+@pytest.fixture
+def routing(monkeypatch):
+    monkeypatch.setattr(settings, "AI_ROUTING_ENABLED", True)
+    monkeypatch.setattr(settings, "AI_CIRCUIT_ERROR_RATE", 0.5)
+    monkeypatch.setattr(settings, "AI_CIRCUIT_MIN_REQUESTS", 4)
+    monkeypatch.setattr(settings, "AI_CIRCUIT_OPEN_SECONDS", 30.0)
+    return settings
+
+
+async def test_failover_to_next_candidate(routing):
+    router = ProviderRouter()
+    upstreams = _upstreams(router, primary={"fail": True}, backup={})
+
+    result = await router.run(["primary", "backup"], lambda name: upstreams[name]())
+
+    assert result == "backup"
+    assert upstreams["primary"].calls == 1
+    assert upstreams["backup"].calls == 1
+    stats = router.get_stats()
+    assert stats["primary"]["error_rate"] == 1.0
+    assert stats["backup"]["error_rate"] == 0.0
+    assert all(item["outstanding"] == 0 for item in stats.values())
+
+
+async def test_all_candidates_fail_raises_last_error(routing):
+    router = ProviderRouter()
+    upstreams = _upstreams(router, primary={"fail": True}, backup={"fail": True})
+
+    with pytest.raises(RuntimeError, match="backup"):
+        await router.run(["primary", "backup"], lambda name: upstreams[name]())
+
+
+async def test_circuit_opens_probes_and_recovers(routing, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(provider_router.time, "monotonic", lambda: now[0])
+    router = ProviderRouter()
+    upstreams = _upstreams(router, primary={"fail": True}, backup={})
+
+    # 错误率达到AI_CIRCUIT_ERROR_RATE且调用次数足够后熔断
+    for _ in range(routing.AI_CIRCUIT_MIN_REQUESTS):
+        assert router.get_stats()["primary"]["state"] == CIRCUIT_CLOSED
+        await router.run(["primary", "backup"], lambda name: upstreams[name]())
+    assert router.get_stats()["primary"]["state"] == CIRCUIT_OPEN
+    assert router.candidates("primary") == ["backup"]
+    assert not router.acquire("primary")
+
+    # 冷却结束后半开，首选提供商排在最前且只放行一个探测请求
+    now[0] += routing.AI_CIRCUIT_OPEN_SECONDS
+    assert router.candidates("primary")[0] == "primary"
+    assert router.get_stats()["primary"]["state"] == CIRCUIT_HALF_OPEN
+    assert router.acquire("primary")
+    assert not router.acquire("primary")
+    assert router.candidates("primary") == ["backup"]
+
+    # 探测失败重新熔断
+    router.release("primary", 0.1, False)
+    assert router.get_stats()["primary"]["state"] == CIRCUIT_OPEN
+
+    # 再次冷却后探测成功，熔断恢复并清空旧的失败记录
+    now[0] += routing.AI_CIRCUIT_OPEN_SECONDS
+    upstreams["primary"].fail = False
+    result = await router.run(router.candidates("primary"), lambda name: upstreams[name]())
+    assert result == "primary"
+    stats = router.get_stats()["primary"]
+    assert stats["state"] == CIRCUIT_CLOSED
+    assert stats["error_rate"] == 0.0
+    assert stats["outstanding"] == 0
+
+
+async def test_circuit_stays_closed_below_error_rate(routing):
+    router = ProviderRouter()
+    router.register("primary")
+    for success in (True, True, False, True, False, True):
+        assert router.acquire("primary")
+        router.release("primary", 0.1, success)
+    assert router.get_stats()["primary"]["state"] == CIRCUIT_CLOSED
+
+
+async def test_hedged_request_wins_and_loser_is_cancelled(routing):
+    router = ProviderRouter()
+    upstreams = _upstreams(router, slow={"delay": 5.0}, fast={"delay": 0.01})
+
+    result = await router.run(["slow", "fast"], lambda name: upstreams[name](), hedge_delay=0.05)
+    # 让被取消的任务执行完finally
+    await asyncio.sleep(0)
+
+    assert result == "fast"
+    assert upstreams["slow"].calls == 1
+    assert upstreams["slow"].cancelled == 1
+    stats = router.get_stats()
+    assert stats["slow"]["outstanding"] == 0
+    assert stats["fast"]["outstanding"] == 0
+    # 被取消的请求不计入错误率
+    assert stats["slow"]["error_rate"] == 0.0
+
+
+async def test_no_hedge_when_first_returns_in_time(routing):
+    router = ProviderRouter()
+    upstreams = _upstreams(router, primary={"delay": 0.01}, backup={})
+
+    result = await router.run(["primary", "backup"], lambda name: upstreams[name](), hedge_delay=1.0)
+
+    assert result == "primary"
+    assert upstreams["backup"].calls == 0
+
+
+def _service(*providers: StubProvider) -> AIService:
+    service = AIService()
+    service.providers = {provider.provider_name: provider for provider in providers}
+    service.router = ProviderRouter()
+    for name in service.providers:
+        service.router.register(name)
+    return service
+
+
+async def test_unconfigured_preferred_provider_falls_back(routing, monkeypatch):
+    monkeypatch.setattr(settings, "DEFAULT_AI_PROVIDER", "missing")
+    service = _service(StubProvider("deepseek"), StubProvider("bailian"))
+
+    assert set(service.get_candidates()) == {"deepseek", "bailian"}
+    assert set(service.get_candidates("missing")) == {"deepseek", "bailian"}
+
+    monkeypatch.setattr(settings, "AI_ROUTING_ENABLED", False)
+    assert set(service.get_candidates()) == {"deepseek", "bailian"}
+
+
+async def test_generate_completion_without_preferred_provider(redis_client, routing, monkeypatch):
+    monkeypatch.setattr(settings, "DEFAULT_AI_PROVIDER", "missing")
+    service = _service(StubProvider("deepseek", fail=True), StubProvider("bailian"))
+
+    response = await service.generate_completion("你好", use_cache=False)
+
+    assert response == "bailian: 你好"
+
+
+async def test_no_configured_provider_raises(routing):
+    service = _service()
+    with pytest.raises(ValueError):
+        service.get_candidates("missing")
+
+
+async def test_all_circuits_open_fail_fast(routing):
+    service = _service(StubProvider("deepseek"), StubProvider("bailian"))
+    for name in service.providers:
+        for _ in range(routing.AI_CIRCUIT_MIN_REQUESTS):
+            assert service.router.acquire(name)
+            service.router.release(name, 0.1, False)
+
+    assert service.router.candidates("deepseek") == []
+    with pytest.raises(ValueError, match="熔断"):
+        service.get_candidates("deepseek")
+
+
+async def test_flight_lock_covers_all_candidates(routing):
+    service = _service(StubProvider("deepseek"), StubProvider("bailian"))
+    per_candidate = 5 + settings.AI_RATE_QUEUE_TIMEOUT
+    assert service._flight_lock_ttl(["deepseek"]) == int(per_candidate)
+    assert service._flight_lock_ttl(["deepseek", "bailian"]) == int(2 * per_candidate)
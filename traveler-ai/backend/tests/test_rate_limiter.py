@@ -0,0 +1,49 @@
+"""
+令牌桶限流测试
+"""
+import pytest
+
+from app.core.rate_limiter import RateLimiter, RateLimitExceeded
+
+
+async def test_allows_until_limit(redis_client):
+    limiter = RateLimiter()
+    limiter.register("test", [(3, 60)])
+
+    results = [await limiter.try_acquire("test", "client") for _ in range(4)]
+    assert [allowed for allowed, _ in results] == [True, True, True, False]
+    assert results[-1][1] > 0
+
+
+async def test_keys_are_independent(redis_client):
+    limiter = RateLimiter()
+    limiter.register("test", [(1, 60)])
+
+    assert (await limiter.try_acquire("test", "a"))[0]
+    assert (await limiter.try_acquire("test", "b"))[0]
+    assert not (await limiter.try_acquire("test", "a"))[0]
+
+
+async def test_all_bands_must_pass(redis_client):
+    limiter = RateLimiter()
+    limiter.register("test", [(10, 60), (2, 3600)])
+
+    assert (await limiter.try_acquire("test", "client"))[0]
+    assert (await limiter.try_acquire("test", "client"))[0]
+    assert not (await limiter.try_acquire("test", "client"))[0]
+    levels = await limiter.get_levels("test", "client")
+    assert levels["10/60s"]["remaining"] == 8
+
+
+async def test_acquire_raises_when_wait_exceeds_timeout(redis_client):
+    limiter = RateLimiter()
+    limiter.register("test", [(1, 3600)])
+
+    await limiter.acquire("test", "client", timeout=0.1)
+    with pytest.raises(RateLimitExceeded):
+        await limiter.acquire("test", "client", timeout=0.1)
+
+
+async def test_unregistered_policy_is_unlimited(redis_client):
+    limiter = RateLimiter()
+    assert await limiter.try_acquire("unknown", "client") == (True, 0.0)
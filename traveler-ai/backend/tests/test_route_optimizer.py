@@ -0,0 +1,71 @@
+"""
+单日路线优化测试
+"""
+from itertools import permutations
+
+from app.utils.route_optimizer import (
+    RouteProblem,
+    local_search,
+    optimize_route,
+    parse_time_window,
+    solve_exact,
+)
+
+
+def _line(count: int, spacing: float = 10.0):
+    """直线上等距的点"""
+    return [[abs(i - j) * spacing for j in range(count)] for i in range(count)]
+
+
+def _brute_force(problem: RouteProblem) -> float:
+    return min(problem.cost(order) for order in permutations(problem.visits))
+
+
+def test_cost_without_start_does_not_charge_first_leg():
+    problem = RouteProblem(_line(4), visits=[0, 1, 2, 3])
+    assert problem.cost([3, 2, 1, 0]) == 30.0
+    assert problem.cost([1, 0, 2, 3]) == 40.0
+
+
+def test_local_search_can_change_first_stop_without_start():
+    problem = RouteProblem(_line(12), visits=list(range(12)))
+    order = [5, 4, 3, 2, 1, 0, 6, 7, 8, 9, 10, 11]
+    assert problem.cost(order) == 160.0
+
+    improved = local_search(problem, order, time_limit=1.0)
+    assert problem.cost(improved) == 110.0
+
+
+def test_local_search_with_fixed_start():
+    problem = RouteProblem(_line(12), visits=list(range(1, 12)), start=0)
+    order = [6, 5, 4, 3, 2, 1, 7, 8, 9, 10, 11]
+    improved = local_search(problem, order, time_limit=1.0)
+    assert improved == list(range(1, 12))
+
+
+def test_exact_matches_brute_force_with_start_and_end():
+    matrix = [
+        [0, 7, 3, 9, 4, 6],
+        [7, 0, 5, 2, 8, 3],
+        [3, 5, 0, 6, 2, 7],
+        [9, 2, 6, 0, 5, 4],
+        [4, 8, 2, 5, 0, 9],
+        [6, 3, 7, 4, 9, 0],
+    ]
+    problem = RouteProblem(matrix, visits=[1, 2, 3, 4], start=0, end=5)
+    assert problem.cost(solve_exact(problem)) == _brute_force(problem)
+
+
+def test_time_windows_prefer_early_closing_stop():
+    matrix = _line(3, spacing=30.0)
+    windows = [None, None, (0.0, 40.0)]
+    problem = RouteProblem(matrix, visits=[0, 1, 2], windows=windows, stay=[60.0] * 3)
+    order = optimize_route(problem)
+    assert order[0] == 2
+    assert problem.cost(order) == _brute_force(problem)
+
+
+def test_parse_time_window():
+    assert parse_time_window("08:30-17:00") == (510.0, 1020.0)
+    assert parse_time_window("18:00至次日02:00") == (1080.0, 1560.0)
+    assert parse_time_window("全天开放") is None
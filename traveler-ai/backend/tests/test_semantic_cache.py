@@ -0,0 +1,73 @@
+"""
+语义缓存测试 - 近似匹配分区、向量索引的容量、过期和跨进程刷新
+"""
+import pytest
+
+from app.core.config import settings
+from app.core.redis import cache
+from app.services.semantic_cache import (
+    VECTORS_KEY,
+    VECTORS_TIME_KEY,
+    SemanticCache,
+    normalize_request,
+)
+
+
+@pytest.fixture
+def embedding(monkeypatch):
+    monkeypatch.setattr(settings, "SEMANTIC_CACHE_EMBEDDING_ENABLED", True)
+    monkeypatch.setattr(settings, "SEMANTIC_CACHE_INDEX_REFRESH", 0.0)
+
+    async def embed(self, text):
+        # 所有描述视为同义，只验证分区和索引维护
+        return [1.0, 0.0, 0.0]
+
+    monkeypatch.setattr(SemanticCache, "_embed", embed)
+
+
+async def _store(semantic: SemanticCache, destination: str, **params) -> str:
+    normalized = normalize_request(destination, 3, **params)
+    key = semantic.build_key(normalized, "ollama")
+    await semantic.store(key, normalized, f"{destination}攻略", provider="ollama")
+    return key
+
+
+async def test_near_match_requires_same_requirements(redis_client, embedding):
+    semantic = SemanticCache()
+    await _store(semantic, "杭州", travel_style="深度", special_requirements="轮椅无障碍")
+
+    same = normalize_request("杭州", 3, travel_style="文化", special_requirements="轮椅无障碍")
+    other = normalize_request("杭州", 3, travel_style="文化", special_requirements="素食")
+    assert await semantic.lookup(semantic.build_key(same, "ollama"), same, "ollama") == "杭州攻略"
+    assert await semantic.lookup(semantic.build_key(other, "ollama"), other, "ollama") is None
+
+
+async def test_vectors_from_other_processes_are_loaded(redis_client, embedding):
+    reader = SemanticCache()
+    params = normalize_request("杭州", 3, travel_style="文化")
+    assert await reader.lookup(reader.build_key(params, "ollama"), params, "ollama") is None
+
+    await _store(SemanticCache(), "杭州", travel_style="深度")
+    assert await reader.lookup(reader.build_key(params, "ollama"), params, "ollama") == "杭州攻略"
+
+
+async def test_vector_index_is_bounded(redis_client, embedding, monkeypatch):
+    monkeypatch.setattr(settings, "SEMANTIC_CACHE_MAX_VECTORS", 2)
+    semantic = SemanticCache()
+    keys = [await _store(semantic, name) for name in ("杭州", "苏州", "扬州")]
+
+    assert await redis_client.hlen(VECTORS_KEY) == 2
+    assert not await redis_client.hexists(VECTORS_KEY, keys[0])
+    assert await redis_client.zcard(VECTORS_TIME_KEY) == 2
+    assert 0 < await redis_client.ttl(VECTORS_KEY) <= 3600 * 24
+
+
+async def test_vectors_without_response_are_dropped(redis_client, embedding):
+    key = await _store(SemanticCache(), "杭州", travel_style="深度")
+    await cache.delete(cache.get_ai_response_cache_key(key))
+
+    semantic = SemanticCache()
+    params = normalize_request("杭州", 3, travel_style="文化")
+    assert await semantic.lookup(semantic.build_key(params, "ollama"), params, "ollama") is None
+    assert len(semantic.index) == 0
+    assert not await redis_client.hexists(VECTORS_KEY, key)
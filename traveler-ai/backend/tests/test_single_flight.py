@@ -0,0 +1,100 @@
+"""
+请求合并测试
+"""
+import asyncio
+
+import pytest
+
+from app.core.single_flight import SingleFlight
+
+
+class Upstream:
+    """模拟上游：记录调用次数，结果写入共享存储"""
+
+    def __init__(self, fail_first: bool = False, delay: float = 0.05):
+        self.calls = 0
+        self.delay = delay
+        self.fail_first = fail_first
+        self.store = {}
+
+    async def fetch(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.fail_first and self.calls == 1:
+            raise RuntimeError("upstream failed")
+        self.store["value"] = "result"
+        return "result"
+
+    async def read(self):
+        return self.store.get("value")
+
+
+async def test_waiters_share_one_call_without_holding_connections(redis_client):
+    upstream = Upstream(delay=0.5)
+    # 每个实例相当于一个进程；同时等待的数量超过连接池上限（20）
+    tasks = []
+    for _ in range(30):
+        tasks.append(asyncio.create_task(SingleFlight("test").do("key", upstream.fetch, reader=upstream.read)))
+        await asyncio.sleep(0.005)
+
+    # 等待期间其他Redis调用不受影响
+    assert await redis_client.ping()
+    results = await asyncio.wait_for(asyncio.gather(*tasks), timeout=5)
+
+    assert results == ["result"] * 30
+    assert upstream.calls == 1
+
+
+async def test_only_one_waiter_retries_after_holder_failure(redis_client):
+    upstream = Upstream(fail_first=True)
+    flights = [SingleFlight("test") for _ in range(5)]
+
+    results = await asyncio.wait_for(
+        asyncio.gather(
+            *(flight.do("key", upstream.fetch, reader=upstream.read) for flight in flights),
+            return_exceptions=True
+        ),
+        timeout=5
+    )
+
+    assert sum(isinstance(result, RuntimeError) for result in results) == 1
+    assert results.count("result") == 4
+    assert upstream.calls == 2
+
+
+async def test_in_process_callers_share_future(redis_client):
+    upstream = Upstream()
+    flight = SingleFlight("test")
+
+    results = await asyncio.gather(*(flight.do("key", upstream.fetch) for _ in range(10)))
+    assert results == ["result"] * 10
+    assert upstream.calls == 1
+
+
+async def test_exception_propagates_to_in_process_waiters(redis_client):
+    upstream = Upstream(fail_first=True)
+    flight = SingleFlight("test")
+
+    results = await asyncio.gather(*(flight.do("key", upstream.fetch) for _ in range(3)), return_exceptions=True)
+    assert all(isinstance(result, RuntimeError) for result in results)
+    with pytest.raises(KeyError):
+        upstream.store["value"]
+
+
+@pytest.mark.parametrize("distributed", [False, True])
+async def test_leader_cancellation_does_not_cancel_waiters(redis_client, distributed):
+    upstream = Upstream(delay=0.2)
+    flight = SingleFlight("test")
+    reader = upstream.read if distributed else None
+
+    leader = asyncio.create_task(flight.do("key", upstream.fetch, reader=reader))
+    await asyncio.sleep(0.05)
+    waiters = [asyncio.create_task(flight.do("key", upstream.fetch, reader=reader)) for _ in range(3)]
+    await asyncio.sleep(0.05)
+    leader.cancel()
+
+    with pytest.raises(asyncio.CancelledError):
+        await leader
+    # 一个等待者接替执行，其余等待者共享它的结果
+    assert await asyncio.gather(*waiters) == ["result"] * 3
+    assert upstream.calls == 2
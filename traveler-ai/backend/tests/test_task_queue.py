@@ -0,0 +1,89 @@
+"""
+任务队列测试
+"""
+from app.core.config import settings
+from app.core.task_queue import TaskQueue
+
+
+async def test_fifo_order(redis_client):
+    queue = TaskQueue("test")
+    await queue.enqueue({"itinerary_id": 1})
+    await queue.enqueue({"itinerary_id": 2})
+
+    assert await queue.size() == 2
+    first, _ = await queue.dequeue()
+    second, _ = await queue.dequeue()
+    assert [first["itinerary_id"], second["itinerary_id"]] == [1, 2]
+    assert await queue.size() == 0
+
+
+async def test_dequeue_timeout_returns_none(redis_client):
+    queue = TaskQueue("test")
+    assert await queue.dequeue(timeout=1) is None
+
+
+async def test_malformed_message_is_skipped(redis_client):
+    queue = TaskQueue("test")
+    await redis_client.lpush(queue.queue_key, b"not json")
+    assert await queue.dequeue() is None
+    assert await redis_client.llen(queue.processing_key) == 0
+
+
+async def test_ack_removes_from_processing(redis_client):
+    queue = TaskQueue("test")
+    await queue.enqueue({"itinerary_id": 1})
+    _, message = await queue.dequeue()
+    assert await redis_client.llen(queue.processing_key) == 1
+
+    await queue.ack(message)
+    assert await redis_client.llen(queue.processing_key) == 0
+
+
+async def test_stale_consumer_jobs_are_requeued(redis_client):
+    crashed = TaskQueue("test", consumer_id="crashed")
+    survivor = TaskQueue("test", consumer_id="survivor")
+    await crashed.heartbeat()
+    await crashed.enqueue({"itinerary_id": 1})
+    await crashed.dequeue()
+
+    # 心跳未过期时不恢复
+    assert await survivor.recover_stale() == []
+    assert await survivor.size() == 0
+
+    await redis_client.delete("queue:test:heartbeat:crashed")
+    assert await survivor.recover_stale() == []
+    job, _ = await survivor.dequeue()
+    assert job == {"itinerary_id": 1}
+    assert await redis_client.llen(crashed.processing_key) == 0
+    assert not await redis_client.sismember(survivor.consumers_key, "crashed")
+
+
+async def test_job_abandoned_after_max_attempts(redis_client):
+    survivor = TaskQueue("test", consumer_id="survivor")
+    await survivor.enqueue({"itinerary_id": 7})
+
+    abandoned = []
+    for attempt in range(settings.QUEUE_MAX_ATTEMPTS):
+        crashed = TaskQueue("test", consumer_id=f"crashed-{attempt}")
+        await crashed.heartbeat()
+        assert await crashed.dequeue() is not None
+        await redis_client.delete(f"queue:test:heartbeat:crashed-{attempt}")
+        abandoned = await survivor.recover_stale()
+
+    assert abandoned == [{"itinerary_id": 7}]
+    assert await survivor.size() == 0
+    assert await redis_client.llen(survivor.processing_key) == 0
+
+
+async def test_release_requeues_in_order(redis_client):
+    queue = TaskQueue("test")
+    for itinerary_id in (1, 2):
+        await queue.enqueue({"itinerary_id": itinerary_id})
+    await queue.dequeue()
+    await queue.dequeue()
+
+    await queue.release()
+    other = TaskQueue("test")
+    first, _ = await other.dequeue()
+    second, _ = await other.dequeue()
+    assert [first["itinerary_id"], second["itinerary_id"]] == [1, 2]